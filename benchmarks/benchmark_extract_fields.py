@@ -0,0 +1,57 @@
+"""Measures lines per second of extract_fields on a synthetic tagged
+corpus opened in text and in binary mode, and of extract_field_blocks
+in binary mode.
+
+Usage: python benchmarks/benchmark_extract_fields.py [number_of_lines]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+from corpustools import extract_field_blocks, extract_fields
+
+
+def synthetic_corpus(path, number, sentence_length=20, seed=2311):
+    """Writes lines of token, tag and lemma with sentence boundaries
+    and non-ASCII tokens mixed in.
+    """
+    rng = random.Random(seed)
+    tokens = ["The", "house", "was", "big", "Über", "Ärger", "dog", "ran"]
+    tags = ["NN", "VB", "DT", "Zz"]
+    with open(path, "w", encoding="utf-8") as corpus:
+        for idx in range(number):
+            if not idx % sentence_length:
+                corpus.write("</s>\n<s>\n")
+            token = rng.choice(tokens)
+            corpus.write(f"{token}\t{rng.choice(tags)}\t{token.lower()}\n")
+
+
+def benchmark(path, mode, extract=extract_fields):
+    start = time.perf_counter()
+    with open(path, mode) as corpus:
+        for _ in extract(corpus, num_fields=3):
+            pass
+    return time.perf_counter() - start
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "corpus.txt")
+        synthetic_corpus(path, number)
+        with open(path, "rb") as corpus:
+            lines = sum(1 for _ in corpus)
+        sys.stdout.write(f"{lines} lines\n")
+
+        for mode in ("r", "rb"):
+            elapsed = benchmark(path, mode)
+            sys.stdout.write(f"{mode}: lines/sec: {lines / elapsed:,.0f}\n")
+
+        elapsed = benchmark(path, "rb", extract_field_blocks)
+        sys.stdout.write(f"rb blocks: lines/sec: {lines / elapsed:,.0f}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Measures training and query throughput of LanguageModel for each
+backend on a synthetic corpus.
+
+Usage: python benchmarks/benchmark_language_model.py [number_of_tokens] [n]
+"""
+import random
+import sys
+import time
+
+from corpustools.language_model import BACKENDS, LanguageModel
+
+
+def synthetic_corpus(number, vocabulary_size=50_000, sentence_length=20,
+                     seed=2311):
+    """Returns tokens over a Zipf-distributed random vocabulary,
+    with a boundary after every sentence_length tokens.
+    """
+    rng = random.Random(seed)
+    vocabulary = ["".join(rng.choices("abcdefghijklmnopqrstuvwxyz",
+                                      k=rng.randint(2, 12)))
+                  for _ in range(vocabulary_size)]
+    weights = [1 / rank for rank in range(1, vocabulary_size + 1)]
+    tokens = rng.choices(vocabulary, weights=weights, k=number)
+    for idx in range(sentence_length, number, sentence_length + 1):
+        tokens.insert(idx, "</s>")
+    return tokens
+
+
+def benchmark(tokens, n, backend):
+    lm = LanguageModel(n, backend=backend)
+
+    start = time.perf_counter()
+    lm.train(tokens)
+    train_time = time.perf_counter() - start
+
+    sentences = [sentence.split() for sentence
+                 in " ".join(tokens).split("</s>")]
+    start = time.perf_counter()
+    lm.probabilities_batch(sentences)
+    query_time = time.perf_counter() - start
+
+    return len(tokens) / train_time, len(tokens) / query_time
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    tokens = synthetic_corpus(number)
+    sys.stdout.write(f"{number} tokens, n={n}\n")
+
+    for backend in BACKENDS:
+        trained, queried = benchmark(tokens, n, backend)
+        sys.stdout.write(f"{backend}\n"
+                         f"  trained tokens/sec: {trained:,.0f}\n"
+                         f"  queried tokens/sec: {queried:,.0f}\n")
+
+
+if __name__ == "__main__":
+    main()
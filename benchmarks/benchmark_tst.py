@@ -0,0 +1,65 @@
+"""Measures insertion and lookup throughput of the ternary search trees
+and the hash counter on synthetic n-gram workloads.
+
+Usage: python benchmarks/benchmark_tst.py [number_of_ngrams] [n]
+"""
+import random
+import sys
+import time
+
+from corpustools.hashcounter import HashCounter
+from corpustools.tst import CompactTernarySearchTree, TernarySearchTree
+
+
+def synthetic_ngrams(number, n=3, vocabulary_size=50_000, seed=2311):
+    """Returns n-grams over a Zipf-distributed random vocabulary.
+    """
+    rng = random.Random(seed)
+    vocabulary = ["".join(rng.choices("abcdefghijklmnopqrstuvwxyz",
+                                      k=rng.randint(2, 12)))
+                  for _ in range(vocabulary_size)]
+    weights = [1 / rank for rank in range(1, vocabulary_size + 1)]
+    tokens = rng.choices(vocabulary, weights=weights, k=number + n - 1)
+    return ["#".join(tokens[idx:idx + n]) for idx in range(number)]
+
+
+def benchmark(ngrams, tree_class=TernarySearchTree):
+    tree = tree_class("#")
+
+    start = time.perf_counter()
+    for ngram in ngrams:
+        tree.insert(ngram)
+    insert_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for ngram in ngrams:
+        tree.frequency(ngram)
+    query_time = time.perf_counter() - start
+
+    counts = sorted(tree.completions())
+    tree = tree_class("#")
+    start = time.perf_counter()
+    tree.insert_many(counts, subsequences=False)
+    bulk_time = time.perf_counter() - start
+
+    return (len(ngrams) / insert_time, len(ngrams) / query_time,
+            len(counts) / bulk_time)
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    ngrams = synthetic_ngrams(number, n)
+    sys.stdout.write(f"{number} {n}-grams\n")
+
+    for tree_class in (TernarySearchTree, CompactTernarySearchTree,
+                       HashCounter):
+        inserts, queries, bulk = benchmark(ngrams, tree_class)
+        sys.stdout.write(f"{tree_class.__name__}\n"
+                         f"  inserts/sec: {inserts:,.0f}\n"
+                         f"  lookups/sec: {queries:,.0f}\n"
+                         f"  sorted insert_many/sec: {bulk:,.0f}\n")
+
+
+if __name__ == "__main__":
+    main()
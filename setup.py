@@ -27,6 +27,10 @@ class CleanCommand(Command):
 
 tst = Extension("corpustools.tst",
                 sources=["src/corpustools/tst.pyx"])
+hashcounter = Extension("corpustools.hashcounter",
+                        sources=["src/corpustools/hashcounter.pyx"])
+fields = Extension("corpustools.fields",
+                   sources=["src/corpustools/fields.pyx"])
 
 setup(
     name='corpustools',
@@ -39,7 +43,7 @@ setup(
     url='https://github.com/kuchenrolle/corpustools',
     packages=find_packages('src'),
     package_dir={'': 'src'},
-    ext_modules=[tst],
+    ext_modules=[tst, hashcounter, fields],
     py_modules=[splitext(basename(path))[0] for path in glob('src/*.py')],
     include_package_data=True,
     zip_safe=False,
@@ -74,7 +78,7 @@ setup(
         'corpus', 'text mining', 'ternary search tree', 'ngrams'
     ],
     install_requires=[
-        'pandas', 'psutil', 'pyndl', "cython"
+        'numpy', 'pandas', 'psutil', 'pyndl', "cython"
     ],
     extras_require={
         # eg:
@@ -0,0 +1,162 @@
+import bz2
+import gzip
+import io
+import lzma
+import os
+import queue
+import threading
+
+
+def open_corpus(path, mode="rb", background=True,
+                blocksize=1 << 20, queue_size=16, encoding=None):
+    """Opens a corpus file for reading, decompressing it transparently
+    based on its extension (.gz, .bz2, .xz, .lzma, .zst).
+
+    Parameters
+    ----------
+    path : str or path
+        Path to corpus file
+    mode : str
+        "rb" for a binary file (see extract_fields), "r" or "rt"
+        for a text file
+    background : bool
+        Decompress in a separate thread, so that decompression
+        overlaps with processing the decompressed corpus.
+    blocksize : int
+        Number of decompressed bytes per block handed over by
+        the background thread
+    queue_size : int
+        Maximum number of decompressed blocks held in memory
+    encoding : str
+        Encoding of text files, see open()
+
+    Returns
+    -------
+    file object
+
+    Notes
+    -----
+    zstd requires Python 3.14 or the zstandard package.
+    """
+    if mode not in {"r", "rt", "rb"}:
+        msg = f"Invalid mode '{mode}', corpora can only be opened " \
+              f"for reading."
+        raise ValueError(msg)
+
+    extension = os.path.splitext(os.fspath(path))[1].lower()
+    if extension in DECOMPRESSORS:
+        corpus = DECOMPRESSORS[extension](path)
+        if background:
+            corpus = BackgroundReader(corpus, blocksize, queue_size)
+    else:
+        corpus = open(path, "rb")
+
+    if mode == "rb":
+        return corpus
+
+    if isinstance(corpus, io.RawIOBase):
+        corpus = io.BufferedReader(corpus, blocksize)
+    return io.TextIOWrapper(corpus, encoding=encoding)
+
+
+class BackgroundReader(io.RawIOBase):
+    """Binary file that reads blocks from another file in a separate
+    thread and hands them over through a bounded queue.
+
+    Decompressors of the standard library release the GIL while
+    decompressing, so reading from a compressed file in the background
+    runs in parallel with the consumer of the decompressed data.
+    Errors in the background thread are raised by readinto.
+
+    Parameters
+    ----------
+    file : binary file
+        File to read from, closed with this file.
+    blocksize : int
+        Number of bytes read at once
+    queue_size : int
+        Maximum number of blocks read ahead
+    """
+
+    def __init__(self, file, blocksize=1 << 20, queue_size=16):
+        self._file = file
+        self._blocksize = blocksize
+        self._queue = queue.Queue(queue_size)
+        self._closing = threading.Event()
+        self._block = memoryview(b"")
+        self._eof = False
+        self._thread = threading.Thread(target=self._read, daemon=True)
+        self._thread.start()
+
+    def _read(self):
+        try:
+            while not self._closing.is_set():
+                block = self._file.read(self._blocksize)
+                self._put(block)
+                if not block:
+                    return
+        except BaseException as error:
+            self._put(error)
+
+    def _put(self, item):
+        # give up once closed, as the queue may never be drained
+        while not self._closing.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._block:
+            if self._eof:
+                return 0
+
+            item = self._queue.get()
+            if isinstance(item, BaseException):
+                self._eof = True
+                raise item
+            if not item:
+                self._eof = True
+                return 0
+            self._block = memoryview(item)
+
+        size = min(len(buffer), len(self._block))
+        memoryview(buffer).cast("B")[:size] = self._block[:size]
+        self._block = self._block[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self._closing.set()
+            self._thread.join()
+            self._file.close()
+        super().close()
+
+
+def _open_zstd(path):
+    try:
+        from compression import zstd
+        return zstd.open(path, "rb")
+    except ImportError:
+        pass
+
+    try:
+        import zstandard
+    except ImportError:
+        msg = "Reading .zst files requires Python 3.14 or the " \
+              "zstandard package."
+        raise ImportError(msg) from None
+
+    decompressor = zstandard.ZstdDecompressor()
+    return decompressor.stream_reader(open(path, "rb"), closefd=True)
+
+
+DECOMPRESSORS = {".gz": gzip.open,
+                 ".bz2": bz2.open,
+                 ".xz": lzma.open,
+                 ".lzma": lzma.open,
+                 ".zst": _open_zstd}
@@ -2,16 +2,27 @@ import os
 import re
 import sys
 import random
+import shutil
+import tempfile
 import warnings
 
 from collections import Counter
 from cmath import isclose
+from io import BufferedIOBase, RawIOBase, TextIOWrapper
+from itertools import islice
+from multiprocessing import Pool
 from os.path import exists
 
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 import psutil
 from pyndl.count import cues_outcomes
 from pyndl.preprocess import filter_event_file
 
+from .compressed import DECOMPRESSORS, open_corpus
+from .fields import contains_only, extract_fields_bytes, replace_sequence
+from .fields import extract_field_blocks_bytes, split_blocks
+
 POLISH_LOWER = "aąbcćdeęfghijklłmnńoóprsśtuwyzźżqvx"
 POLISH_UPPER = POLISH_LOWER.upper()
 POLISH = POLISH_UPPER + POLISH_LOWER
@@ -20,6 +31,9 @@ ENGLISH_LOWER = "abcdefghijklmnopqrstuvwxyz"
 ENGLISH_UPPER = ENGLISH_LOWER.upper()
 ENGLISH = ENGLISH_LOWER + ENGLISH_UPPER
 
+# counts gathered by merge_tokens_tags_corpus
+VOCABULARY_KINDS = ("tokens", "tags", "tagged")
+
 
 def extract_fields(corpus,
                    delimiter="\t",
@@ -35,8 +49,12 @@ def extract_fields(corpus,
 
     Parameters
     ----------
-    corpus : iterable of str
-        Corpus text stream, typically an opened file to read from
+    corpus : iterable of str, binary file or path
+        Corpus text stream, typically an opened file to read from.
+        Files opened in binary mode are read as UTF-8 in large blocks
+        (see fields.extract_fields_bytes), which is much faster.
+        Paths are opened with open_corpus, so compressed corpora
+        are decompressed in the background.
     delimiter : str
         String that delimits fields (token, tag, ..) in lines in corpus
     lower : bool
@@ -70,6 +88,25 @@ def extract_fields(corpus,
     drop_tag needs to include "vb", as every line will first be lowered and then
     the tag field will be compared to drop_tag.
     """
+    if isinstance(corpus, (str, os.PathLike)):
+        with open_corpus(corpus) as corpus:
+            yield from extract_fields(corpus, delimiter, lower, drop_meta,
+                                      keep_meta, drop_tags, tag_field,
+                                      num_fields, return_fields)
+        return
+
+    if isinstance(corpus, (RawIOBase, BufferedIOBase)):
+        # fast path splits lines on bytes, so it only supports single
+        # byte delimiters and checks keep_meta for single field lines
+        if len(delimiter.encode("utf-8")) == 1 and \
+                not any(delimiter in meta for meta in keep_meta):
+            yield from extract_fields_bytes(corpus, delimiter, lower,
+                                            drop_meta, keep_meta, drop_tags,
+                                            tag_field, num_fields,
+                                            return_fields)
+            return
+        corpus = TextIOWrapper(corpus, encoding="utf-8")
+
     for idx, line_ in enumerate(corpus):
 
         line = line_.rstrip("\n")
@@ -108,6 +145,63 @@ def extract_fields(corpus,
             yield [fields[idx] for idx in return_fields]
 
 
+def extract_field_blocks(corpus,
+                         delimiter="\t",
+                         lower=True,
+                         drop_meta=True,
+                         keep_meta={"</s>"},
+                         drop_tags={"zz", "Zz", "sy", "Sy"},
+                         tag_field=2,
+                         num_fields=5,
+                         return_fields=0,
+                         blocksize=1 << 20
+                         ):
+    """Generator like extract_fields that yields the fields of many
+    lines at once as a list.
+
+    Parameters
+    ----------
+    corpus : iterable of str, binary file or path
+        See extract_fields
+    blocksize : int
+        Number of bytes read at once from binary files and paths
+
+    Yields
+    -------
+    list
+        Field(s) of consecutive lines, see extract_fields
+
+    Notes
+    -----
+    Binary files and paths are split into fields a block at a time
+    (see fields.extract_field_blocks_bytes), which avoids resuming a
+    generator for every line. Fields of other corpora are yielded in
+    blocks of 512 lines. See extract_fields for the other
+    parameters.
+    """
+    if isinstance(corpus, (str, os.PathLike)):
+        with open_corpus(corpus) as corpus:
+            yield from extract_field_blocks(corpus, delimiter, lower,
+                                            drop_meta, keep_meta, drop_tags,
+                                            tag_field, num_fields,
+                                            return_fields, blocksize)
+        return
+
+    if isinstance(corpus, (RawIOBase, BufferedIOBase)) and \
+            len(delimiter.encode("utf-8")) == 1 and \
+            not any(delimiter in meta for meta in keep_meta):
+        yield from extract_field_blocks_bytes(corpus, delimiter, lower,
+                                              drop_meta, keep_meta,
+                                              drop_tags, tag_field,
+                                              num_fields, return_fields,
+                                              blocksize)
+        return
+
+    fields = extract_fields(corpus, delimiter, lower, drop_meta, keep_meta,
+                            drop_tags, tag_field, num_fields, return_fields)
+    yield from iter(lambda: list(islice(fields, 512)), [])
+
+
 def extract_units(corpus,
                   boundary="</s>",
                   **kwargs):
@@ -115,9 +209,9 @@ def extract_units(corpus,
 
     Parameters
     ----------
-    corpus : iterable of str
+    corpus : iterable of str, binary file or path
         Sequence of str to break into units, typically lines from
-        a tagged corpus
+        a tagged corpus (see extract_fields)
     boundary : str
         String that separates units,
         e.g. meta tag </s> for sentences (default)
@@ -129,7 +223,7 @@ def extract_units(corpus,
 
     Notes
     -----
-    Other keyword arguments are passed on to extract_fields.
+    Other keyword arguments are passed on to extract_field_blocks.
     In particular keep_meta must be specified if meta tags are
     to be retained and return_fields if fields other than
     the default (0 for token) are to be extracted.
@@ -140,8 +234,8 @@ def extract_units(corpus,
         kwargs["keep_meta"] = set(kwargs["keep_meta"])  # coerce
         kwargs["keep_meta"].add(boundary)
 
-    corpus = extract_fields(corpus, **kwargs)
-    return split_collection(corpus, boundary)
+    blocks = extract_field_blocks(corpus, **kwargs)
+    return split_blocks(blocks, boundary)
 
 
 def replace_disallowed(sequence, symbols, replacement):
@@ -159,24 +253,87 @@ def replace_disallowed(sequence, symbols, replacement):
     Notes
     -----
     If token is not string, but a collection of strings, each element
-    in the collection will be replaced if it contains disallowed symbols
+    in the collection will be replaced if it contains disallowed symbols.
+    To replace many sequences, create a Replacer once instead.
     """
-    disallowed_characters = re.compile(f"[^{symbols}]")
-    replaced = list()
+    return Replacer(symbols, replacement)(sequence)
+
+
+class Replacer():
+    """Replaces tokens or fields in sequences based on symbols they
+    contain, like replace_disallowed.
 
-    for token in sequence:
-        if isinstance(token, str):
-            if disallowed_characters.search(token):
-                token = replacement
+    The result for each distinct string is cached, so that frequent
+    tokens are checked only once. When the cache is full, it is
+    cleared. Strings that are not cached are checked against a bitmap
+    of allowed code points, or a compiled pattern if symbols contains
+    characters with a special meaning in regular expression character
+    sets (e.g. ranges like "a-z").
 
+    Parameters
+    ----------
+    symbols : str
+        Symbols that are allowed. Tokens containing other symbols are replaced.
+    replacement : object
+        Object (typically string) that illegal tokens are replaced with
+    cache_size : int
+        Maximum number of distinct strings cached
+    """
+
+    def __init__(self, symbols, replacement, cache_size=1 << 20):
+        self.symbols = symbols
+        self.replacement = replacement
+        self.cache_size = cache_size
+        self._disallowed_characters = re.compile(f"[^{symbols}]")
+        self._cache = dict()
+        self._bitmap = None
+
+        if not set(symbols) & set("\\-[]^"):
+            self._bitmap = bytearray(max(map(ord, symbols), default=0)
+                                     // 8 + 1)
+            for symbol in map(ord, symbols):
+                self._bitmap[symbol // 8] |= 1 << symbol % 8
+
+    def replace(self, token):
+        """Returns replacement if token contains disallowed
+        symbols, token otherwise.
+
+        Parameters
+        ----------
+        token : str
+
+        Returns
+        -------
+        str or object
+        """
+        try:
+            return self._cache[token]
+        except KeyError:
+            pass
+
+        if self._bitmap is not None:
+            allowed = contains_only(token, self._bitmap)
         else:
-            token = [field if not disallowed_characters.search(field)
-                     else replacement
-                     for field in token]
+            allowed = not self._disallowed_characters.search(token)
+        replaced = token if allowed else self.replacement
+
+        if len(self._cache) >= self.cache_size:
+            self._cache.clear()
+        self._cache[token] = replaced
+        return replaced
 
-        replaced.append(token)
+    def __call__(self, sequence):
+        """Replace tokens or fields in sequence, see replace_disallowed.
 
-    return replaced
+        Parameters
+        ----------
+        sequence : collection of str or collections
+
+        Returns
+        -------
+        list
+        """
+        return replace_sequence(sequence, self._cache, self.replace)
 
 
 def split_collection(collection, split):
@@ -218,6 +375,8 @@ def merge_tokens_tags_corpus(corpus_path, merged_corpus_path,
                              replacement="REPL",
                              token_field=0, tag_field=2,
                              overwrite=False,
+                             number_of_processes=1,
+                             vocabulary_counts_path=None,
                              **kwargs):
     """Turns tagged corpus (one token per line) into sentences
     with token and tag merged (one sentence per line).
@@ -225,7 +384,7 @@ def merge_tokens_tags_corpus(corpus_path, merged_corpus_path,
     Parameters
     ----------
     corpus_path : str or path
-        Path to tagged corpus file
+        Path to tagged corpus file, possibly compressed (see open_corpus)
     merged_corpus_path : str or path
         Path to resulting corpus file
     symbols : str
@@ -238,10 +397,27 @@ def merge_tokens_tags_corpus(corpus_path, merged_corpus_path,
         Field where tag is located in corpus lines
     overwrite : bool
         Overwrite merged_corpus_path if exists
+    number_of_processes : int
+        Number of processes to use. If larger than 1, the corpus is
+        split after sentence boundaries into byte ranges, which are
+        merged into temporary shards next to merged_corpus_path and
+        concatenated in order.
+    vocabulary_counts_path : str or path
+        If given, tokens, tags and merged tokens (after replacement)
+        are counted while merging and saved to this file
+        (see save_vocabulary_counts).
+
+    Returns
+    -------
+    dict of Counter or None
+        Counts of "tokens", "tags" and "tagged" (merged tokens) if
+        vocabulary_counts_path is given
 
     Notes
     -----
-    Other keyword arguments are passed on to extract_units
+    Other keyword arguments are passed on to extract_units.
+    Compressed corpora cannot be split and are always merged
+    in a single process.
     """
     if "|" not in symbols:
         symbols = symbols + "|"
@@ -250,20 +426,202 @@ def merge_tokens_tags_corpus(corpus_path, merged_corpus_path,
         msg = f"'{merged_corpus_path}' already exists and overwrite=False!"
         raise OSError(msg)
 
-    with open(corpus_path) as corpus:
-        token_tag = [token_field, tag_field]
-        sentences = extract_units(corpus=corpus,
-                                  return_fields=token_tag,
-                                  **kwargs)
+    settings = {"symbols": symbols,
+                "replacement": replacement,
+                "token_tag": [token_field, tag_field],
+                "count": vocabulary_counts_path is not None,
+                "kwargs": kwargs}
+    extension = os.path.splitext(os.fspath(corpus_path))[1].lower()
+
+    if number_of_processes > 1 and extension not in DECOMPRESSORS:
+        counts = _merge_parallel(corpus_path, merged_corpus_path, settings,
+                                 number_of_processes)
+    else:
+        with open_corpus(corpus_path) as corpus:
+            with open(merged_corpus_path, "wt") as merged:
+                counts = _merge_sentences(corpus, merged, **settings)
+
+    if vocabulary_counts_path is not None:
+        save_vocabulary_counts(counts, vocabulary_counts_path)
 
-        with open(merged_corpus_path, "wt") as merged:
-            for sentence in sentences:
-                sentence = replace_disallowed(sequence=sentence,
-                                              symbols=symbols,
-                                              replacement=replacement)
-                sentence = ["|".join(fields) for fields in sentence]
-                line = " ".join(sentence) + "\n"
-                merged.write(line)
+    return counts
+
+
+def _merge_sentences(corpus, merged, symbols, replacement, token_tag,
+                     count, kwargs):
+    """Writes sentences of corpus with token and tag merged to merged.
+    Returns counts of tokens, tags and merged tokens if count is True.
+    """
+    sentences = extract_units(corpus=corpus,
+                              return_fields=token_tag,
+                              **kwargs)
+    replace = Replacer(symbols, replacement)
+    counts = {kind: Counter() for kind in VOCABULARY_KINDS} \
+        if count else None
+
+    for sentence in sentences:
+        sentence = replace(sentence)
+        if count:
+            counts["tokens"].update([fields[0] for fields in sentence])
+            counts["tags"].update([fields[1] for fields in sentence])
+        sentence = ["|".join(fields) for fields in sentence]
+        if count:
+            counts["tagged"].update(sentence)
+        line = " ".join(sentence) + "\n"
+        merged.write(line)
+
+    return counts
+
+
+def _merge_parallel(corpus_path, merged_corpus_path, settings,
+                    number_of_processes):
+    """Merges byte ranges of corpus into shards in a process pool
+    and concatenates them in order. Returns summed counts of shards
+    if settings["count"] is True.
+    """
+    kwargs = settings["kwargs"]
+    # more ranges than processes, so that uneven ranges balance out
+    offsets = _sentence_offsets(corpus_path, 4 * number_of_processes,
+                                kwargs.get("boundary", "</s>"),
+                                kwargs.get("lower", True))
+    directory = tempfile.mkdtemp(
+        dir=os.path.dirname(os.path.abspath(merged_corpus_path)))
+
+    counts = {kind: Counter() for kind in VOCABULARY_KINDS} \
+        if settings["count"] else None
+
+    try:
+        tasks = [(corpus_path, start, stop,
+                  os.path.join(directory, f"{idx}.txt"), settings)
+                 for idx, (start, stop)
+                 in enumerate(zip(offsets, offsets[1:]))]
+
+        with Pool(number_of_processes) as pool, \
+                open(merged_corpus_path, "wb") as merged:
+            for shard_path, shard_counts in pool.imap(_merge_range, tasks):
+                with open(shard_path, "rb") as shard:
+                    shutil.copyfileobj(shard, merged)
+                os.remove(shard_path)
+                if counts is not None:
+                    for kind, counter in shard_counts.items():
+                        counts[kind].update(counter)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    return counts
+
+
+def _merge_range(task):
+    corpus_path, start, stop, shard_path, settings = task
+
+    with open(corpus_path, "rb") as corpus, \
+            open(shard_path, "wt") as merged:
+        corpus.seek(start)
+        counts = _merge_sentences(_FileRange(corpus, stop - start), merged,
+                                  **settings)
+
+    return shard_path, counts
+
+
+def _sentence_offsets(corpus_path, number_of_ranges, boundary="</s>",
+                      lower=True):
+    """Returns offsets that split corpus into about number_of_ranges
+    byte ranges of similar size, each starting right after a sentence
+    boundary (or at the start of the file) and the last ending at the
+    end of the file.
+    """
+    size = os.path.getsize(corpus_path)
+    offsets = [0]
+
+    with open(corpus_path, "rb") as corpus:
+        for idx in range(1, number_of_ranges):
+            position = size * idx // number_of_ranges
+            if position <= offsets[-1]:
+                continue
+
+            # skip the (partial) line at position, find next boundary
+            corpus.seek(position - 1)
+            corpus.readline()
+            while True:
+                line = corpus.readline()
+                if not line:
+                    break
+                line = line.rstrip(b"\r\n").decode("utf-8", "replace")
+                if (line.lower() if lower else line) == boundary:
+                    break
+
+            offset = corpus.tell()
+            if offset >= size:
+                break
+            offsets.append(offset)
+
+    offsets.append(size)
+    return offsets
+
+
+class _FileRange(RawIOBase):
+    """Binary file reading at most size bytes from the current
+    position of another binary file.
+    """
+
+    def __init__(self, file, size):
+        self._file = file
+        self._remaining = size
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self._remaining)
+        if not size:
+            return 0
+        read = self._file.readinto(memoryview(buffer).cast("B")[:size])
+        self._remaining -= read
+        return read
+
+
+def save_vocabulary_counts(counts, path):
+    """Saves vocabulary counts to a tab-separated file with one
+    line per kind, item and count.
+
+    Parameters
+    ----------
+    counts : dict of Counter
+        Counters by kind, as returned by merge_tokens_tags_corpus
+    path : str or path
+        Path to counts file
+    """
+    with open(path, "wt") as counts_file:
+        for kind, counter in counts.items():
+            for item, frequency in counter.most_common():
+                counts_file.write(f"{kind}\t{item}\t{frequency}\n")
+
+
+def load_vocabulary_counts(path, kinds=VOCABULARY_KINDS):
+    """Loads vocabulary counts saved by save_vocabulary_counts.
+
+    Parameters
+    ----------
+    path : str or path
+        Path to counts file
+    kinds : collection of str
+        Kinds of counts to load
+
+    Returns
+    -------
+    dict of Counter
+        Counters by kind
+    """
+    counts = {kind: Counter() for kind in kinds}
+
+    with open(path) as counts_file:
+        for line in counts_file:
+            kind, item = line.rstrip("\n").split("\t", 1)
+            if kind in counts:
+                item, frequency = item.rsplit("\t", 1)
+                counts[kind][item] = int(frequency)
+
+    return counts
 
 
 def filter_tagged_vocabulary(tagged_vocabulary, vocabulary, split="|"):
@@ -328,7 +686,8 @@ def filter_tagged_event_file(input_event_file,
                              fill_cues=0,
                              fill_outcomes=0,
                              overwrite=False,
-                             number_of_processes=1):
+                             number_of_processes=1,
+                             vocabulary_counts=None):
     """Filters event file with tokens and tags merged for collections of
     untagged cues and outcomes.
 
@@ -352,14 +711,25 @@ def filter_tagged_event_file(input_event_file,
         Overwrite filtered_event_path if exists
     number_of_processes : int
         Number of processes to use
+    vocabulary_counts : Counter or str or path
+        Counts of merged tokens used for both cues and outcomes, or
+        path to a file saved by merge_tokens_tags_corpus (see
+        save_vocabulary_counts). If None, cues and outcomes are
+        counted in an extra pass over input_event_file.
     """
     if exists(filtered_event_file) and not overwrite:
         msg = f"'{filtered_event_file}' already exists and overwrite=False!"
         raise OSError(msg)
 
-    counts = cues_outcomes(input_event_file,
-                           number_of_processes=number_of_processes)
-    _, all_cues, all_outcomes = counts
+    if vocabulary_counts is None:
+        counts = cues_outcomes(input_event_file,
+                               number_of_processes=number_of_processes)
+        _, all_cues, all_outcomes = counts
+    else:
+        if isinstance(vocabulary_counts, (str, os.PathLike)):
+            vocabulary_counts = load_vocabulary_counts(vocabulary_counts,
+                                                       ["tagged"])["tagged"]
+        all_cues = all_outcomes = vocabulary_counts
 
     cues = filter_tagged_vocabulary(all_cues, cues)
     outcomes = filter_tagged_vocabulary(all_outcomes, outcomes)
@@ -417,6 +787,121 @@ def ngrams(sequence, n, as_string=True, join_char=" ", warn=True):
                 yield sequence[idx:idx + size]
 
 
+def ngram_windows(ids, n):
+    """Extracts all n-grams of length n from integer-encoded sequence
+    as rows of 2-D views, without copying.
+
+    Parameters
+    ----------
+    ids : array-like of int
+        Sequence of token ids, e.g. inverse of numpy.unique(tokens,
+        return_inverse=True)
+    n : int or sequence of int
+        Size(s) of n-grams to extract
+
+    Returns
+    -------
+    dict of numpy.ndarray
+        Read-only array of shape (len(ids) - size + 1, size) for each size
+    """
+    ids = np.asarray(ids)
+
+    if isinstance(n, int):
+        n = [n]
+
+    windows = dict()
+    for size in n:
+        if size > len(ids):
+            windows[size] = np.empty((0, size), dtype=ids.dtype)
+        else:
+            windows[size] = sliding_window_view(ids, size)
+
+    return windows
+
+
+def ngram_keys(ids, n, bits=None):
+    """Extracts all n-grams of length n from integer-encoded sequence
+    as uint64 keys, with the id of each token packed into bits bits.
+
+    Parameters
+    ----------
+    ids : array-like of int
+        Sequence of non-negative token ids
+    n : int or sequence of int
+        Size(s) of n-grams to extract
+    bits : int
+        Number of bits per id. If None, the fewest bits that fit
+        the largest id are used.
+
+    Returns
+    -------
+    dict of numpy.ndarray
+        Keys of n-grams in order for each size
+
+    Notes
+    -----
+    Keys of one size are unique per n-gram, so n-gram types can be
+    counted with numpy.unique(keys, return_counts=True) and turned
+    back into ids with unpack_ngram_keys. Keys of different sizes are
+    not distinguishable from each other.
+    """
+    ids = np.asarray(ids)
+    if len(ids) and ids.min() < 0:
+        msg = "Token ids need to be non-negative."
+        raise ValueError(msg)
+
+    if bits is None:
+        bits = max(int(ids.max()).bit_length(), 1) if len(ids) else 1
+    elif len(ids) and int(ids.max()) >= 1 << bits:
+        msg = f"Token id {ids.max()} does not fit into {bits} bits."
+        raise ValueError(msg)
+
+    windows = ngram_windows(ids, n)
+    if max(windows) * bits > 64:
+        msg = f"{max(windows)}-grams of ids with {bits} bits do not " \
+              f"fit into 64 bits."
+        raise ValueError(msg)
+
+    shift = np.uint64(bits)
+    keys = dict()
+    for size, window in windows.items():
+        packed = np.zeros(len(window), dtype=np.uint64)
+        for column in range(size):
+            packed <<= shift
+            packed |= window[:, column].astype(np.uint64)
+        keys[size] = packed
+
+    return keys
+
+
+def unpack_ngram_keys(keys, size, bits):
+    """Returns ids of n-grams packed by ngram_keys.
+
+    Parameters
+    ----------
+    keys : numpy.ndarray
+        Keys of n-grams of one size
+    size : int
+        Size of n-grams
+    bits : int
+        Number of bits per id used to pack keys
+
+    Returns
+    -------
+    numpy.ndarray
+        Array of shape (len(keys), size)
+    """
+    keys = np.asarray(keys, dtype=np.uint64)
+    mask = np.uint64((1 << bits) - 1)
+    ids = np.empty((len(keys), size), dtype=np.uint64)
+
+    for column in range(size):
+        shift = np.uint64(bits * (size - column - 1))
+        ids[:, column] = (keys >> shift) & mask
+
+    return ids
+
+
 def random_strings(num_strings, symbols=ENGLISH,
                    min_len=1, max_len=15, seed=None):
     if seed:
@@ -517,21 +1002,113 @@ def bandsample(population,
     band sampling.
 
     Modified from pyndl package.
+
+    Notes
+    -----
+    Words are shuffled with random.Random(seed) and stably sorted by
+    frequency. Band indices are then picked on arrays: cumulative sums
+    of frequencies locate the next word where the accumulator reaches
+    the step, and a word is in the sample if the words added while
+    walking back from later words reach it. Samples are identical to
+    accumulating word by word (_band_indices_loop), which is used if
+    verbose is True.
     """
+    words = list(population)
+    values = list(population.values())
+    counts = np.array(values)
+    frequencies = counts.astype(np.float64)
+    # integers are compared exactly, float64 ties counts above 2**53
+    exact = counts if counts.dtype.kind in "iu" else frequencies
 
-    # make a copy of the population
     # filter all words with freq < cutoff
-    population = [(word, freq) for word, freq in population.items()
-                  if freq >= cutoff]
-
-    # shuffle words with same frequency
-    random.Random(seed).shuffle(population)
-    population.sort(key=lambda x: x[1])  # lowest -> highest freq
-
-    step = sum(freq for word, freq in population) / sample_size
+    kept = np.flatnonzero(exact >= cutoff)
+
+    # shuffle words with same frequency, shuffling positions gives the
+    # same permutation as shuffling the population list
+    order = list(range(len(kept)))
+    random.Random(seed).shuffle(order)
+    kept = kept[order]
+    kept = kept[np.argsort(exact[kept], kind="stable")]
+
+    # integer sums are exact in any order, others are summed in order;
+    # integers are summed as Python ints, which cannot overflow
+    if counts.dtype.kind in "iu":
+        total = int(counts[kept].astype(object).sum())
+    else:
+        total = sum([values[i] for i in kept])
+    step = total / sample_size
     if verbose:
         sys.stdout.write(f"step {step:.3}\n")
 
+    sample_indices = None
+    if not verbose and step > 0 and frequencies[kept].min(initial=0) >= 0:
+        sample_indices = _band_indices(frequencies[kept], step)
+
+    if sample_indices is None:
+        population = [(words[i], values[i]) for i in kept]
+        sample_indices = _band_indices_loop(population, step, verbose)
+
+    sample = Counter(dict((words[i], values[i])
+                          for i in kept[sample_indices]))
+    return sample
+
+
+def _band_indices(frequencies, step):
+    """Returns indices of band sample from frequencies in ascending
+    order, or None if the band reaches before the first word.
+    """
+    picks = np.zeros(len(frequencies), dtype=np.int64)
+    # the accumulator can only reach the step above this bound
+    bound = step - 2e-9 * step
+    accumulator = 0.0
+    position = 0
+    window = 1024
+
+    while position < len(frequencies):
+        # sequential sums, identical to adding frequencies one by one
+        chunk = frequencies[position:position + window]
+        sums = np.cumsum(np.concatenate(([accumulator], chunk)))[1:]
+
+        idx = int(np.searchsorted(sums, bound))
+        while idx < len(sums) and not _reached(float(sums[idx]), step):
+            idx += 1
+
+        if idx == len(sums):
+            accumulator = float(sums[-1])
+            position += len(chunk)
+            window *= 2
+            continue
+
+        accumulator = float(sums[idx]) - step
+        number = 1
+        while _reached(accumulator, step):
+            accumulator -= step
+            number += 1
+
+        picks[position + idx] = number
+        position += idx + 1
+        window = max(2 * (idx + 1), 16)
+
+    # each word is pushed on a stack of words not sampled yet and the
+    # picks of a word pop it and the closest words before it, so a word
+    # is sampled if the stack shrinks below its position later on
+    stack = np.arange(1, len(picks) + 1) - np.cumsum(picks)
+    if len(stack) and stack.min() < 0:
+        return None
+
+    lowest = np.minimum.accumulate(stack[::-1])[::-1]
+    before = np.concatenate(([0], stack[:-1]))
+    return np.flatnonzero(lowest <= before)
+
+
+def _reached(accumulator, step):
+    return accumulator >= step or isclose(accumulator, step)
+
+
+def _band_indices_loop(population, step, verbose=False):
+    """Returns indices of band sample from population of (word, freq)
+    tuples in ascending order of frequency.
+    """
     sample_indices = set()
     accumulator = 0.0
 
@@ -555,5 +1132,4 @@ def bandsample(population,
                         word, freq = population[idx]
                         sys.stdout.write(f"  add\t{word}\t{accumulator:.3}\n")
 
-    sample = Counter(dict(population[i] for i in sample_indices))
-    return sample
+    return list(sample_indices)
@@ -0,0 +1,207 @@
+SEPARATOR = "\x00"
+UNKNOWN = "\x01"
+# tokens use the 2 ** 20 code points of the supplementary planes
+FIRST = 0x10000
+SIZE = 2 ** 20
+# odd multiplier close to SIZE / golden ratio and its inverse modulo SIZE
+MULTIPLIER = 0x9E379
+INVERSE = pow(MULTIPLIER, -1, SIZE)
+# ids beyond SIZE are prefixed with digits of id // SIZE, using code
+# points of the basic multilingual plane below the surrogates
+HIGH_FIRST = 0x100
+HIGH_SIZE = 0xD800 - HIGH_FIRST
+
+
+class TokenEncoder():
+    """Interns tokens as short codes, so that an n-gram of n tokens
+    becomes a key of n codes separated by SEPARATOR regardless of
+    token length (2n - 1 characters for single character codes).
+
+    Token ids are assigned densely in order of first occurrence.
+    Each id is stored as a code point of the supplementary planes,
+    scattered by multiplicative hashing, so that tokens inserted in
+    order of their ids still form balanced subtrees in the tree.
+    The 2 ** 20 code points suffice for most vocabularies. Ids beyond
+    them are prefixed by the digits of id // 2 ** 20 in the basic
+    multilingual plane, so codes get longer but never run out and no
+    code is a prefix of another. Tokens that were never encoded are
+    looked up as UNKNOWN, which is never assigned to a token.
+
+    Attributes
+    ----------
+    tokens : list of str
+        Tokens in order of their ids
+    """
+
+    def __init__(self, tokens=()):
+        """
+        Parameters
+        ----------
+        tokens : iterable of str
+            Tokens to assign the first ids to, e.g. tokens attribute
+            of another encoder.
+        """
+        self.tokens = list()
+        self._codes = dict()
+        self.update(tokens)
+
+    def encode(self, token):
+        """Return code of token, assigning a new id if needed.
+
+        Parameters
+        ----------
+        token : str
+
+        Returns
+        -------
+        str
+            Single character for the first 2 ** 20 tokens
+        """
+        try:
+            return self._codes[token]
+        except KeyError:
+            pass
+
+        code = _code(len(self.tokens))
+        self._codes[token] = code
+        self.tokens.append(token)
+        return code
+
+    def update(self, tokens):
+        """Encode all tokens.
+
+        Parameters
+        ----------
+        tokens : iterable of str
+
+        Returns
+        -------
+        dict
+            Code of the position of each token in tokens mapped to the
+            code of the token, only for tokens that are assigned a
+            different code (see translation).
+        """
+        table = dict()
+
+        for idx, token in enumerate(tokens):
+            code = self.encode(token)
+            position = _code(idx)
+            if code != position:
+                table[position] = code
+
+        return table
+
+    def key(self, tokens, add=False):
+        """Return key of n-gram.
+
+        Parameters
+        ----------
+        tokens : iterable of str
+            N-gram
+        add : bool
+            Assign ids to new tokens. Otherwise, they are encoded
+            as UNKNOWN.
+
+        Returns
+        -------
+        str
+            Codes of tokens joined by SEPARATOR
+        """
+        if add:
+            return SEPARATOR.join([self.encode(token) for token in tokens])
+
+        return SEPARATOR.join(self.codes(tokens))
+
+    def codes(self, tokens):
+        """Return codes of tokens, UNKNOWN for tokens without id.
+
+        Parameters
+        ----------
+        tokens : iterable of str
+
+        Returns
+        -------
+        list of str
+        """
+        get = self._codes.get
+        return [get(token, UNKNOWN) for token in tokens]
+
+    def decode(self, key):
+        """Return tokens of key.
+
+        Parameters
+        ----------
+        key : str
+            Key returned by key()
+
+        Returns
+        -------
+        list of str
+            N-gram
+        """
+        if not key:
+            return []
+
+        tokens = self.tokens
+        decoded = list()
+
+        for code in key.split(SEPARATOR):
+            token_id = (ord(code[-1]) - FIRST) * INVERSE % SIZE
+            if len(code) > 1:
+                token_id += _high(code) * SIZE
+            decoded.append(tokens[token_id])
+
+        return decoded
+
+    def __contains__(self, token):
+        return token in self._codes
+
+    def __len__(self):
+        return len(self.tokens)
+
+
+def translation(table):
+    """Return translation of keys for a table returned by update, to
+    be passed to the translate method of trees.
+
+    Parameters
+    ----------
+    table : dict
+        Codes mapped to codes
+
+    Returns
+    -------
+    dict or callable
+        Translation table for str.translate if all codes are single
+        characters, otherwise function translating a key.
+    """
+    if all(len(old) == 1 and len(new) == 1 for old, new in table.items()):
+        return {ord(old): new for old, new in table.items()}
+
+    def translate(key):
+        return SEPARATOR.join([table.get(code, code)
+                               for code in key.split(SEPARATOR)])
+
+    return translate
+
+
+def _code(token_id):
+    high, low = divmod(token_id, SIZE)
+    character = chr(FIRST + low * MULTIPLIER % SIZE)
+    if not high:
+        return character
+
+    # bijective numeration, so that digits may be 0 at any position
+    digits = list()
+    while high:
+        high, digit = divmod(high - 1, HIGH_SIZE)
+        digits.append(chr(HIGH_FIRST + digit))
+
+    return "".join(reversed(digits)) + character
+
+
+def _high(code):
+    high = 0
+    for character in code[:-1]:
+        high = high * HIGH_SIZE + ord(character) - HIGH_FIRST + 1
+    return high
@@ -0,0 +1,192 @@
+import heapq
+import os
+import tempfile
+
+from collections import Counter
+from itertools import count, islice
+
+
+def count_external(items, counts_path, buffer_size=1_000_000,
+                   directory=None, max_runs=256):
+    """Counts items that may not fit into memory by external sorting,
+    writing them with their counts in sorted order to counts_path.
+
+    Items are counted in a buffer of at most about buffer_size
+    distinct items, which is spilled to a temporary file (run) sorted
+    by item whenever it is full. Runs are merged with a k-way merge,
+    so memory stays bounded by buffer_size regardless of the number
+    of items.
+
+    Parameters
+    ----------
+    items : iterable of str
+        Items to count, which must not contain newlines
+    counts_path : str or path
+        Path to resulting counts file, with an item and its count
+        separated by a tab on each line (see read_counts)
+    buffer_size : int
+        Number of distinct items counted in memory before spilling
+    directory : str or path
+        Directory for temporary runs. If None, the default temporary
+        directory is used.
+    max_runs : int
+        Maximum number of runs merged at once. Whenever max_runs runs
+        of the same level have been spilled or merged, they are merged
+        into one run of the next level, so each item is rewritten once
+        per level.
+
+    Returns
+    -------
+    int
+        Number of distinct items
+    """
+    if max_runs < 2:
+        msg = f"max_runs must be at least 2, got {max_runs}."
+        raise ValueError(msg)
+
+    with tempfile.TemporaryDirectory(dir=directory) as run_directory:
+        names = (os.path.join(run_directory, f"{idx}.tsv")
+                 for idx in count())
+        items = iter(items)
+        buffer = Counter()
+        # runs by level, runs of level k are merged from max_runs
+        # runs of level k - 1
+        levels = [[]]
+
+        # Counter.update counts chunks in C, the buffer may exceed
+        # buffer_size by at most one chunk
+        chunksize = max(min(buffer_size, 65_536), 1)
+        for chunk in iter(lambda: list(islice(items, chunksize)), []):
+            buffer.update(chunk)
+            if len(buffer) < buffer_size:
+                continue
+
+            levels[0].append(_spill(buffer, next(names)))
+            buffer.clear()
+            _merge_levels(levels, names, max_runs)
+
+        if buffer or not any(levels):
+            levels[0].append(_spill(buffer, next(names)))
+
+        # smaller runs of lower levels are merged first
+        runs = [run for runs in levels for run in runs]
+        while len(runs) > max_runs:
+            run = next(names)
+            _merge_runs(runs[:max_runs], run)
+            runs = runs[max_runs:] + [run]
+
+        return _merge_runs(runs, counts_path)
+
+
+def count_ngrams_external(units, n, counts_path, splitchar="#", **kwargs):
+    """Counts n-grams of units like LanguageModel.train, but in bounded
+    memory (see count_external).
+
+    For each position in a unit, the n-gram starting there (shorter at
+    the end of the unit) is counted, so inserting the counts with
+    subsequences=True gives the counts of a model trained on units.
+
+    Parameters
+    ----------
+    units : iterable of sequence of str
+        Units (e.g. sentences) of tokens, see extract_units
+    n : int
+        Size of n-grams
+    counts_path : str or path
+        Path to resulting counts file
+    splitchar : str
+        Character that tokens in n-grams are joined by
+
+    Returns
+    -------
+    int
+        Number of distinct n-grams
+
+    Notes
+    -----
+    Other keyword arguments are passed on to count_external. Counts do
+    not depend on the vocabulary, targets or must_contain of a model.
+    As the counts file is sorted, trees that the counts are inserted
+    into should be rebalanced afterwards, e.g.:
+
+        lm.insert_sequence(read_counts(counts_path), subsequences=True)
+        lm.rebalance()
+    """
+    def n_grams():
+        for unit in units:
+            unit = list(unit)
+            for idx in range(len(unit)):
+                yield splitchar.join(unit[idx:idx + n])
+
+    return count_external(n_grams(), counts_path, **kwargs)
+
+
+def read_counts(counts_path):
+    """Generator of items and counts written by count_external.
+
+    Parameters
+    ----------
+    counts_path : str or path
+
+    Yields
+    ------
+    tuple of (str, int)
+        Item and count, in sorted order of items
+    """
+    with open(counts_path, encoding="utf-8", newline="\n") as counts_file:
+        for line in counts_file:
+            item, frequency = line[:-1].rsplit("\t", 1)
+            yield item, int(frequency)
+
+
+def _spill(buffer, path):
+    with open(path, "w", encoding="utf-8", newline="\n") as run:
+        for item, frequency in sorted(buffer.items()):
+            if "\n" in item:
+                msg = f"Items must not contain newlines: {item!r}"
+                raise ValueError(msg)
+            run.write(f"{item}\t{frequency}\n")
+    return path
+
+
+def _merge_levels(levels, names, max_runs):
+    """Merges the runs of each level that has max_runs runs into
+    one run of the next level.
+    """
+    level = 0
+    while len(levels[level]) >= max_runs:
+        if level + 1 == len(levels):
+            levels.append([])
+        run = next(names)
+        _merge_runs(levels[level], run)
+        levels[level + 1].append(run)
+        levels[level] = []
+        level += 1
+
+
+def _merge_runs(runs, path):
+    """Merges sorted runs into one, summing counts of equal items,
+    and removes them. Returns number of distinct items.
+    """
+    number = 0
+    current, total = None, 0
+
+    with open(path, "w", encoding="utf-8", newline="\n") as merged:
+        for item, frequency in heapq.merge(*map(read_counts, runs)):
+            if item == current:
+                total += frequency
+                continue
+
+            if current is not None:
+                merged.write(f"{current}\t{total}\n")
+                number += 1
+            current, total = item, frequency
+
+        if current is not None:
+            merged.write(f"{current}\t{total}\n")
+            number += 1
+
+    for run in runs:
+        os.remove(run)
+
+    return number
@@ -0,0 +1,425 @@
+#cython: language_level=3
+from cpython.bytes cimport PyBytes_AS_STRING, PyBytes_FromStringAndSize
+from cpython.bytes cimport PyBytes_GET_SIZE
+from cpython.unicode cimport PyUnicode_DecodeUTF8
+from libc.stdint cimport uint64_t
+from libc.stdlib cimport free, malloc
+from libc.string cimport memchr, memcmp, memmove
+
+import warnings
+
+# maximum number of lines per list yielded by extract_field_blocks_bytes
+cdef Py_ssize_t BLOCK_LINES = 512
+
+
+def extract_fields_bytes(file,
+                         delimiter="\t",
+                         bint lower=True,
+                         bint drop_meta=True,
+                         keep_meta={"</s>"},
+                         drop_tags={"zz", "Zz", "sy", "Sy"},
+                         Py_ssize_t tag_field=2,
+                         Py_ssize_t num_fields=5,
+                         return_fields=0,
+                         Py_ssize_t blocksize=1 << 20):
+    """Generator that filters lines and extracts fields from a tagged
+    corpus read as UTF-8 bytes in large blocks.
+
+    Parameters
+    ----------
+    file : binary file
+        Corpus opened for binary reading (anything with readinto)
+    delimiter : str
+        Single ASCII character that delimits fields in lines
+    blocksize : int
+        Number of bytes read at once. Blocks grow to fit longer lines.
+
+    Yields
+    -------
+    str or list of str
+        Field(s) - String if type(return_fields) is int,
+        list of str otherwise.
+
+    Notes
+    -----
+    Same as extract_fields for text files, see there for the other
+    parameters. Lines are split on bytes and lines with only ASCII
+    characters are lowered in place. Only the tag field and the fields
+    returned are decoded.
+    """
+    cdef list fields
+
+    for fields in extract_field_blocks_bytes(file, delimiter, lower,
+                                             drop_meta, keep_meta,
+                                             drop_tags, tag_field,
+                                             num_fields, return_fields,
+                                             blocksize):
+        yield from fields
+
+
+def extract_field_blocks_bytes(file,
+                               delimiter="\t",
+                               bint lower=True,
+                               bint drop_meta=True,
+                               keep_meta={"</s>"},
+                               drop_tags={"zz", "Zz", "sy", "Sy"},
+                               Py_ssize_t tag_field=2,
+                               Py_ssize_t num_fields=5,
+                               return_fields=0,
+                               Py_ssize_t blocksize=1 << 20):
+    """Generator like extract_fields_bytes that yields the fields of
+    up to 512 consecutive lines at once as a list.
+
+    Yields
+    -------
+    list
+        Field(s) of consecutive lines, see extract_fields_bytes
+
+    Notes
+    -----
+    Fields are decoded through a cache of recently decoded bytes, so
+    frequent tokens are decoded once and share one str.
+    """
+    cdef:
+        bytearray block = bytearray(max(blocksize, 1))
+        char* data
+        char separator
+        Py_ssize_t size = 0, start, end, position, idx = 0
+        Py_ssize_t count, field, column, read
+        Py_ssize_t fields_capacity = max(num_fields, 1) + 1
+        Py_ssize_t* starts = <Py_ssize_t*> malloc(
+            2 * fields_capacity * sizeof(Py_ssize_t))
+        Py_ssize_t* ends
+        Py_ssize_t single = -1
+        list indices = []
+        # drop_tags as bytes to compare with fields before decoding
+        list dropped = []
+        bint bytes_tags
+        bint eof = False, ascii
+        unsigned char character
+        const char* newline
+        str line
+        list fields, line_fields
+        _Decoder decoder = _Decoder()
+
+    encoded = delimiter.encode("utf-8")
+    if len(encoded) != 1 or encoded[0] >= 128:
+        free(starts)
+        msg = "delimiter must be a single ASCII character."
+        raise ValueError(msg)
+    separator = encoded[0]
+
+    if starts is NULL:
+        raise MemoryError()
+    ends = starts + fields_capacity
+
+    bytes_tags = isinstance(drop_tags, (set, frozenset, list, tuple)) and \
+        all(isinstance(item, str) for item in drop_tags)
+    if bytes_tags:
+        dropped = [item.encode("utf-8") for item in drop_tags]
+
+    try:
+        # negative fields count from the end, as when indexing lists
+        if isinstance(return_fields, int):
+            single = _field_index(return_fields, num_fields)
+        else:
+            indices = [_field_index(field, num_fields)
+                       for field in return_fields]
+        if drop_tags:
+            tag_field = _field_index(tag_field, num_fields)
+
+        while not eof:
+            read = file.readinto(memoryview(block)[size:])
+            if not read:
+                eof = True
+                if not size:
+                    break
+            size += read
+            data = block
+            fields = []
+
+            start = 0
+            while start < size:
+                newline = <const char*> memchr(data + start, b"\n",
+                                               size - start)
+                if newline is NULL:
+                    if not eof:
+                        break
+                    end = size
+                else:
+                    end = newline - data
+
+                position = start
+                start = end + 1
+                idx += 1
+
+                # CRLF line ends, as with universal newlines in text mode
+                if end > position and data[end - 1] == b"\r":
+                    end -= 1
+
+                if end == position:
+                    continue
+
+                # yield in small blocks, many lists of fields alive at
+                # once make collections of the garbage collector slow
+                if len(fields) >= BLOCK_LINES:
+                    yield fields
+                    fields = []
+
+                ascii = True
+                count = 0
+                starts[0] = position
+                for position in range(position, end):
+                    character = data[position]
+                    if character == separator:
+                        if count + 1 < fields_capacity:
+                            ends[count] = position
+                            starts[count + 1] = position + 1
+                        count += 1
+                    elif character >= 128:
+                        ascii = False
+                if count < fields_capacity:
+                    ends[count] = end
+                count += 1
+
+                if count == 1:
+                    line = _decode(data, starts[0], end, lower)
+
+                    if line in keep_meta:
+                        fields.append(line)
+                        continue
+
+                    # heuristic: single field starting with < is a meta tag
+                    if line.startswith("<"):
+                        if not drop_meta:
+                            fields.append(line)
+                        continue
+
+                if count != num_fields:
+                    line = PyUnicode_DecodeUTF8(
+                        data + starts[0], start - starts[0], "replace")
+                    msg = f"Line ({idx - 1}) with fewer elements than {num_fields} \
+                    ({count} encountered:\n{line}"
+                    warnings.warn(msg)
+                    continue
+
+                # lower ASCII letters in place, other lines are lowered
+                # as str after decoding
+                if lower and ascii:
+                    for position in range(starts[0], end):
+                        character = data[position]
+                        if 65 <= character <= 90:
+                            data[position] = character + 32
+
+                if drop_tags:
+                    if bytes_tags and (ascii or not lower):
+                        if _contains(dropped, data, starts[tag_field],
+                                     ends[tag_field]):
+                            continue
+                    elif _decode(data, starts[tag_field], ends[tag_field],
+                                 lower and not ascii) in drop_tags:
+                        continue
+
+                if single >= 0:
+                    fields.append(decoder.decode(data, starts[single],
+                                                 ends[single],
+                                                 lower and not ascii))
+                else:
+                    line_fields = []
+                    for column in range(len(indices)):
+                        field = indices[column]
+                        line_fields.append(decoder.decode(
+                            data, starts[field], ends[field],
+                            lower and not ascii))
+                    fields.append(line_fields)
+
+            if fields:
+                yield fields
+
+            # keep the incomplete last line, growing block if it is full
+            if start < size:
+                size -= start
+                memmove(data, data + start, size)
+                if size == len(block):
+                    block.extend(bytes(len(block)))
+            else:
+                size = 0
+    finally:
+        free(starts)
+
+
+def split_blocks(blocks, split):
+    """Generator that splits a collection given as blocks (lists) on
+    value, like split_collection on the concatenated blocks.
+
+    Parameters
+    ----------
+    blocks : iterable of list
+        Consecutive parts of the collection to split
+    split : str
+        Value to split collection on
+
+    Yields
+    ------
+    list
+        Each subcollection after splitting
+    """
+    cdef:
+        list block, unit, current = []
+        object item
+        Py_ssize_t idx, start
+
+    for block in blocks:
+        start = 0
+        for idx in range(len(block)):
+            item = block[idx]
+            if type(item) is not str or item != split:
+                continue
+
+            unit = block[start:idx]
+            if current:
+                current.extend(unit)
+                unit, current = current, []
+            if unit:
+                yield unit
+            start = idx + 1
+
+        current.extend(block[start:])
+
+    if current:
+        yield current
+
+
+cdef Py_ssize_t _field_index(Py_ssize_t field,
+                            Py_ssize_t num_fields) except -1:
+    if not -num_fields <= field < num_fields:
+        msg = f"Field {field} out of range for {num_fields} fields."
+        raise IndexError(msg)
+    return field + num_fields if field < 0 else field
+
+
+# slots of _Decoder, a power of two
+cdef Py_ssize_t CACHE_SIZE = 1 << 14
+
+
+cdef class _Decoder():
+    """Decodes fields, remembering the str of the bytes last decoded
+    in each slot of a direct-mapped cache, so that frequent tokens
+    are decoded (and lowered) once and share one str.
+
+    Within a call of extract_field_blocks_bytes, equal bytes are
+    always decoded the same way: lines with only ASCII characters are
+    lowered in place before decoding, others are lowered as str if
+    lower is True.
+    """
+    cdef:
+        list keys
+        list values
+
+    def __cinit__(self):
+        self.keys = [None] * CACHE_SIZE
+        self.values = [None] * CACHE_SIZE
+
+    cdef str decode(self, const char* data, Py_ssize_t start,
+                    Py_ssize_t end, bint lower):
+        cdef:
+            Py_ssize_t length = end - start, position
+            uint64_t state = 14695981039346656037ULL
+            Py_ssize_t slot
+            object key
+            str value
+
+        # 64 bit FNV-1a
+        for position in range(start, end):
+            state = (state ^ <unsigned char> data[position]) \
+                * 1099511628211ULL
+        slot = <Py_ssize_t> ((state ^ (state >> 32)) & (CACHE_SIZE - 1))
+
+        key = self.keys[slot]
+        if key is not None and PyBytes_GET_SIZE(key) == length and \
+                memcmp(PyBytes_AS_STRING(key), data + start, length) == 0:
+            return self.values[slot]
+
+        value = _decode(data, start, end, lower)
+        self.keys[slot] = PyBytes_FromStringAndSize(data + start, length)
+        self.values[slot] = value
+        return value
+
+
+cdef str _decode(const char* data, Py_ssize_t start, Py_ssize_t end,
+                 bint lower):
+    cdef str decoded = PyUnicode_DecodeUTF8(data + start, end - start,
+                                            "strict")
+    return decoded.lower() if lower else decoded
+
+
+
+cdef bint _contains(list encoded, const char* data, Py_ssize_t start,
+                    Py_ssize_t end):
+    cdef bytes item
+    for item in encoded:
+        if len(item) == end - start and \
+                memcmp(data + start, <const char*> item, end - start) == 0:
+            return True
+    return False
+
+
+def replace_sequence(sequence, dict cache, replace):
+    """Replaces tokens or fields in sequence by their values in cache,
+    calling replace for strings that are not cached (see Replacer).
+
+    Parameters
+    ----------
+    sequence : iterable of str or collections
+    cache : dict
+        Replaced value of each string
+    replace : callable
+        Returns replaced value of a string that is not in cache
+
+    Returns
+    -------
+    list
+    """
+    cdef list replaced = list(), fields
+    cdef object token, field, value
+
+    for token in sequence:
+        if isinstance(token, str):
+            value = cache.get(token, _MISSING)
+            replaced.append(replace(token) if value is _MISSING else value)
+            continue
+
+        fields = list()
+        for field in token:
+            value = cache.get(field, _MISSING)
+            fields.append(replace(field) if value is _MISSING else value)
+        replaced.append(fields)
+
+    return replaced
+
+
+def contains_only(str token, const unsigned char[:] bitmap):
+    """Checks whether all characters of token are in bitmap, which
+    has bit (code point % 8) of byte (code point // 8) set for each
+    allowed character.
+
+    Parameters
+    ----------
+    token : str
+    bitmap : bytes-like
+
+    Returns
+    -------
+    bool
+    """
+    cdef Py_UCS4 character
+    cdef Py_ssize_t point, size = bitmap.shape[0]
+
+    for character in token:
+        point = <Py_ssize_t> character
+        if point >> 3 >= size or not bitmap[point >> 3] & (1 << (point & 7)):
+            return False
+    return True
+
+
+cdef object _MISSING = object()
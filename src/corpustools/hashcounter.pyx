@@ -0,0 +1,1030 @@
+#cython: language_level=3
+from cpython cimport array
+from cpython.unicode cimport PyUnicode_DecodeUTF8
+from libc.limits cimport UINT_MAX
+from libc.math cimport M_E, ceil, log
+from libc.stdint cimport uint32_t, uint64_t
+from libc.stdlib cimport free, malloc, realloc
+from libc.string cimport memcmp, memcpy, memmove
+
+import array
+
+import numpy as np
+from .tst import CompactTernarySearchTree, _as_str, _count_threshold
+
+
+cdef extern from "Python.h":
+    const char* PyUnicode_AsUTF8AndSize(object string,
+                                        Py_ssize_t* size) except NULL
+
+
+# 64 bit FNV-1a, which can be continued byte by byte, so the hashes
+# of all subsequences of a key are found in a single pass over it
+cdef uint64_t FNV_OFFSET = 14695981039346656037ULL
+cdef uint64_t FNV_PRIME = 1099511628211ULL
+
+
+cdef inline uint64_t _fnv(uint64_t state, const char* data,
+                          Py_ssize_t length) noexcept nogil:
+    cdef Py_ssize_t idx
+    for idx in range(length):
+        state = (state ^ <unsigned char> data[idx]) * FNV_PRIME
+    return state
+
+
+cdef inline uint64_t _finalize(uint64_t state) noexcept nogil:
+    """Mix all bits of an FNV state into the low bits used for slots
+    (finalizer of MurmurHash3).
+    """
+    state ^= state >> 33
+    state *= 0xff51afd7ed558ccdULL
+    state ^= state >> 33
+    state *= 0xc4ceb9fe1a85ec53ULL
+    state ^= state >> 33
+    return state
+
+
+cdef class HashCounter():
+    """Counts for n-grams and their subsequences in an open-addressing
+    hash table.
+
+    Keys are stored as UTF-8 in one contiguous arena and referenced by
+    entries (offset, length, hash and count), slots hold entry indices
+    and are probed linearly. It has the interface of the trees in tst,
+    but completions are found by a scan over all entries and sorted on
+    demand, so it should be used when counts are mostly looked up.
+    """
+    cdef:
+        char* arena
+        size_t arena_size
+        size_t arena_capacity
+        uint64_t* offsets
+        uint32_t* lengths
+        uint64_t* hashes
+        unsigned int* counts
+        Py_ssize_t size
+        Py_ssize_t capacity
+        # entry index + 1 per slot, 0 for empty slots
+        uint32_t* slots
+        Py_ssize_t mask
+        str _splitchar
+        bytes _split
+        public unsigned int total
+
+    def __cinit__(self):
+        self.arena = NULL
+        self.offsets = NULL
+        self.lengths = NULL
+        self.hashes = NULL
+        self.counts = NULL
+        self.slots = NULL
+        self.arena_size = self.arena_capacity = 0
+        self.size = self.capacity = 0
+        self.mask = -1
+        self.total = 0
+
+    def __init__(self, splitchar=None, Py_ssize_t capacity=1024):
+        """Initializes HashCounter.
+        Parameters
+        ----------
+        splitchar : str
+            String that separates tokens in n-gram.
+            Counts are stored for complete n-grams and
+            each subsequence ending before this string
+        capacity : int
+            Number of entries to allocate memory for initially.
+        """
+        self._splitchar = splitchar
+        self._split = splitchar.encode("utf-8") if splitchar else b""
+        self._resize(capacity)
+        self._reserve(16 * capacity)
+
+    def __dealloc__(self):
+        free(self.arena)
+        free(self.offsets)
+        free(self.lengths)
+        free(self.hashes)
+        free(self.counts)
+        free(self.slots)
+
+    @classmethod
+    def from_tree(cls, tree):
+        """Return counter with the counts of a tree.
+        Parameters
+        ----------
+        tree : TernarySearchTree or CompactTernarySearchTree
+        Returns
+        -------
+        HashCounter
+        """
+        counter = cls(tree.splitchar)
+        counter.merge(tree)
+        return counter
+
+    def to_tree(self, cls=CompactTernarySearchTree):
+        """Return tree with the counts of counter.
+        Parameters
+        ----------
+        cls : type
+            TernarySearchTree or CompactTernarySearchTree
+        Returns
+        -------
+        TernarySearchTree or CompactTernarySearchTree
+        """
+        tree = cls(self._splitchar)
+        tree.insert_many(self.completions(), subsequences=False)
+        tree.total = self.total
+        return tree
+
+    cpdef void insert(self, str string,
+                      unsigned int frequency=1,
+                      bint subsequences=True):
+        """Insert string into counter.
+        Parameters
+        ----------
+        string : str
+            String to be inserted
+        frequency : unsigned int
+            Count (default 1)
+        subsequences : bool
+            If True, counts of subsequences (ending before splitchar)
+            are increased as well
+        """
+        cdef:
+            Py_ssize_t length, idx
+            const char* data
+            const char* split = self._split
+            Py_ssize_t split_length = len(self._split)
+            uint64_t state = FNV_OFFSET
+
+        self.total += frequency
+        if not string:
+            return
+
+        data = PyUnicode_AsUTF8AndSize(string, &length)
+
+        if subsequences and split_length:
+            for idx in range(length):
+                if idx and data[idx] == split[0] \
+                        and idx + split_length <= length \
+                        and not memcmp(data + idx, split, split_length):
+                    self._add(data, idx, _finalize(state), frequency)
+                state = (state ^ <unsigned char> data[idx]) * FNV_PRIME
+        else:
+            state = _fnv(state, data, length)
+
+        self._add(data, length, _finalize(state), frequency)
+
+    def insert_many(self, items, counts=None, bint subsequences=True):
+        """Insert many strings into counter in a single call.
+        Parameters
+        ----------
+        items : iterable of (str, unsigned int)-tuples or of str
+            Strings with their frequencies or, if counts are
+            given separately, only the strings.
+        counts : iterable of unsigned int
+            Frequencies of the strings in items (default None)
+        subsequences : bool
+            If True, counts of subsequences (divided by splitchar)
+            are increased as well
+        """
+        cdef unsigned int frequency
+
+        if counts is not None:
+            items = zip(items, counts)
+
+        for string, frequency in items:
+            self.insert(string if type(string) is str else _as_str(string),
+                        frequency, subsequences)
+
+    def merge(self, other):
+        """Add all counts of another counter or tree to this counter.
+        Parameters
+        ----------
+        other : HashCounter, TernarySearchTree or CompactTernarySearchTree
+            Counts to be added.
+
+        Notes
+        -----
+        Entries of another HashCounter are added with their stored
+        hashes, keys of trees are hashed again.
+        """
+        cdef:
+            HashCounter counter
+            Py_ssize_t entry
+            unsigned int total
+
+        if other is self:
+            for entry in range(self.size):
+                self.counts[entry] *= 2
+            self.total *= 2
+            return
+
+        if not isinstance(other, HashCounter):
+            total = self.total
+            for string, frequency in other.completions():
+                self.insert(string, frequency, False)
+            self.total = total + other.frequency("")
+            return
+
+        counter = other
+        for entry in range(counter.size):
+            self._add(counter.arena + counter.offsets[entry],
+                      counter.lengths[entry], counter.hashes[entry],
+                      counter.counts[entry])
+        self.total += counter.total
+
+    def __iadd__(self, other):
+        """Adds 'counter += other' syntactic sugar for merge.
+        """
+        self.merge(other)
+        return self
+
+    def translate(self, table):
+        """Return copy of counter with characters replaced.
+        Parameters
+        ----------
+        table : dict or callable
+            Mapping of code points to code points, as for str.translate,
+            or function returning the translation of a key. Keys must
+            remain unique after translation.
+
+        Returns
+        -------
+        HashCounter
+            Counter with the same counts and total for translated keys.
+        """
+        cdef HashCounter counter = type(self)(self._splitchar, self.size)
+
+        for string, frequency in self._entries():
+            string = table(string) if callable(table) \
+                else string.translate(table)
+            counter.insert(string, frequency, False)
+
+        counter.total = self.total
+        return counter
+
+    def prune(self, unsigned int min_count=0, max_entries=None, keys=()):
+        """Remove strings with low counts.
+        Parameters
+        ----------
+        min_count : unsigned int
+            Strings counted fewer times are removed.
+        max_entries : int
+            If given, the strings with the lowest counts are removed
+            until at most max_entries strings are left. Strings with
+            the same count are either all kept or all removed.
+        keys : iterable of str
+            Strings to remove regardless of their counts.
+
+        Notes
+        -----
+        The total is left unchanged. Remaining entries and their keys
+        are compacted in place and the slots are rebuilt.
+        """
+        cdef:
+            Py_ssize_t entry, kept = 0, length
+            dict histogram = {}
+            unsigned int threshold = min_count
+            const char* data
+            size_t offset = 0
+
+        for key in keys:
+            if key:
+                data = PyUnicode_AsUTF8AndSize(key, &length)
+                entry = self._find(data, length,
+                                   _finalize(_fnv(FNV_OFFSET, data, length)))
+                if entry >= 0:
+                    self.counts[entry] = 0
+
+        if max_entries is not None:
+            for entry in range(self.size):
+                if self.counts[entry]:
+                    histogram[self.counts[entry]] = \
+                        histogram.get(self.counts[entry], 0) + 1
+            threshold = max(threshold,
+                            _count_threshold(histogram, max_entries))
+
+        # entries are stored in order of their keys in the arena, so
+        # neither ever moves to a higher position
+        for entry in range(self.size):
+            if not self.counts[entry] or self.counts[entry] < threshold:
+                continue
+            memmove(self.arena + offset, self.arena + self.offsets[entry],
+                    self.lengths[entry])
+            self.offsets[kept] = offset
+            self.lengths[kept] = self.lengths[entry]
+            self.hashes[kept] = self.hashes[entry]
+            self.counts[kept] = self.counts[entry]
+            offset += self.lengths[entry]
+            kept += 1
+
+        self.size = kept
+        self.arena_size = offset
+        self._rehash(2 * max(self.size, 8))
+
+    def rebalance(self):
+        """Does nothing, as hash tables need no rebalancing.
+        """
+
+    cpdef unsigned int frequency(self, str string):
+        """Return frequency of string.
+        Parameters
+        ----------
+        string : str
+            String to be looked up
+        Returns
+        -------
+        unsigned int
+            Frequency
+        """
+        cdef:
+            Py_ssize_t length, entry
+            const char* data
+
+        if not string:
+            return self.total
+
+        data = PyUnicode_AsUTF8AndSize(string, &length)
+        entry = self._find(data, length,
+                           _finalize(_fnv(FNV_OFFSET, data, length)))
+        return self.counts[entry] if entry >= 0 else 0
+
+    def conditional_probabilities(self, sequences, unsigned int n):
+        """Return probability of each token given the up to n - 1
+        tokens preceding it.
+        Parameters
+        ----------
+        sequences : iterable of list of str
+            Token sequences, joined by splitchar to form keys.
+        n : unsigned int
+            Size of n-grams.
+        Returns
+        -------
+        array.array
+            Probabilities (as doubles) of all tokens of all sequences.
+
+        Notes
+        -----
+        Probabilities are relative frequencies of n-gram and preceding
+        context. Both are hashed in one pass over the n-gram, as the
+        hash of the context is a state of the hash of the n-gram.
+        """
+        cdef:
+            array.array probabilities = array.array("d")
+            bytearray buffer = bytearray()
+            bytes split = self._split
+            list tokens, encoded
+            Py_ssize_t idx, jdx, start, context_length, entry
+            const char* data
+            uint64_t state, context_state
+            unsigned int context, frequency
+
+        for tokens in sequences:
+            encoded = [token.encode("utf-8") for token in tokens]
+
+            for idx in range(len(encoded)):
+                start = idx - n + 1 if idx >= n else 0
+                buffer.clear()
+                for jdx in range(start, idx):
+                    if jdx > start:
+                        buffer += split
+                    buffer += encoded[jdx]
+                context_length = len(buffer)
+                if idx > start:
+                    buffer += split
+                buffer += encoded[idx]
+                data = buffer
+
+                context_state = _fnv(FNV_OFFSET, data, context_length)
+                state = _fnv(context_state, data + context_length,
+                             len(buffer) - context_length)
+
+                if idx == start:
+                    context = self.total
+                else:
+                    entry = self._find(data, context_length,
+                                       _finalize(context_state))
+                    context = self.counts[entry] if entry >= 0 else 0
+
+                if not context:
+                    probabilities.append(0.0)
+                    continue
+
+                entry = self._find(data, len(buffer), _finalize(state))
+                frequency = self.counts[entry] if entry >= 0 else 0
+
+                if frequency:
+                    probabilities.append(<double> frequency / context)
+                else:
+                    probabilities.append(0.0)
+
+        return probabilities
+
+    def completions(self, str prefix="", bint full=True,
+                    bint return_frequency=True):
+        """Return all completions for a given prefix.
+        Parameters
+        ----------
+        prefix : str
+            String that all results returned begin with.
+        full : bool
+            Flag for whether to return results with the prefix appended.
+        return_frequency : bool
+            If true, results will include frequency of each completion.
+        Returns
+        -------
+        Generator
+            Yield str or (str, unsigned int)-tuples (return_frequency=True)
+            sorted by str
+        """
+        cdef:
+            Py_ssize_t length, entry, start
+            const char* data = PyUnicode_AsUTF8AndSize(prefix, &length)
+            list completions = []
+
+        start = 0 if full else length
+        for entry in range(self.size):
+            if self.counts[entry] and self.lengths[entry] > length \
+                    and not memcmp(self.arena + self.offsets[entry],
+                                   data, length):
+                completions.append(
+                    (PyUnicode_DecodeUTF8(
+                        self.arena + self.offsets[entry] + start,
+                        self.lengths[entry] - start, NULL),
+                     self.counts[entry]))
+
+        completions.sort()
+        for completion, frequency in completions:
+            if return_frequency:
+                yield completion, frequency
+            else:
+                yield completion
+
+    def completion_chunks(self, str prefix="", bint full=True,
+                          Py_ssize_t chunksize=65_536):
+        """Return all completions for a given prefix in chunks.
+        Parameters
+        ----------
+        prefix : str
+            String that all results returned begin with.
+        full : bool
+            Flag for whether to return results with the prefix appended.
+        chunksize : int
+            Maximum number of completions per chunk.
+        Returns
+        -------
+        Generator
+            Yield (list of str, array.array of unsigned int)-tuples of
+            completions and their frequencies, sorted by str.
+        """
+        cdef:
+            list completions = list(self.completions(prefix, full))
+            Py_ssize_t start
+
+        if chunksize < 1:
+            msg = f"chunksize must be at least 1, got {chunksize}."
+            raise ValueError(msg)
+
+        for start in range(0, len(completions), chunksize):
+            chunk = completions[start:start + chunksize]
+            yield ([completion for completion, _ in chunk],
+                   array.array("I", [frequency for _, frequency in chunk]))
+
+    def save(self, path, bytes metadata=b""):
+        """Save counts to a binary file.
+        Parameters
+        ----------
+        path : str or path
+            File to write to.
+        metadata : bytes
+            Arbitrary bytes stored along with the counts.
+
+        Notes
+        -----
+        Counts are stored as a CompactTernarySearchTree, so the file
+        can be loaded (or memory-mapped) as a tree as well.
+        """
+        self.to_tree().save(path, metadata)
+
+    @classmethod
+    def load(cls, path):
+        """Load counts from a binary file written by save.
+        Parameters
+        ----------
+        path : str or path
+            File to read from.
+        Returns
+        -------
+        HashCounter
+        """
+        return cls.from_tree(CompactTernarySearchTree.load(path))
+
+    def __reduce__(self):
+        return (_unpickle_counter,
+                (self._splitchar, self.total,
+                 self.arena[:self.arena_size],
+                 array.array("I", [self.lengths[entry]
+                                   for entry in range(self.size)]),
+                 array.array("I", [self.counts[entry]
+                                   for entry in range(self.size)])))
+
+    def __contains__(self, str string):
+        """Adds 'string in counter' syntactic sugar.
+        """
+        return self.frequency(string) or False
+
+    def __iter__(self):
+        """Adds 'for string in counter' syntactic sugar.
+        """
+        return self.completions()
+
+    def __len__(self):
+        """Number of keys (including subsequences) counted.
+        """
+        return self.size
+
+    @property
+    def nbytes(self):
+        """Memory used by the arena, entries and slots in bytes.
+        """
+        return (self.arena_capacity + self.capacity * 24
+                + (self.mask + 1) * sizeof(uint32_t))
+
+    @property
+    def splitchar(self):
+        return self._splitchar
+
+    def _entries(self):
+        """Generator yielding all keys with their counts unsorted.
+        """
+        cdef Py_ssize_t entry
+
+        for entry in range(self.size):
+            yield (PyUnicode_DecodeUTF8(self.arena + self.offsets[entry],
+                                        self.lengths[entry], NULL),
+                   self.counts[entry])
+
+    cdef Py_ssize_t _find(self, const char* data, Py_ssize_t length,
+                          uint64_t hash) noexcept:
+        """Return entry of key or -1 if it is not counted.
+        """
+        cdef:
+            Py_ssize_t slot = hash & self.mask
+            Py_ssize_t entry
+
+        while self.slots[slot]:
+            entry = self.slots[slot] - 1
+            if self.hashes[entry] == hash \
+                    and self.lengths[entry] == length \
+                    and not memcmp(self.arena + self.offsets[entry],
+                                   data, length):
+                return entry
+            slot = (slot + 1) & self.mask
+
+        return -1
+
+    cdef int _add(self, const char* data, Py_ssize_t length,
+                  uint64_t hash, unsigned int frequency) except -1:
+        """Increase count of key by frequency, adding it if needed.
+        """
+        cdef:
+            Py_ssize_t slot = hash & self.mask
+            Py_ssize_t entry
+
+        while self.slots[slot]:
+            entry = self.slots[slot] - 1
+            if self.hashes[entry] == hash \
+                    and self.lengths[entry] == length \
+                    and not memcmp(self.arena + self.offsets[entry],
+                                   data, length):
+                self.counts[entry] += frequency
+                return 0
+            slot = (slot + 1) & self.mask
+
+        if self.size == self.capacity:
+            self._resize(2 * self.capacity)
+            # slots may have been reallocated
+            slot = hash & self.mask
+            while self.slots[slot]:
+                slot = (slot + 1) & self.mask
+        self._reserve(length)
+
+        entry = self.size
+        self.size += 1
+        memcpy(self.arena + self.arena_size, data, length)
+        self.offsets[entry] = self.arena_size
+        self.lengths[entry] = length
+        self.hashes[entry] = hash
+        self.counts[entry] = frequency
+        self.arena_size += length
+
+        # keep the load factor at or below 1/2
+        if 2 * self.size > self.mask + 1:
+            self._rehash(4 * self.size)
+        else:
+            self.slots[slot] = entry + 1
+        return 0
+
+    cdef int _reserve(self, size_t length) except -1:
+        """Ensure that length more bytes fit into the arena.
+        """
+        cdef:
+            size_t capacity = self.arena_capacity or 1024
+            char* arena
+
+        if self.arena_size + length <= self.arena_capacity:
+            return 0
+
+        while self.arena_size + length > capacity:
+            capacity *= 2
+
+        arena = <char*> realloc(self.arena, capacity)
+        if arena is NULL:
+            raise MemoryError()
+        self.arena = arena
+        self.arena_capacity = capacity
+        return 0
+
+    cdef int _resize(self, Py_ssize_t capacity) except -1:
+        """Grow entry arrays to capacity (and slots accordingly).
+        """
+        cdef:
+            void* offsets
+            void* lengths
+            void* hashes
+            void* counts
+
+        capacity = max(capacity, 16)
+        offsets = realloc(self.offsets, capacity * sizeof(uint64_t))
+        if offsets is not NULL:
+            self.offsets = <uint64_t*> offsets
+        lengths = realloc(self.lengths, capacity * sizeof(uint32_t))
+        if lengths is not NULL:
+            self.lengths = <uint32_t*> lengths
+        hashes = realloc(self.hashes, capacity * sizeof(uint64_t))
+        if hashes is not NULL:
+            self.hashes = <uint64_t*> hashes
+        counts = realloc(self.counts, capacity * sizeof(unsigned int))
+        if counts is not NULL:
+            self.counts = <unsigned int*> counts
+
+        if offsets is NULL or lengths is NULL or hashes is NULL \
+                or counts is NULL:
+            raise MemoryError()
+
+        self.capacity = capacity
+        if 2 * capacity > self.mask + 1:
+            self._rehash(2 * capacity)
+        return 0
+
+    cdef int _rehash(self, Py_ssize_t minimum) except -1:
+        """Reallocate slots (a power of two, at least minimum) and
+        reinsert all entries by their stored hashes.
+        """
+        cdef:
+            Py_ssize_t number = 16
+            Py_ssize_t entry, slot
+            uint32_t* slots
+
+        while number < minimum:
+            number *= 2
+
+        slots = <uint32_t*> malloc(number * sizeof(uint32_t))
+        if slots is NULL:
+            raise MemoryError()
+        for slot in range(number):
+            slots[slot] = 0
+
+        free(self.slots)
+        self.slots = slots
+        self.mask = number - 1
+
+        for entry in range(self.size):
+            slot = self.hashes[entry] & self.mask
+            while self.slots[slot]:
+                slot = (slot + 1) & self.mask
+            self.slots[slot] = entry + 1
+        return 0
+
+
+cdef class CountMinSketch():
+    """Approximate counts for n-grams and their subsequences in a
+    Count-Min sketch (Cormode & Muthukrishnan, 2005) with conservative
+    update, stored in a NumPy array of fixed size.
+
+    Counts are never underestimated. With probability 1 - delta, a
+    count is overestimated by at most epsilon times the total of all
+    counts inserted. Sketches of the same size can be merged by adding
+    their arrays. Keys are not stored, so there are no completions.
+    """
+    cdef:
+        readonly object table
+        unsigned int[:, ::1] _table
+        Py_ssize_t width
+        Py_ssize_t depth
+        readonly double epsilon
+        readonly double delta
+        str _splitchar
+        bytes _split
+        public unsigned int total
+
+    def __init__(self, splitchar=None, double epsilon=1e-5,
+                 double delta=1e-3):
+        """Initializes CountMinSketch.
+        Parameters
+        ----------
+        splitchar : str
+            String that separates tokens in n-gram.
+            Counts are stored for complete n-grams and
+            each subsequence ending before this string
+        epsilon : float
+            Error bound relative to the total count. Determines the
+            width of the sketch, ceil(e / epsilon).
+        delta : float
+            Probability of exceeding the error bound. Determines the
+            number of rows of the sketch, ceil(ln(1 / delta)).
+        """
+        if not (0 < epsilon < 1 and 0 < delta < 1):
+            msg = "epsilon and delta must be between 0 and 1."
+            raise ValueError(msg)
+
+        self.epsilon = epsilon
+        self.delta = delta
+        self.width = <Py_ssize_t> ceil(M_E / epsilon)
+        self.depth = <Py_ssize_t> ceil(log(1 / delta))
+        self.table = np.zeros((self.depth, self.width), dtype=np.uintc)
+        self._table = self.table
+        self._splitchar = splitchar
+        self._split = splitchar.encode("utf-8") if splitchar else b""
+        self.total = 0
+
+    cpdef void insert(self, str string,
+                      unsigned int frequency=1,
+                      bint subsequences=True):
+        """Insert string into sketch.
+        Parameters
+        ----------
+        string : str
+            String to be inserted
+        frequency : unsigned int
+            Count (default 1)
+        subsequences : bool
+            If True, counts of subsequences (ending before splitchar)
+            are increased as well
+        """
+        cdef:
+            Py_ssize_t length, idx
+            const char* data
+            const char* split = self._split
+            Py_ssize_t split_length = len(self._split)
+            uint64_t state = FNV_OFFSET
+
+        self.total += frequency
+        if not string:
+            return
+
+        data = PyUnicode_AsUTF8AndSize(string, &length)
+
+        if subsequences and split_length:
+            for idx in range(length):
+                if idx and data[idx] == split[0] \
+                        and idx + split_length <= length \
+                        and not memcmp(data + idx, split, split_length):
+                    self._add(_finalize(state), frequency)
+                state = (state ^ <unsigned char> data[idx]) * FNV_PRIME
+        else:
+            state = _fnv(state, data, length)
+
+        self._add(_finalize(state), frequency)
+
+    def insert_many(self, items, counts=None, bint subsequences=True):
+        """Insert many strings into sketch in a single call.
+        Parameters
+        ----------
+        items : iterable of (str, unsigned int)-tuples or of str
+            Strings with their frequencies or, if counts are
+            given separately, only the strings.
+        counts : iterable of unsigned int
+            Frequencies of the strings in items (default None)
+        subsequences : bool
+            If True, counts of subsequences (divided by splitchar)
+            are increased as well
+        """
+        cdef unsigned int frequency
+
+        if counts is not None:
+            items = zip(items, counts)
+
+        for string, frequency in items:
+            self.insert(string if type(string) is str else _as_str(string),
+                        frequency, subsequences)
+
+    def merge(self, other):
+        """Add all counts of another sketch to this sketch.
+        Parameters
+        ----------
+        other : CountMinSketch
+            Sketch with the same epsilon and delta.
+
+        Notes
+        -----
+        Arrays are added, which keeps the error bound for the summed
+        total, but not the tighter estimates of conservative update.
+        Sums are capped at the largest unsigned int instead of
+        wrapping around, so counts are still never underestimated
+        below that cap.
+        """
+        if not isinstance(other, CountMinSketch) \
+                or other.table.shape != self.table.shape:
+            msg = "Can only merge sketches of the same size."
+            raise ValueError(msg)
+
+        summed = np.add(self.table, other.table, dtype=np.uint64)
+        np.minimum(summed, UINT_MAX, out=summed)
+        self.table[...] = summed
+        self.total = min(<unsigned long long> self.total + other.total,
+                         UINT_MAX)
+
+    def __iadd__(self, other):
+        """Adds 'sketch += other' syntactic sugar for merge.
+        """
+        self.merge(other)
+        return self
+
+    def rebalance(self):
+        """Does nothing, as sketches need no rebalancing.
+        """
+
+    cpdef unsigned int frequency(self, str string):
+        """Return estimated frequency of string.
+        Parameters
+        ----------
+        string : str
+            String to be looked up
+        Returns
+        -------
+        unsigned int
+            Frequency, which is never lower than the true frequency
+        """
+        cdef:
+            Py_ssize_t length
+            const char* data
+
+        if not string:
+            return self.total
+
+        data = PyUnicode_AsUTF8AndSize(string, &length)
+        return self._estimate(_finalize(_fnv(FNV_OFFSET, data, length)))
+
+    def conditional_probabilities(self, sequences, unsigned int n):
+        """Return probability of each token given the up to n - 1
+        tokens preceding it.
+        Parameters
+        ----------
+        sequences : iterable of list of str
+            Token sequences, joined by splitchar to form keys.
+        n : unsigned int
+            Size of n-grams.
+        Returns
+        -------
+        array.array
+            Probabilities (as doubles) of all tokens of all sequences.
+        """
+        cdef:
+            array.array probabilities = array.array("d")
+            str split = self._splitchar or ""
+            list tokens
+            Py_ssize_t idx, start
+            unsigned int context, frequency
+
+        for tokens in sequences:
+            for idx in range(len(tokens)):
+                start = idx - n + 1 if idx >= n else 0
+                context = self.frequency(split.join(tokens[start:idx]))
+                frequency = self.frequency(split.join(tokens[start:idx + 1]))
+                if frequency and context:
+                    probabilities.append(<double> frequency / context)
+                else:
+                    probabilities.append(0.0)
+
+        return probabilities
+
+    def completions(self, str prefix="", bint full=True,
+                    bint return_frequency=True):
+        """Not available, as keys are not stored.
+        """
+        msg = "Count-min sketches do not store keys, so they " \
+              "have no completions."
+        raise TypeError(msg)
+
+    def completion_chunks(self, str prefix="", bint full=True,
+                          Py_ssize_t chunksize=65_536):
+        """Not available, as keys are not stored.
+        """
+        msg = "Count-min sketches do not store keys, so they " \
+              "have no completions."
+        raise TypeError(msg)
+
+    def translate(self, table):
+        """Not available, as keys are not stored.
+        """
+        msg = "Count-min sketches do not store keys, so they " \
+              "cannot be translated."
+        raise TypeError(msg)
+
+    def prune(self, unsigned int min_count=0, max_entries=None, keys=()):
+        """Not available, as sketches have a fixed size.
+        """
+        msg = "Count-min sketches have a fixed size and cannot be pruned."
+        raise TypeError(msg)
+
+    def save(self, path, bytes metadata=b""):
+        """Not available, as sketches cannot be stored as trees.
+        Pickle sketches instead.
+        """
+        msg = "Count-min sketches cannot be saved as trees, " \
+              "pickle them instead."
+        raise TypeError(msg)
+
+    def __reduce__(self):
+        return (_unpickle_sketch,
+                (self._splitchar, self.epsilon, self.delta,
+                 self.table, self.total))
+
+    def __contains__(self, str string):
+        """Adds 'string in sketch' syntactic sugar.
+        """
+        return self.frequency(string) or False
+
+    @property
+    def nbytes(self):
+        """Memory used by the array in bytes.
+        """
+        return self.table.nbytes
+
+    @property
+    def splitchar(self):
+        return self._splitchar
+
+    cdef inline Py_ssize_t _column(self, uint64_t hash,
+                                   Py_ssize_t row) noexcept:
+        """Column of hash in row, by double hashing of its two halves.
+        """
+        return ((hash & 0xffffffffULL)
+                + row * ((hash >> 32) | 1)) % self.width
+
+    cdef unsigned int _estimate(self, uint64_t hash) noexcept:
+        cdef:
+            Py_ssize_t row
+            unsigned int count, minimum = UINT_MAX
+
+        for row in range(self.depth):
+            count = self._table[row, self._column(hash, row)]
+            if count < minimum:
+                minimum = count
+
+        return minimum
+
+    cdef void _add(self, uint64_t hash, unsigned int frequency) noexcept:
+        """Conservative update: raise counters only as far as needed
+        for the new minimum estimate.
+        """
+        cdef:
+            Py_ssize_t row, column
+            unsigned int estimate = self._estimate(hash) + frequency
+
+        # cap at the largest count instead of wrapping around
+        if estimate < frequency:
+            estimate = UINT_MAX
+
+        for row in range(self.depth):
+            column = self._column(hash, row)
+            if self._table[row, column] < estimate:
+                self._table[row, column] = estimate
+
+
+def _unpickle_counter(splitchar, unsigned int total, bytes arena,
+                      array.array lengths, array.array counts):
+    cdef:
+        HashCounter counter = HashCounter(splitchar, len(lengths))
+        const char* data = arena
+        Py_ssize_t entry, offset = 0, length
+
+    for entry in range(len(lengths)):
+        length = lengths[entry]
+        counter._add(data + offset, length,
+                     _finalize(_fnv(FNV_OFFSET, data + offset, length)),
+                     counts[entry])
+        offset += length
+
+    counter.total = total
+    return counter
+
+
+def _unpickle_sketch(splitchar, double epsilon, double delta,
+                     table, unsigned int total):
+    cdef CountMinSketch sketch = CountMinSketch(splitchar, epsilon, delta)
+    sketch.table[...] = table
+    sketch.total = total
+    return sketch
@@ -1,3 +1,5 @@
+from bisect import bisect_left
+
 import numpy as np
 
 
@@ -32,27 +34,71 @@ def recursive_median(array):
     Returns the element that comes closest to the median
     the array, then the elements that comes closest to the median of each
     half of the array split on the first element and so forth.
+    Index ranges are kept on an explicit stack rather than recursing
+    into slices, so the array is never copied.
+    """
+    for idx, _, _ in median_splits(array):
+        yield idx
+
+
+def median_splits(array):
+    """Returns indices for recursive median splits of an array
+    with the binary search tree they form.
+
+    Parameters
+    ----------
+    array : np.array
+        Probabilities, cumulative from left to right
+
+    Yields
+    ------
+    tuple of int
+        Index in the order of recursive_median, index of its parent in
+        the tree (-1 for the root) and whether it is the left (0) or
+        right (1) child of its parent.
+    """
+    cumulative = np.asarray(array).tolist()
+    ranges = [(0, len(cumulative), -1, 0)]
+
+    while ranges:
+        start, stop, parent, side = ranges.pop()
+
+        if stop - start == 3:
+            yield start + 1, parent, side
+            yield start, start + 1, 0
+            yield start + 2, start + 1, 1
+
+        elif stop - start == 2:
+            yield start, parent, side
+            yield start + 1, start, 1
+
+        elif stop - start == 1:
+            yield start, parent, side
+
+        elif stop - start > 3:
+            median_idx = start + _median_element(cumulative, start, stop)
+            yield median_idx, parent, side
+
+            # left half is split first
+            ranges.append((median_idx + 1, stop, median_idx, 1))
+            ranges.append((start, median_idx, median_idx, 0))
+
+
+def _median_element(cumulative, start, stop):
+    """Same as median_element for cumulative[start:stop],
+    without slicing the list.
     """
-    if len(array) == 3:
-        yield 1
-        yield 0
-        yield 2
-
-    elif len(array) == 2:
-        yield 0
-        yield 1
-
-    elif len(array) == 1:
-        yield 0
-
-    else:
-        median_idx = median_element(array)
-        yield median_idx
-
-        for idx in recursive_median(array[:median_idx]):
-            yield idx
-        for idx in recursive_median(array[median_idx + 1:]):
-            yield median_idx + idx + 1
+    mid = (cumulative[start] + cumulative[stop - 1]) / 2
+    mid_idx = bisect_left(cumulative, mid, start, stop) - start
+
+    if not mid_idx:
+        return mid_idx
+
+    if (cumulative[start + mid_idx] - mid) \
+            >= (mid - cumulative[start + mid_idx - 1]):
+        return mid_idx - 1
+
+    return mid_idx
 
 
 def median_split_vocabulary(frequencies):
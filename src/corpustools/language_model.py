@@ -1,6 +1,23 @@
-from collections import deque
-from .tst import TernarySearchTree
-from .corpustools import extract_fields, ContainsEverything
+import math
+import pickle
+import time
+
+from collections import deque, Counter
+from functools import lru_cache
+from itertools import islice
+from multiprocessing import Pool
+
+import numpy as np
+from .tst import TernarySearchTree, CompactTernarySearchTree, read_metadata
+from .hashcounter import CountMinSketch, HashCounter
+from .corpustools import extract_fields, extract_units, ContainsEverything
+from .encoding import TokenEncoder, SEPARATOR, translation
+from .smoothing import ESTIMATORS
+
+BACKENDS = {"tst": TernarySearchTree,
+            "compact": CompactTernarySearchTree,
+            "hash": HashCounter,
+            "sketch": CountMinSketch}
 
 
 class LanguageModel():
@@ -26,10 +43,20 @@ class LanguageModel():
         e.g. sentence </s> or document </doc> meta tags
     splitchar : str
         String that separates tokens in n-grams
+    backend : str or callable
+        Tree that stores the counts, see BACKENDS
+    cache_size : int
+        Number of frequencies kept in the LRU cache
+    estimator : Estimator
+        Estimator of probabilities, maximum likelihood if None
+    encoder : TokenEncoder
+        Token ids if tokens are interned, otherwise None
     """
 
     def __init__(self, n, boundary="</s>", splitchar="#",
-                 vocabulary=None, targets=None, must_contain=None):
+                 vocabulary=None, targets=None, must_contain=None,
+                 backend="tst", cache_size=0, estimator=None,
+                 intern_tokens=False):
         """
         Parameters
         ----------
@@ -50,33 +77,117 @@ class LanguageModel():
         must_contain : container
             If provided, only n-grams containing at least one word in
             must_contain are counted
+        backend : str or callable
+            Tree that stores the counts: "tst" (default) for a tree of
+            node objects, "compact" for a tree stored in contiguous
+            arrays, which needs several times less memory, "hash"
+            for a hash table (see hashcounter.HashCounter), which is
+            faster to train and query, but sorts all n-grams whenever
+            completions are requested, or "sketch" for approximate
+            counts in constant memory (see hashcounter.CountMinSketch),
+            which has no completions. A callable is called with the
+            splitchar to create the counts, e.g. to set the error bounds
+            of a sketch with functools.partial(CountMinSketch,
+            epsilon=1e-6). It must be picklable to train with multiple
+            processes.
+        cache_size : int
+            If larger than 0, frequencies of n-grams and contexts looked
+            up to calculate probabilities are kept in an LRU cache of
+            this size. Cache statistics are returned by cache_info().
+            The cache is cleared whenever counts change.
+        estimator : str or Estimator
+            If provided, probabilities are smoothed by an estimator from
+            the smoothing module or its name in smoothing.ESTIMATORS
+            ("kneser-ney", "katz" or "stupid-backoff"). Otherwise,
+            maximum likelihood estimates are returned. Estimators are
+            fitted to the counts on the first probability queried after
+            counts changed.
+        intern_tokens : bool
+            If True, tokens are mapped to dense integer ids, which are
+            stored as single characters for the first 2 ** 20 tokens
+            and as slightly longer codes beyond (see
+            encoding.TokenEncoder). Every n-gram then takes about
+            2n - 1 steps in the tree regardless of token length, and
+            tokens may contain splitchar. N-grams
+            passed as strings are still split on splitchar.
 
         Notes
         -----
         If must_contain is provided, probabilities will be inaccurate. Only
         use for counting target n-gram frequencies.
         """
+        if not callable(backend) and backend not in BACKENDS:
+            msg = f"Unknown backend '{backend}', " \
+                  f"choose one of {', '.join(BACKENDS)}."
+            raise ValueError(msg)
+
+        if isinstance(estimator, str):
+            if estimator not in ESTIMATORS:
+                msg = f"Unknown estimator '{estimator}', " \
+                      f"choose one of {', '.join(ESTIMATORS)}."
+                raise ValueError(msg)
+            estimator = ESTIMATORS[estimator]()
+
         if not targets:
             targets = ContainsEverything()
 
         if not vocabulary:
             vocabulary = ContainsEverything()
 
+        counts = BACKENDS.get(backend, backend) \
+            if isinstance(backend, str) else backend
+
+        if intern_tokens:
+            self._encoder = TokenEncoder()
+            self._counts = counts(SEPARATOR)
+        else:
+            self._encoder = None
+            self._counts = counts(splitchar)
+
         self._n = n
-        self._counts = TernarySearchTree(splitchar)
         self._vocabulary = vocabulary
         self._targets = targets
         self._boundary = boundary
         self._splitchar = splitchar
         self._must_contain = must_contain
+        self._backend = backend
+        self._cache_size = cache_size
+        self._estimator = estimator
+        self._fitted = False
 
-    def train(self, sequence):
+        if cache_size:
+            self._lookup = lru_cache(maxsize=cache_size)(self._frequency)
+        else:
+            self._lookup = self._frequency
+
+    def train(self, sequence, number_of_processes=1, chunksize=10_000,
+              max_entries=None, prune_every=1_000_000, rebalance_every=None):
         """Train model on all n-grams in sequence.
 
         Parameters
         ----------
         sequence : iterable of str
             Sequence of tokens to train on.
+        number_of_processes : int
+            Number of processes to use. If larger than 1, sequence is
+            split into chunks after every chunksize boundaries, which
+            are counted separately and merged into the model.
+        chunksize : int
+            Number of units (separated by boundary) per chunk.
+        max_entries : int
+            If given, the model is pruned to the max_entries most
+            frequent n-grams (see prune) after every prune_every tokens
+            and at the end, so memory stays bounded on unbounded
+            streams. Counts of n-grams that were pruned and seen again
+            start from zero, so they are lower bounds.
+        prune_every : int
+            Number of tokens between prunings. With multiple processes,
+            pruning happens after merging chunks of at least as many
+            tokens.
+        rebalance_every : int
+            If given, trees are rebalanced (see rebalance) after every
+            rebalance_every tokens, counted like prune_every, and at
+            the end.
 
         Notes
         -----
@@ -87,9 +198,23 @@ class LanguageModel():
           [C, D, E]
           [D, E]
           [E]
+        As n-grams do not cross boundaries, counts are identical for
+        any number_of_processes.
         """
+        self._invalidate()
+
+        if number_of_processes > 1:
+            self._train_parallel(sequence, number_of_processes, chunksize,
+                                 max_entries, prune_every, rebalance_every)
+            return
+
         n_gram = deque(maxlen=self.n)
-        for element in sequence:
+        for position, element in enumerate(sequence, 1):
+            if max_entries is not None and not position % prune_every:
+                self._counts.prune(max_entries=max_entries)
+            if rebalance_every and not position % rebalance_every:
+                self._counts.rebalance()
+
             if element == self.boundary:
                 # train on smaller n-grams at end of sentence
                 # but exclude full n_gram if it was already trained
@@ -117,6 +242,22 @@ class LanguageModel():
         for length in range(1, len(n_gram) + 1):
             self._train(list(n_gram)[-length:])
 
+        if max_entries is not None:
+            self._counts.prune(max_entries=max_entries)
+        if rebalance_every:
+            self._counts.rebalance()
+
+    def rebalance(self):
+        """Rebalance the tree that stores the counts, so frequent
+        n-grams are found in fewer steps. Trees filled in corpus order
+        can degrade into long chains of siblings.
+
+        Notes
+        -----
+        Other backends need no rebalancing and are left unchanged.
+        """
+        self._counts.rebalance()
+
     def insert_sequence(self, counts,
                         is_string=True, subsequences=False):
         """Increase counts of sequence of ngrams by their frequencies.
@@ -136,8 +277,18 @@ class LanguageModel():
             e.g. for "my#shiny#trigram", subsequences are
             "my#shiny" and "my"
         """
-        for ngram, frequency in counts:
-            self.insert(ngram, frequency, is_string, subsequences)
+        if self.encoder is not None:
+            if is_string:
+                counts = ((ngram.split(self.splitchar), frequency)
+                          for ngram, frequency in counts)
+            counts = ((self._key(ngram, add=True), frequency)
+                      for ngram, frequency in counts)
+        elif not is_string:
+            counts = ((self.splitchar.join(ngram), frequency)
+                      for ngram, frequency in counts)
+
+        self._invalidate()
+        self._counts.insert_many(counts, subsequences=subsequences)
 
     def insert(self, ngram, frequency,
                is_string=True, subsequences=False):
@@ -159,12 +310,71 @@ class LanguageModel():
             e.g. for "my#shiny#trigram", subsequences are
             "my#shiny" and "my"
         """
-        if not is_string:
+        if self.encoder is not None:
+            if is_string:
+                ngram = ngram.split(self.splitchar)
+            ngram = self._key(ngram, add=True)
+        elif not is_string:
             ngram = self.splitchar.join(ngram)
 
+        self._invalidate()
         self._counts.insert(ngram, frequency,
                             subsequences)
 
+    def merge(self, other):
+        """Add all counts of another model to this model.
+
+        Parameters
+        ----------
+        other : LanguageModel
+            Model trained with the same splitchar, e.g. on another
+            part of the corpus.
+        """
+        if other.splitchar != self.splitchar:
+            msg = "Cannot merge models with different splitchar!"
+            raise ValueError(msg)
+
+        if (other.encoder is None) != (self.encoder is None):
+            msg = "Cannot merge models with and without interned tokens!"
+            raise ValueError(msg)
+
+        self._invalidate()
+        self._merge_counts(other._counts, other.encoder)
+
+    def prune(self, min_count=0, max_entries=None, threshold=None):
+        """Remove n-grams with low counts or little effect on
+        probabilities to bound memory.
+
+        Parameters
+        ----------
+        min_count : int
+            N-grams counted fewer times are removed.
+        max_entries : int
+            If given, the least frequent n-grams are removed until at
+            most max_entries n-grams (of any size) are left.
+        threshold : float
+            If given, n-grams of size n are removed if their weighted
+            difference (Seymore & Rosenfeld, 1996) is below threshold:
+            P(context, token) * log(P(token | context) /
+            P(token | context without its first token))
+
+        Notes
+        -----
+        Counts of remaining n-grams and the total are unchanged, so
+        probabilities of tokens following a context from which n-grams
+        were removed no longer sum to 1 under maximum likelihood.
+        """
+        keys = ()
+        if threshold is not None and self.n > 1:
+            keys = [self._key(n_gram) for n_gram, frequency
+                    in self._n_grams()
+                    if len(n_gram) == self.n
+                    and self._weighted_difference(n_gram, frequency)
+                    < threshold]
+
+        self._invalidate()
+        self._counts.prune(min_count, max_entries, keys)
+
     def probability(self, sequence, predict_all=False):
         """Returns probability of the sequence.
 
@@ -204,6 +414,140 @@ class LanguageModel():
             probability = self._probability(n_gram)
             return probability
 
+    def probabilities_batch(self, sequences, per_sequence=False, log=False):
+        """Returns probabilities of all tokens in many sequences.
+
+        Parameters
+        ----------
+        sequences : iterable of iterables of str
+            Sequences of tokens to get the probabilities for
+        per_sequence : bool
+            Return one probability per sequence (the product of the
+            probabilities of its tokens) rather than one per token.
+        log : bool
+            Return natural logarithms of probabilities.
+
+        Returns
+        -------
+        np.array
+            Probabilities of all tokens of all sequences in order or
+            (per_sequence=True) probability of each sequence.
+
+        Notes
+        -----
+        Per-token probabilities are the same as those returned by
+        probability(sequence, predict_all=True). Unless an estimator or
+        must_contain is set, lookups for all sequences are done in a
+        single call into the tree.
+        """
+        sequences = [list(sequence) for sequence in sequences]
+
+        if self.must_contain or self.estimator:
+            probabilities = [probability for sequence in sequences
+                             for probability in
+                             self.probability(sequence, predict_all=True)]
+            probabilities = np.array(probabilities, dtype=np.float64)
+        else:
+            probabilities = self._counts.conditional_probabilities(
+                self._encode(sequences), self.n)
+            probabilities = np.frombuffer(probabilities, dtype=np.float64)
+
+        if not (log or per_sequence):
+            return probabilities
+
+        with np.errstate(divide="ignore"):
+            log_probabilities = np.log(probabilities)
+
+        if per_sequence:
+            lengths = [len(sequence) for sequence in sequences]
+            indices = np.repeat(np.arange(len(sequences)), lengths)
+            log_probabilities = np.bincount(indices,
+                                            weights=log_probabilities,
+                                            minlength=len(sequences))
+
+            if not log:
+                return np.exp(log_probabilities)
+
+        return log_probabilities
+
+    def evaluate(self, corpus, number_of_processes=1, chunksize=1_000,
+                 **kwargs):
+        """Evaluate model on a held-out corpus in constant memory.
+
+        Parameters
+        ----------
+        corpus : iterable of str, binary file or path
+            Lines of a tagged corpus, typically an opened file
+            or a path to a possibly compressed file
+        number_of_processes : int
+            Number of processes to use. If larger than 1, each process
+            gets a copy of the counts and scores chunks of units.
+        chunksize : int
+            Number of units (separated by self.boundary) scored at once
+
+        Returns
+        -------
+        dict
+            Number of units, tokens, oov (tokens never seen in training)
+            and zero_probability (known tokens with probability 0),
+            summed natural log_probability of all other tokens,
+            cross_entropy (bits per token), perplexity, oov_rate and
+            tokens_per_second.
+
+        Notes
+        -----
+        Other keyword arguments are passed on to extract_units.
+        Units are scored with probabilities_batch, so context does not
+        cross boundaries, as in training. Out-of-vocabulary and
+        zero-probability tokens are excluded from cross entropy and
+        perplexity. Estimators are fitted separately in each process.
+        """
+        start = time.perf_counter()
+        units = extract_units(corpus, boundary=self.boundary, **kwargs)
+        chunks = iter(lambda: list(islice(units, chunksize)), [])
+        statistics = Counter(units=0, tokens=0, oov=0, zero_probability=0,
+                             log_probability=0.0)
+
+        if number_of_processes > 1:
+            pending = deque()
+            with Pool(number_of_processes, initializer=_init_evaluator,
+                      initargs=(self._settings(), self._counts,
+                                self.encoder)) as pool:
+                for chunk in chunks:
+                    pending.append(pool.apply_async(_evaluate_chunk,
+                                                    (chunk,)))
+
+                    # bound the number of chunks held in memory
+                    if len(pending) >= 2 * number_of_processes:
+                        statistics.update(pending.popleft().get())
+
+                while pending:
+                    statistics.update(pending.popleft().get())
+        else:
+            for chunk in chunks:
+                statistics.update(self._evaluate(chunk))
+
+        statistics = dict(statistics)
+        scored = statistics["tokens"] - statistics["oov"] \
+            - statistics["zero_probability"]
+        elapsed = time.perf_counter() - start
+
+        if scored:
+            cross_entropy = -statistics["log_probability"] \
+                / scored / math.log(2)
+            statistics["cross_entropy"] = cross_entropy
+            statistics["perplexity"] = 2 ** cross_entropy
+        else:
+            statistics["cross_entropy"] = math.nan
+            statistics["perplexity"] = math.nan
+
+        tokens = statistics["tokens"]
+        statistics["oov_rate"] = statistics["oov"] / tokens \
+            if tokens else math.nan
+        statistics["tokens_per_second"] = tokens / elapsed \
+            if elapsed else math.inf
+        return statistics
+
     def all_target_probabilities(self, return_n_gram=False, sizes=None):
         """Generator yielding probabilities and frequencies
         of all encountered targets.
@@ -224,9 +568,7 @@ class LanguageModel():
         if not sizes:
             sizes = [self.n]
 
-        for n_gram_string, frequency in self.completions():
-            n_gram = n_gram_string.split(self.splitchar)
-
+        for n_gram, frequency in self._n_grams():
             if len(n_gram) not in sizes:
                 continue
 
@@ -257,8 +599,7 @@ class LanguageModel():
             if not any(word in self.must_contain for word in n_gram):
                 return 0
 
-        n_gram_string = self.splitchar.join(n_gram)
-        frequency = self._counts.frequency(n_gram_string)
+        frequency = self._lookup(self._key(n_gram))
         return frequency
 
     def completions(self, prefix=""):
@@ -267,22 +608,247 @@ class LanguageModel():
         Parameters
         ----------
         prefix : str
-            Prefix that all results returned begin with.
+            Prefix that all results returned begin with. If tokens
+            are interned, it must consist of complete tokens.
 
         Yields
         -------
         Tuple
             Each complete n-gram with frequency as a (str, int)-tuple
         """
+        if not self.must_contain and self.encoder is None:
+            yield from self._counts.completions(prefix)
+            return
+
+        for n_gram, frequency in self._n_grams(prefix):
+            yield self.splitchar.join(n_gram), frequency
+
+    def save(self, path):
+        """Save model to a binary file that can be memory-mapped.
+
+        Parameters
+        ----------
+        path : str or path
+            File to write to.
+
+        Notes
+        -----
+        Counts are stored as a flattened tree, the other attributes
+        (vocabulary, targets, ...) are pickled into the same file.
+        """
+        settings = self._settings()
+        if self.encoder is not None:
+            settings["tokens"] = self.encoder.tokens
+        self._counts.save(path, metadata=pickle.dumps(settings))
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load model from a file written by save.
+
+        Parameters
+        ----------
+        path : str or path
+            File to read from.
+        mmap : bool
+            If True, counts are memory-mapped read-only rather than
+            read into memory, so opening takes constant time and
+            processes loading the same file share one copy.
+
+        Returns
+        -------
+        LanguageModel
+
+        Notes
+        -----
+        Memory-mapped counts always use the "compact" backend. They are
+        copied into memory once the model is trained further. Counts of
+        a callable backend are loaded into the "compact" backend, too.
+        Only load files from trusted sources, as attributes are unpickled.
+        """
+        settings = pickle.loads(read_metadata(path))
+        tokens = settings.pop("tokens", ())
+
+        if mmap or not isinstance(settings["backend"], str) \
+                or settings["backend"] == "compact":
+            settings["backend"] = "compact"
+            counts = CompactTernarySearchTree.load(path, mmap=mmap)
+        else:
+            counts = BACKENDS[settings["backend"]].load(path)
+
+        lm = cls(**settings)
+        lm._counts = counts
+        if lm.encoder is not None:
+            lm.encoder.update(tokens)
+        return lm
+
+    def cache_info(self):
+        """Returns statistics of the frequency cache.
+
+        Returns
+        -------
+        namedtuple or None
+            Hits, misses, maxsize and currsize of the cache
+            or None if caching is disabled.
+        """
+        if not self.cache_size:
+            return None
+
+        return self._lookup.cache_info()
+
+    def _key(self, n_gram, add=False):
+        """Return key of n_gram in the tree.
+        """
+        if self.encoder is not None:
+            return self.encoder.key(n_gram, add)
+
+        return self.splitchar.join(n_gram)
+
+    def _encode(self, sequences):
+        """Return sequences with interned tokens replaced by their
+        codes (sequences as lists).
+        """
+        if self.encoder is None:
+            return sequences
+
+        return [self.encoder.codes(sequence) for sequence in sequences]
+
+    def _n_grams(self, prefix=""):
+        """Generator yielding all n-grams (containing a word in
+        must_contain if provided) as lists of tokens with frequencies.
+        """
+        if self.encoder is None:
+            split = self.splitchar
+            chunks = self._counts.completion_chunks(prefix)
+            n_grams = ((key.split(split), frequency)
+                       for keys, frequencies in chunks
+                       for key, frequency in zip(keys, frequencies))
+        else:
+            if prefix:
+                *tokens, last = prefix.split(self.splitchar)
+                prefix = self._key(tokens + [last] if last else tokens)
+                if tokens and not last:
+                    prefix += SEPARATOR
+
+            decode = self.encoder.decode
+            chunks = self._counts.completion_chunks(prefix)
+            n_grams = ((decode(key), frequency)
+                       for keys, frequencies in chunks
+                       for key, frequency in zip(keys, frequencies))
+
         if not self.must_contain:
-            return self._counts.completions(prefix)
+            yield from n_grams
+            return
 
-        for completion, frequency in self._counts.completions(prefix):
-            completion_ = completion.split("#")
-            if not any(word in self.must_contain for word in completion_):
-                continue
+        for n_gram, frequency in n_grams:
+            if any(word in self.must_contain for word in n_gram):
+                yield n_gram, frequency
+
+    def _merge_counts(self, counts, encoder=None):
+        """Add counts to model, translating keys from the token ids
+        of encoder to those of the model if needed.
+        """
+        if encoder is not None:
+            table = self.encoder.update(encoder.tokens)
+            if table:
+                counts = counts.translate(translation(table))
+
+        # trees cannot merge hash tables, but hash tables can merge trees
+        if isinstance(counts, HashCounter) \
+                and not isinstance(self._counts, HashCounter):
+            counts = counts.to_tree(type(self._counts))
+
+        self._counts.merge(counts)
 
-            yield completion, frequency
+    def _weighted_difference(self, n_gram, frequency):
+        """Returns the weighted difference in log probability
+        of an n-gram and its suffix.
+        """
+        context = self.frequency(n_gram[:-1])
+        lower = self.frequency(n_gram[1:])
+        lower_context = self.frequency(n_gram[1:-1])
+        if not (context and lower and lower_context):
+            return math.inf
+
+        return frequency / self.frequency([]) \
+            * math.log(frequency * lower_context / (context * lower))
+
+    def _evaluate(self, units):
+        """Returns evaluation statistics of a list of units.
+        """
+        log_probabilities = self.probabilities_batch(units, log=True)
+        # a token is out of vocabulary if its unigram frequency is 0
+        known = np.frombuffer(
+            self._counts.conditional_probabilities(self._encode(units), 1),
+            dtype=np.float64) > 0
+        scored = known & np.isfinite(log_probabilities)
+
+        return {"units": len(units),
+                "tokens": len(log_probabilities),
+                "oov": int(np.count_nonzero(~known)),
+                "zero_probability": int(np.count_nonzero(known & ~scored)),
+                "log_probability": float(log_probabilities[scored].sum())}
+
+    def _frequency(self, n_gram_string):
+        return self._counts.frequency(n_gram_string)
+
+    def _invalidate(self):
+        """Drops cached frequencies after counts changed.
+        """
+        if self.cache_size:
+            self._lookup.cache_clear()
+        self._fitted = False
+
+    def _settings(self):
+        """Return keyword arguments to create an untrained copy of model.
+        """
+        return {"n": self.n,
+                "boundary": self.boundary,
+                "splitchar": self.splitchar,
+                "vocabulary": self.vocabulary,
+                "targets": self.targets,
+                "must_contain": self.must_contain,
+                "backend": self.backend,
+                "cache_size": self.cache_size,
+                "estimator": self.estimator,
+                "intern_tokens": self.encoder is not None}
+
+    def _train_parallel(self, sequence, number_of_processes, chunksize,
+                        max_entries=None, prune_every=1_000_000,
+                        rebalance_every=None):
+        chunks = chunk_sequence(sequence, self.boundary, chunksize)
+        pending = deque()
+        unpruned = unbalanced = 0
+
+        def merge_next():
+            nonlocal unpruned, unbalanced
+            length, result = pending.popleft()
+            self._merge_counts(*result.get())
+            unpruned += length
+            unbalanced += length
+            if max_entries is not None and unpruned >= prune_every:
+                self._counts.prune(max_entries=max_entries)
+                unpruned = 0
+            if rebalance_every and unbalanced >= rebalance_every:
+                self._counts.rebalance()
+                unbalanced = 0
+
+        with Pool(number_of_processes, initializer=_init_worker,
+                  initargs=(self._settings(),)) as pool:
+            for chunk in chunks:
+                pending.append((len(chunk),
+                                pool.apply_async(_train_chunk, (chunk,))))
+
+                # bound the number of chunks held in memory
+                if len(pending) >= 2 * number_of_processes:
+                    merge_next()
+
+            while pending:
+                merge_next()
+
+        if max_entries is not None:
+            self._counts.prune(max_entries=max_entries)
+        if rebalance_every:
+            self._counts.rebalance()
 
     def _train(self, n_gram):
         # test for OOV words
@@ -297,18 +863,22 @@ class LanguageModel():
                         for word in n_gram]):
                 return
 
-        n_gram_string = self.splitchar.join(n_gram)
-        self._counts.insert(n_gram_string)
+        self._counts.insert(self._key(n_gram, add=True))
 
     def _probability(self, n_gram):
+        if self.estimator:
+            if not self._fitted:
+                self.estimator.fit(self)
+                self._fitted = True
+            return self.estimator.probability(n_gram)
+
         frequency = self.frequency(n_gram)
 
         if frequency == 0:
             return 0
 
         *preceding, target = n_gram
-        preceding = self.splitchar.join(preceding)
-        total = self._counts.frequency(preceding)
+        total = self._lookup(self._key(preceding))
 
         probability = frequency / total
         return probability
@@ -316,6 +886,10 @@ class LanguageModel():
     def __contains__(self, n_gram):
         return self.frequency(n_gram)
 
+    def __iadd__(self, other):
+        self.merge(other)
+        return self
+
     def __iter__(self):
         return self.completions()
 
@@ -343,9 +917,88 @@ class LanguageModel():
     def splitchar(self):
         return self._splitchar
 
+    @property
+    def backend(self):
+        return self._backend
+
+    @property
+    def cache_size(self):
+        return self._cache_size
+
+    @property
+    def estimator(self):
+        return self._estimator
+
+    @property
+    def encoder(self):
+        return self._encoder
+
+
+def chunk_sequence(sequence, boundary, size):
+    """Split sequence into lists ending after every size boundaries.
+
+    Parameters
+    ----------
+    sequence : iterable
+        Sequence to split
+    boundary : object
+        Element that separates units in sequence
+    size : int
+        Number of boundaries per chunk
+
+    Yields
+    ------
+    list
+        Each chunk, including its boundaries
+    """
+    chunk = list()
+    units = 0
+
+    for element in sequence:
+        chunk.append(element)
+
+        if element == boundary:
+            units += 1
+            if units == size:
+                yield chunk
+                chunk = list()
+                units = 0
+
+    if chunk:
+        yield chunk
+
+
+_worker_settings = None
+
+
+def _init_worker(settings):
+    global _worker_settings
+    _worker_settings = settings
+
+
+def _train_chunk(chunk):
+    lm = LanguageModel(**_worker_settings)
+    lm.train(chunk)
+    return lm._counts, lm.encoder
+
+
+_worker_model = None
+
+
+def _init_evaluator(settings, counts, encoder):
+    global _worker_model
+    _worker_model = LanguageModel(**settings)
+    _worker_model._counts = counts
+    _worker_model._encoder = encoder
+
+
+def _evaluate_chunk(units):
+    return _worker_model._evaluate(units)
+
 
 def train_lm(corpus, n,
              vocabulary=None, targets=None, must_contain=None,
+             backend="tst", number_of_processes=1,
              **kwargs):
     """Convenience function to train n-gram model on tagged corpus.
     """
@@ -353,6 +1006,7 @@ def train_lm(corpus, n,
     lm = LanguageModel(n,
                        vocabulary=vocabulary,
                        targets=targets,
-                       must_contain=must_contain)
-    lm.train(corpus)
+                       must_contain=must_contain,
+                       backend=backend)
+    lm.train(corpus, number_of_processes=number_of_processes)
     return lm
@@ -0,0 +1,310 @@
+from abc import ABC, abstractmethod
+from collections import Counter, defaultdict
+
+from .tst import CompactTernarySearchTree
+
+
+class Estimator(ABC):
+    """Base class for probability estimators of a LanguageModel.
+
+    An estimator is fitted to the counts of a trained model once
+    (see LanguageModel), after which probability() needs a constant
+    number of lookups per n-gram order.
+    Statistics computed by fit are stored in attributes starting
+    with an underscore and are not pickled.
+    """
+
+    def fit(self, model):
+        """Precomputes statistics from the counts of model.
+
+        Parameters
+        ----------
+        model : LanguageModel
+            Trained model
+        """
+        self.model = model
+        return self
+
+    @abstractmethod
+    def probability(self, n_gram):
+        """Returns probability of the last token of n_gram given
+        the preceding tokens.
+
+        Parameters
+        ----------
+        n_gram : sequence of str
+
+        Returns
+        -------
+        float
+            Probability
+        """
+
+    def __getstate__(self):
+        return {key: value for key, value in self.__dict__.items()
+                if not key.startswith("_") and key != "model"}
+
+
+class StupidBackoff(Estimator):
+    """Stupid backoff (Brants et al., 2007). Relative frequency of the
+    longest n-gram observed, multiplied by alpha for each order backed
+    off. Scores are not normalized.
+
+    Parameters
+    ----------
+    alpha : float
+        Factor applied for each order backed off
+    """
+
+    def __init__(self, alpha=0.4):
+        self.alpha = alpha
+
+    def probability(self, n_gram):
+        n_gram = list(n_gram)
+        weight = 1.0
+
+        for start in range(len(n_gram)):
+            frequency = self.model.frequency(n_gram[start:])
+            if frequency:
+                total = self.model.frequency(n_gram[start:-1])
+                return weight * frequency / total if total else 0.0
+            weight *= self.alpha
+
+        return 0.0
+
+
+class KneserNey(Estimator):
+    """Interpolated Kneser-Ney smoothing with one discount per order.
+
+    The highest order of each query uses discounted counts, lower
+    orders use discounted continuation counts (number of distinct
+    tokens preceding an n-gram). The lowest order is interpolated
+    with a uniform distribution over the vocabulary and one unknown
+    token, so unseen tokens get a non-zero probability.
+
+    Parameters
+    ----------
+    discount : float
+        Absolute discount. If None, it is estimated per order from
+        counts of counts as n1 / (n1 + 2 * n2).
+    """
+
+    def __init__(self, discount=None):
+        self.discount = discount
+
+    def fit(self, model):
+        super().fit(model)
+        key = model._key
+        split = model._counts.splitchar
+
+        # statistics of tokens following a context, based on counts
+        self._follow_types = _Counts(split)
+        self._follow_totals = _Counts(split)
+        # continuation counts and statistics of contexts based on them
+        self._continuations = _Counts(split)
+        self._continuation_types = _Counts(split)
+        self._continuation_totals = _Counts(split)
+        counts_of_counts = defaultdict(Counter)
+
+        for n_gram, frequency in model._n_grams():
+            context = key(n_gram[:-1])
+            self._follow_types.add(context)
+            self._follow_totals.add(context, frequency)
+            if frequency <= 2:
+                counts_of_counts[len(n_gram)][frequency] += 1
+
+            if len(n_gram) > 1:
+                suffix = key(n_gram[1:])
+                middle = key(n_gram[1:-1])
+                if not self._continuations[suffix]:
+                    self._continuation_types.add(middle)
+                self._continuations.add(suffix)
+                self._continuation_totals.add(middle)
+
+        continuation_counts_of_counts = defaultdict(Counter)
+        for suffix, frequency in self._continuations.items():
+            if frequency <= 2:
+                order = suffix.count(split) + 1
+                continuation_counts_of_counts[order][frequency] += 1
+
+        self._discounts = self._estimate_discounts(counts_of_counts)
+        self._continuation_discounts = self._estimate_discounts(
+            continuation_counts_of_counts)
+        self._vocabulary_size = self._follow_types[""] + 1
+        return self
+
+    def probability(self, n_gram):
+        n_gram = list(n_gram)
+        key = self.model._key
+        top = len(n_gram)
+        probability = 1 / self._vocabulary_size
+
+        for order in range(1, top + 1):
+            context = key(n_gram[top - order:-1])
+
+            if order == top:
+                frequency = self.model.frequency(n_gram)
+                total = self._follow_totals[context]
+                types = self._follow_types[context]
+                discount = self._discounts[order]
+            else:
+                suffix = key(n_gram[top - order:])
+                frequency = self._continuations[suffix]
+                total = self._continuation_totals[context]
+                types = self._continuation_types[context]
+                discount = self._continuation_discounts[order]
+
+            if not total:
+                continue
+
+            probability = (max(frequency - discount, 0) / total
+                           + discount * types / total * probability)
+
+        return probability
+
+    def _estimate_discounts(self, counts_of_counts):
+        if self.discount is not None:
+            return defaultdict(lambda: self.discount)
+
+        discounts = defaultdict(lambda: 0.5)
+        for order, counts in counts_of_counts.items():
+            if counts[1]:
+                discounts[order] = counts[1] / (counts[1] + 2 * counts[2])
+
+        return discounts
+
+
+class KatzBackoff(Estimator):
+    """Katz backoff with Good-Turing discounting of counts up to k.
+
+    Observed n-grams get discounted relative frequencies, unobserved
+    ones the backoff weight of their context times the probability
+    of the next lower order. Unigram probability mass freed by
+    discounting is given to unknown tokens.
+
+    Parameters
+    ----------
+    k : int
+        Counts larger than k are not discounted.
+    """
+
+    def __init__(self, k=5):
+        self.k = k
+
+    def fit(self, model):
+        super().fit(model)
+        key = model._key
+        split = model._counts.splitchar
+
+        self._follow_totals = _Counts(split)
+        counts_of_counts = defaultdict(Counter)
+
+        for n_gram, frequency in model._n_grams():
+            self._follow_totals.add(key(n_gram[:-1]), frequency)
+            if frequency <= self.k + 1:
+                counts_of_counts[len(n_gram)][frequency] += 1
+
+        self._discounts = {order: self._good_turing(counts)
+                           for order, counts in counts_of_counts.items()}
+
+        # backoff weights from the probability mass of observed n-grams
+        # under the discounted and the lower order distribution
+        observed = defaultdict(float)
+        observed_lower = defaultdict(float)
+        for n_gram, frequency in model._n_grams():
+            context = key(n_gram[:-1])
+            observed[context] += self._discounted(n_gram, frequency)
+            if len(n_gram) > 1:
+                lower = n_gram[1:]
+                observed_lower[context] += self._discounted(
+                    lower, model.frequency(lower))
+
+        self._unknown = max(1 - observed.pop("", 0.0), 0.0)
+        self._weights = {context: (1 - mass) / (1 - observed_lower[context])
+                         if observed_lower[context] < 1 else 0.0
+                         for context, mass in observed.items()}
+        return self
+
+    def probability(self, n_gram):
+        n_gram = list(n_gram)
+        key = self.model._key
+        weight = 1.0
+
+        while len(n_gram) > 1:
+            context = key(n_gram[:-1])
+            frequency = self.model.frequency(n_gram)
+            if frequency and self._follow_totals[context]:
+                return weight * self._discounted(n_gram, frequency)
+
+            if self._follow_totals[context]:
+                weight *= self._weights.get(context, 1.0)
+            n_gram = n_gram[1:]
+
+        frequency = self.model.frequency(n_gram)
+        if frequency and self._follow_totals[""]:
+            return weight * self._discounted(n_gram, frequency)
+
+        return weight * self._unknown
+
+    def _discounted(self, n_gram, frequency):
+        """Discounted relative frequency of an observed n-gram, 0 if
+        no n-gram with its context was counted (e.g. all were removed
+        by must_contain).
+        """
+        total = self._follow_totals[self.model._key(n_gram[:-1])]
+        if not total:
+            return 0.0
+
+        discounts = self._discounts.get(len(n_gram), {})
+        discount = discounts.get(frequency, 1.0)
+        return discount * frequency / total
+
+    def _good_turing(self, counts):
+        """Good-Turing discount ratios for counts 1 to k.
+        """
+        k = self.k
+        if not counts[1]:
+            return dict()
+
+        common = (k + 1) * counts[k + 1] / counts[1]
+        discounts = dict()
+
+        for count in range(1, k + 1):
+            if not counts[count] or common >= 1:
+                continue
+            discount = (count + 1) * counts[count + 1] \
+                / (count * counts[count])
+            discount = (discount - common) / (1 - common)
+            if 0 < discount <= 1:
+                discounts[count] = discount
+
+        return discounts
+
+
+ESTIMATORS = {"kneser-ney": KneserNey,
+              "katz": KatzBackoff,
+              "stupid-backoff": StupidBackoff}
+
+
+class _Counts():
+    """Counts of string keys in a compact tree. The empty key
+    is counted separately, as the tree reserves it for its total.
+    """
+
+    def __init__(self, splitchar):
+        self._tree = CompactTernarySearchTree(splitchar)
+        self._empty = 0
+
+    def add(self, key, value=1):
+        if key:
+            self._tree.insert(key, value, subsequences=False)
+        else:
+            self._empty += value
+
+    def items(self):
+        return self._tree.completions()
+
+    def __getitem__(self, key):
+        if key:
+            return self._tree.frequency(key)
+        return self._empty
@@ -1,11 +1,105 @@
 #cython: language_level=3
+cimport cython
+from cpython cimport array
+from cpython.buffer cimport PyBUF_SIMPLE, PyBuffer_Release
+from cpython.buffer cimport PyObject_GetBuffer
+from cpython.memoryview cimport PyMemoryView_FromMemory
+from libc.limits cimport UINT_MAX
+from libc.stdlib cimport free, malloc, realloc
+from libc.string cimport memcpy
+
+import array
+import io
+import mmap as mmap_
+import struct
+
+from itertools import accumulate
+
+from .insertion_order import median_split_vocabulary, median_splits
+
+
+cdef extern from "Python.h":
+    int PyUnicode_4BYTE_KIND
+    int PyBUF_READ
+    int PyBUF_WRITE
+    object PyUnicode_FromKindAndData(int kind, const void *buffer,
+                                     Py_ssize_t size)
+
+
+# file format: header, then the arrays of code points, counts and
+# lo/eq/hi indices of a CompactTernarySearchTree (native byte order),
+# then splitchar (UTF-8) and arbitrary metadata bytes
+# header: magic, version, nodes, total, splitchar length, reserved,
+# metadata length
+HEADER = struct.Struct("=4sIIIIIQ")
+MAGIC = b"CTST"
+VERSION = 1
+NO_SPLITCHAR = UINT_MAX
+cdef Py_ssize_t HEADER_SIZE = HEADER.size
+
+
+def read_header(file):
+    """Read and validate header of a tree file.
+    Parameters
+    ----------
+    file : file
+        File opened for binary reading, positioned at the start.
+    Returns
+    -------
+    tuple
+        (size, total, splitchar length, metadata length)
+    """
+    header = file.read(HEADER.size)
+    if len(header) == HEADER.size:
+        magic, version, size, total, split_length, _, meta_length = \
+            HEADER.unpack(header)
+        if magic == MAGIC and version == VERSION:
+            return size, total, split_length, meta_length
+
+    msg = f"'{getattr(file, 'name', file)}' is not a tree file " \
+          f"(version {VERSION})."
+    raise ValueError(msg)
+
+
+cdef int _read_into(file, char* data, Py_ssize_t nbytes) except -1:
+    """Fill nbytes at data from file.
+    """
+    if file.readinto(PyMemoryView_FromMemory(data, nbytes,
+                                             PyBUF_WRITE)) != nbytes:
+        msg = f"'{getattr(file, 'name', file)}' is truncated."
+        raise ValueError(msg)
+    return 0
+
+
+def read_metadata(path):
+    """Return metadata bytes stored in a tree file.
+    Parameters
+    ----------
+    path : str or path
+        Path to file written by the save method of a tree.
+    Returns
+    -------
+    bytes
+        Metadata
+    """
+    with open(path, "rb") as file:
+        size, _, split_length, meta_length = read_header(file)
+        if split_length == NO_SPLITCHAR:
+            split_length = 0
+        file.seek(HEADER.size + 5 * 4 * size + split_length)
+        return file.read(meta_length)
+
+
+# nodes only reference their children, so they cannot form cycles
+# and need not be tracked by the garbage collector
+@cython.no_gc
 cdef class Node():
     cdef:
-        public str character
+        public Py_UCS4 character
         public unsigned int count
         public Node lo, eq, hi
 
-    def __init__(self, str character):
+    def __init__(self, Py_UCS4 character):
         self.character = character
 
 
@@ -16,7 +110,9 @@ cdef class TernarySearchTree():
     cdef:
         Node root
         str _splitchar
-        unsigned int total
+        Py_UCS4 _split
+        bint _has_split
+        public unsigned int total
 
     def __init__(self, splitchar=None):
         """Initializes TST.
@@ -28,7 +124,10 @@ cdef class TernarySearchTree():
             each subsequence ending in this character
         """
         self._splitchar = splitchar
- 
+        self._has_split = splitchar is not None and len(splitchar) == 1
+        if self._has_split:
+            self._split = splitchar[0]
+
     cpdef void insert(self, str string,
                       unsigned int frequency=1,
                       bint subsequences=True):
@@ -48,10 +147,272 @@ cdef class TernarySearchTree():
         Inserting with frequency=0 can be used to initialize
         the tree (e.g. to ensure balance by controlling insertion order).
         """
-        self.root = self._insert(string, frequency,
-                                 subsequences, self.root)
+        self._insert(string, frequency, subsequences)
         self.total += frequency
 
+    def insert_many(self, items, counts=None, bint subsequences=True):
+        """Insert many strings into Tree in a single call.
+        Parameters
+        ----------
+        items : iterable of (str, unsigned int)-tuples or of str
+            Strings with their frequencies or, if counts are
+            given separately, only the strings.
+        counts : iterable of unsigned int
+            Frequencies of the strings in items (default None)
+        subsequences : bool
+            If True, counts of subsequences (divided by splitchar)
+            are increased as well
+
+        Notes
+        -----
+        The nodes matched by the prefix that a string shares with
+        the string inserted before it are not searched again, so
+        sorted input is inserted considerably faster.
+        """
+        cdef:
+            str string
+            str previous = ""
+            unsigned int frequency
+            list path = []
+
+        if counts is not None:
+            items = zip(items, counts)
+
+        for string_, frequency in items:
+            string = string_ if type(string_) is str else _as_str(string_)
+            self._insert_shared(string, frequency, subsequences,
+                                previous, path)
+            self.total += frequency
+            previous = string
+
+    def merge(self, other):
+        """Add all counts of another tree to this tree.
+        Parameters
+        ----------
+        other : TernarySearchTree or CompactTernarySearchTree
+            Tree whose counts are added.
+
+        Notes
+        -----
+        Both trees are merged in a single pass over the nodes of other.
+        A tree of the other type is converted first.
+        """
+        cdef:
+            TernarySearchTree tree
+            Node parent, node, target
+            list stack
+
+        if isinstance(other, CompactTernarySearchTree):
+            other = TernarySearchTree.from_compact(other)
+        tree = other
+
+        stack = [(None, tree.root)] if tree.root is not None else []
+
+        # walk other tree once, locating each node's counterpart in the
+        # sibling subtree below the counterpart of its eq-parent
+        while stack:
+            parent, node = stack.pop()
+            target = self._child(parent, node.character)
+            target.count += node.count
+
+            if node.eq is not None:
+                stack.append((target, node.eq))
+            if node.lo is not None:
+                stack.append((parent, node.lo))
+            if node.hi is not None:
+                stack.append((parent, node.hi))
+
+        self.total += tree.total
+
+    def __iadd__(self, other):
+        """Adds 'tst += other' syntactic sugar for merge.
+        """
+        self.merge(other)
+        return self
+
+    def translate(self, table):
+        """Return copy of tree with characters replaced.
+        Parameters
+        ----------
+        table : dict or callable
+            Mapping of code points to code points, as for str.translate,
+            or function returning the translation of a key. Keys must
+            remain unique after translation.
+
+        Returns
+        -------
+        TernarySearchTree
+            Tree with the same counts and total for translated keys.
+        """
+        cdef TernarySearchTree tree = type(self)(self._splitchar)
+
+        for string, frequency in self.completions():
+            string = table(string) if callable(table) \
+                else string.translate(table)
+            tree.insert(string, frequency, False)
+
+        tree.total = self.total
+        return tree
+
+    def prune(self, unsigned int min_count=0, max_entries=None, keys=()):
+        """Remove strings with low counts and the nodes only they use.
+        Parameters
+        ----------
+        min_count : unsigned int
+            Strings counted fewer times are removed.
+        max_entries : int
+            If given, the strings with the lowest counts are removed
+            until at most max_entries strings are left. Strings with
+            the same count are either all kept or all removed.
+        keys : iterable of str
+            Strings to remove regardless of their counts.
+
+        Notes
+        -----
+        The total is left unchanged. Removed nodes are unlinked in a
+        single pass from the leaves up, a removed node with siblings on
+        both sides is replaced by its lo sibling, with the hi sibling
+        attached to its rightmost descendant.
+        """
+        cdef:
+            Node node, parent, replacement, child
+            list order = []
+            list stack
+            dict histogram = {}
+            unsigned int threshold = min_count
+            unsigned char link
+
+        for key in keys:
+            node = self._search(key) if key else None
+            if node is not None:
+                node.count = 0
+
+        # nodes in pre-order with their parent and the link
+        # (0: lo, 1: eq, 2: hi) by which the parent refers to them
+        stack = [(self.root, None, 0)] if self.root is not None else []
+        while stack:
+            node, parent, link = stack.pop()
+            order.append((node, parent, link))
+            if node.count:
+                histogram[node.count] = histogram.get(node.count, 0) + 1
+            if node.lo is not None:
+                stack.append((node.lo, node, 0))
+            if node.eq is not None:
+                stack.append((node.eq, node, 1))
+            if node.hi is not None:
+                stack.append((node.hi, node, 2))
+
+        if max_entries is not None:
+            threshold = max(threshold,
+                            _count_threshold(histogram, max_entries))
+
+        # children are visited before their parent in reverse pre-order
+        for node, parent, link in reversed(order):
+            if node.count < threshold:
+                node.count = 0
+
+            replacement = node
+            if not node.count and node.eq is None:
+                if node.lo is None:
+                    replacement = node.hi
+                else:
+                    replacement = child = node.lo
+                    while child.hi is not None:
+                        child = child.hi
+                    child.hi = node.hi
+
+            if parent is None:
+                self.root = replacement
+            elif link == 0:
+                parent.lo = replacement
+            elif link == 1:
+                parent.eq = replacement
+            else:
+                parent.hi = replacement
+
+    def rebalance(self):
+        """Rebuild each sibling subtree (nodes linked by lo/hi below the
+        same node) in weighted median split order (see
+        insertion_order.median_splits). Nodes are weighted by the counts
+        of all strings passing through them, plus one.
+
+        Notes
+        -----
+        Trees filled in corpus order can degrade into long lo/hi chains.
+        Rebalancing minimizes the expected lookup depth for queries
+        distributed like the counts. Counts are unchanged.
+        """
+        cdef:
+            Node node, member, parent
+            list order, stack, members, groups
+            dict sums = {}
+            unsigned long long total
+
+        if self.root is None:
+            return
+
+        # sums of counts in the subtree of each node, children first
+        order = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            for child in (node.lo, node.eq, node.hi):
+                if child is not None:
+                    stack.append(child)
+
+        for node in reversed(order):
+            total = node.count
+            for child in (node.lo, node.eq, node.hi):
+                if child is not None:
+                    total += sums[child]
+            sums[node] = total
+
+        groups = [(None, self.root)]
+        while groups:
+            parent, node = groups.pop()
+
+            # members of the sibling subtree in order
+            members = []
+            stack = []
+            while stack or node is not None:
+                if node is not None:
+                    stack.append(node)
+                    node = node.lo
+                    continue
+                node = stack.pop()
+                members.append(node)
+                node = node.hi
+
+            for member in members:
+                if member.eq is not None:
+                    groups.append((member, member.eq))
+
+            # most sibling subtrees are single nodes
+            if len(members) == 1:
+                continue
+
+            weights = [member.count + 1 + (sums[member.eq]
+                                           if member.eq is not None else 0)
+                       for member in members]
+            for member in members:
+                member.lo = member.hi = None
+
+            for idx, parent_idx, side in median_splits(
+                    list(accumulate(weights))):
+                member = members[idx]
+                if parent_idx < 0:
+                    node = member
+                elif side:
+                    (<Node> members[parent_idx]).hi = member
+                else:
+                    (<Node> members[parent_idx]).lo = member
+
+            if parent is None:
+                self.root = node
+            else:
+                parent.eq = node
+
     cpdef unsigned int frequency(self, str string):
         """Return frequency of string.
         Parameters
@@ -71,13 +432,79 @@ cdef class TernarySearchTree():
         if not string:
             return self.total
 
-        node = self._search(string, self.root)
+        node = self._search(string)
 
         if not node:
             return 0
 
         return node.count
 
+    def conditional_probabilities(self, sequences, unsigned int n):
+        """Return probability of each token given the up to n - 1
+        tokens preceding it.
+        Parameters
+        ----------
+        sequences : iterable of list of str
+            Token sequences, joined by splitchar to form keys.
+        n : unsigned int
+            Size of n-grams.
+        Returns
+        -------
+        array.array
+            Probabilities (as doubles) of all tokens of all sequences.
+
+        Notes
+        -----
+        Probabilities are relative frequencies of n-gram and preceding
+        context. Each n-gram is found in a single search that continues
+        from the node its context ends in.
+        """
+        cdef:
+            array.array probabilities = array.array("d")
+            str splitchar = self._splitchar or ""
+            list tokens
+            Py_ssize_t idx, jdx, start
+            bint found
+            unsigned int context, frequency
+            Node node
+
+        for tokens in sequences:
+            for idx in range(len(tokens)):
+                start = idx - n + 1 if idx >= n else 0
+                node = None
+                found = True
+
+                for jdx in range(start, idx):
+                    if jdx > start:
+                        node = self._step(node, splitchar, &found)
+                    if found:
+                        node = self._step(node, tokens[jdx], &found)
+                    if not found:
+                        break
+
+                if not found:
+                    probabilities.append(0.0)
+                    continue
+
+                context = self.total if node is None else node.count
+
+                if idx > start:
+                    node = self._step(node, splitchar, &found)
+                if found:
+                    node = self._step(node, tokens[idx], &found)
+
+                if not found:
+                    frequency = 0
+                else:
+                    frequency = self.total if node is None else node.count
+
+                if frequency and context:
+                    probabilities.append(<double> frequency / context)
+                else:
+                    probabilities.append(0.0)
+
+        return probabilities
+
     def completions(self, str prefix="", bint full=True,
                     bint return_frequency=True):
         """Return all completions for a given prefix.
@@ -95,121 +522,407 @@ cdef class TernarySearchTree():
             Yield str or (str, unsigned int)-tuples (return_frequency=True)
         """
         cdef:
-            Node prefix_node
-            str completion
-            unsigned int frequency
+            list completions
+            array.array frequencies
+            Py_ssize_t idx
 
-        prefix_node = self._search(prefix, self.root)
+        for completions, frequencies in self.completion_chunks(prefix, full):
+            if not return_frequency:
+                yield from completions
+                continue
 
-        if not prefix_node:
-            return
+            for idx in range(len(completions)):
+                yield completions[idx], frequencies.data.as_uints[idx]
+
+    def completion_chunks(self, str prefix="", bint full=True,
+                          Py_ssize_t chunksize=65_536):
+        """Return all completions for a given prefix in chunks.
+        Parameters
+        ----------
+        prefix : str
+            String that all results returned begin with.
+        full : bool
+            Flag for whether to return results with the prefix appended.
+        chunksize : int
+            Maximum number of completions per chunk.
+        Returns
+        -------
+        Generator
+            Yield (list of str, array.array of unsigned int)-tuples of
+            completions and their frequencies, in order.
+        """
+        cdef Node start
+
+        if chunksize < 1:
+            msg = f"chunksize must be at least 1, got {chunksize}."
+            raise ValueError(msg)
 
         if prefix:
-            prefix_node = prefix_node.eq
+            start = self._search(prefix)
+            start = start.eq if start is not None else None
+        else:
+            start = self.root
 
-        for completion, frequency in self._completions(prefix_node):
-            if full:
-                completion = prefix + completion
+        if start is None:
+            return
 
-            if return_frequency:
-                yield completion, frequency
-            else:
-                yield completion
+        yield from self._completions(start, prefix if full else "",
+                                     chunksize)
 
     cdef Node _insert(self, str string, unsigned int frequency,
-                      bint subsequences, Node node):
-        """Insert string at a given node.
+                      bint subsequences):
+        """Insert string iteratively, walking an index over its characters.
+        """
+        if not string:
+            return None
+
+        if self.root is None:
+            self.root = Node(string[0])
+
+        return self._insert_from(string, 0, self.root,
+                                 frequency, subsequences, None)
+
+    cdef Node _insert_from(self, str string, Py_ssize_t idx, Node node,
+                           unsigned int frequency, bint subsequences,
+                           list path):
+        """Insert the rest of string, starting with string[idx] at node.
+        If path is given, each node matching a character is appended to it.
         """
         cdef:
-            str character
-            str rest
+            Py_ssize_t length = len(string)
+            Py_UCS4 character
 
-        if not string:
-            return node
+        while True:
+            character = string[idx]
 
-        character, rest = string[0], string[1:]
+            if character < node.character:
+                if node.lo is None:
+                    node.lo = Node(character)
+                node = node.lo
 
-        if node is None:
-            node = Node(character)
+            elif character > node.character:
+                if node.hi is None:
+                    node.hi = Node(character)
+                node = node.hi
 
-        if character == node.character:
-            if not rest:
-                node.count += frequency
-                return node
+            else:
+                if path is not None:
+                    path.append(node)
+
+                idx += 1
+                if idx == length:
+                    node.count += frequency
+                    return node
+
+                if (subsequences and self._has_split
+                        and string[idx] == self._split):
+                    node.count += frequency
+
+                if node.eq is None:
+                    node.eq = Node(string[idx])
+                node = node.eq
+
+    cdef void _insert_shared(self, str string, unsigned int frequency,
+                             bint subsequences, str previous, list path):
+        """Insert string, reusing the nodes in path that matched the prefix
+        it shares with the previously inserted string.
+        """
+        cdef:
+            Py_ssize_t idx
+            Py_ssize_t shared = 0
+            Py_ssize_t length = len(string)
+            Py_ssize_t limit = min(length, len(previous), len(path))
+            Node node
+
+        if not length:
+            return
+
+        while shared < limit and string[shared] == previous[shared]:
+            shared += 1
 
-            if subsequences and (rest[0] == self.splitchar):
-                node.count += frequency
-            node.eq = self._insert(rest, frequency,
-                                   subsequences, node.eq)
+        if subsequences and self._has_split:
+            for idx in range(min(shared, length - 1)):
+                if string[idx + 1] == self._split:
+                    (<Node> path[idx]).count += frequency
 
-        elif character < node.character:
-            node.lo = self._insert(string, frequency,
-                                   subsequences, node.lo)
+        if shared == length:
+            (<Node> path[length - 1]).count += frequency
+            del path[length:]
+            return
+
+        del path[shared:]
+
+        if not shared:
+            if self.root is None:
+                self.root = Node(string[0])
+            node = self.root
+
+        else:
+            node = path[shared - 1]
+            if node.eq is None:
+                node.eq = Node(string[shared])
+            node = node.eq
+
+        self._insert_from(string, shared, node,
+                          frequency, subsequences, path)
+
+    cdef Node _child(self, Node parent, Py_UCS4 character):
+        """Return node for character among the eq-children of parent
+        (or at the root level if parent is None), creating it if missing.
+        """
+        cdef Node node
 
+        if parent is None:
+            if self.root is None:
+                self.root = Node(character)
+            node = self.root
         else:
-            node.hi = self._insert(string, frequency,
-                                   subsequences, node.hi)
+            if parent.eq is None:
+                parent.eq = Node(character)
+            node = parent.eq
+
+        while True:
+            if character < node.character:
+                if node.lo is None:
+                    node.lo = Node(character)
+                node = node.lo
+
+            elif character > node.character:
+                if node.hi is None:
+                    node.hi = Node(character)
+                node = node.hi
+
+            else:
+                return node
+
+    cdef Node _step(self, Node node, str string, bint* found):
+        """Continue a search that ended in node (None at the start)
+        with the characters of string. Sets found to False on failure.
+        """
+        cdef:
+            Py_ssize_t idx
+            Py_UCS4 character
+
+        for idx in range(len(string)):
+            character = string[idx]
+            node = self.root if node is None else node.eq
+
+            while node is not None and character != node.character:
+                if character < node.character:
+                    node = node.lo
+                else:
+                    node = node.hi
+
+            if node is None:
+                found[0] = False
+                return None
 
         return node
 
-    cdef Node _search(self, str string, Node node):
+    cdef Node _search(self, str string):
         """Return node that string ends in.
         """
         cdef:
-            str character
-            str rest
+            Py_ssize_t idx = 0
+            Py_ssize_t length = len(string)
+            Py_UCS4 character
+            Node node = self.root
 
-        if not string or not node:
+        if not length:
             return node
 
-        # character, *rest = string
-        character, rest = string[0], string[1:]
+        while node is not None:
+            character = string[idx]
 
-        if character < node.character:
-            return self._search(string, node.lo)
+            if character < node.character:
+                node = node.lo
 
-        elif character > node.character:
-            return self._search(string, node.hi)
+            elif character > node.character:
+                node = node.hi
 
-        if not rest:
-            return node
+            else:
+                idx += 1
+                if idx == length:
+                    return node
+                node = node.eq
 
-        return self._search(rest, node.eq)
+        return None
 
-    def _completions(self, Node node):
-        """Generator yielding completions starting from node.
+    def _completions(self, Node start, str prefix, Py_ssize_t chunksize):
+        """Generator yielding chunks of completions below node start,
+        using an explicit stack and a reusable character buffer that
+        begins with prefix.
         """
-        cdef str completion
-        cdef unsigned int frequency
+        cdef:
+            list nodes = [start]
+            # stack entries are depths shifted left by one, with the
+            # lowest bit flagging that the node is to be emitted
+            array.array entries = array.array("Q", [0])
+            array.array buffer = array.array("I", [ord(character)
+                                                   for character in prefix])
+            Py_ssize_t offset = len(prefix)
+            list completions = []
+            array.array frequencies = array.clone(array.array("I"),
+                                                  chunksize, False)
+            Py_ssize_t count = 0
+            unsigned long long entry, depth
+            Py_ssize_t top
+            Node node
 
-        if node is None:
-            return
+        while nodes:
+            node = nodes.pop()
+            top = len(entries) - 1
+            entry = entries.data.as_ulonglongs[top]
+            array.resize_smart(entries, top)
+            depth = (entry >> 1) + offset
 
-        if node.lo:
-            for completion, frequency in self._completions(node.lo):
-                yield completion, frequency
+            if entry & 1:
+                if depth >= <unsigned long long> len(buffer):
+                    array.resize_smart(buffer, depth + 1)
+                buffer.data.as_uints[depth] = node.character
 
-        if node.count:
-            yield node.character, node.count
+                if node.count:
+                    completions.append(PyUnicode_FromKindAndData(
+                        PyUnicode_4BYTE_KIND, buffer.data.as_uints,
+                        depth + 1))
+                    frequencies.data.as_uints[count] = node.count
+                    count += 1
+                    if count == chunksize:
+                        yield completions, frequencies
+                        completions = []
+                        frequencies = array.clone(frequencies, chunksize,
+                                                  False)
+                        count = 0
+                continue
 
-        if node.eq:
-            for completion, frequency in self._completions(node.eq):
-                yield node.character + completion, frequency
+            # pushed in reverse order of traversal: lo, node, eq, hi
+            if node.hi is not None:
+                nodes.append(node.hi)
+                entries.append(entry)
+            if node.eq is not None:
+                nodes.append(node.eq)
+                entries.append(entry + 2)
+            nodes.append(node)
+            entries.append(entry | 1)
+            if node.lo is not None:
+                nodes.append(node.lo)
+                entries.append(entry)
 
-        if node.hi:
-            for completion, frequency in self._completions(node.hi):
-                yield completion, frequency
+        if count:
+            array.resize(frequencies, count)
+            yield completions, frequencies
 
-    def __contains__(self, str string):
-        """Adds 'string in TST' syntactic sugar.
+    def save(self, path, bytes metadata=b""):
+        """Save tree to a binary file.
+        Parameters
+        ----------
+        path : str or path
+            File to write to.
+        metadata : bytes
+            Arbitrary bytes stored along with the tree.
+
+        Notes
+        -----
+        The tree is stored as a flattened CompactTernarySearchTree.
         """
-        cdef Node node
+        CompactTernarySearchTree.from_tree(self).save(path, metadata)
+
+    @classmethod
+    def load(cls, path):
+        """Load tree from a binary file written by save.
+        Parameters
+        ----------
+        path : str or path
+            File to read from.
+        Returns
+        -------
+        TernarySearchTree
+        """
+        return cls.from_compact(CompactTernarySearchTree.load(path))
+
+    @classmethod
+    def from_counts(cls, counts, splitchar=None, bint balanced=True,
+                    bint subsequences=False):
+        """Build tree from strings and their frequencies in one pass.
+        Parameters
+        ----------
+        counts : Counter or dict
+            Strings with their frequencies
+        splitchar : str
+            Character that separates tokens in n-gram
+        balanced : bool
+            If True, strings are inserted in frequency-weighted median
+            split order (see insertion_order.median_split_vocabulary),
+            which minimizes the expected lookup depth for queries
+            distributed like counts. Otherwise, they are inserted in
+            the order of counts.
+        subsequences : bool
+            If True, counts of subsequences (divided by splitchar)
+            are increased as well
+        Returns
+        -------
+        TernarySearchTree
+        """
+        return _from_counts(cls, counts, splitchar, balanced, subsequences)
 
-        node = self._search(string, self.root)
-        if node:
-            return node.count
+    @classmethod
+    def from_compact(cls, CompactTernarySearchTree compact):
+        """Return a copy of a CompactTernarySearchTree built from nodes.
+        Parameters
+        ----------
+        compact : CompactTernarySearchTree
+        Returns
+        -------
+        TernarySearchTree
+        """
+        cdef:
+            TernarySearchTree tree
+            Node node, child
+            unsigned int idx
+            list stack
+
+        tree = cls(compact.splitchar)
+        tree.total = compact.total
+
+        if compact.size == 1:
+            return tree
+
+        tree.root = Node(compact.characters[1])
+        tree.root.count = compact.counts[1]
+        stack = [(tree.root, 1)]
+
+        while stack:
+            node, idx = stack.pop()
+
+            if compact.lo[idx]:
+                child = node.lo = Node(compact.characters[compact.lo[idx]])
+                child.count = compact.counts[compact.lo[idx]]
+                stack.append((child, compact.lo[idx]))
+
+            if compact.eq[idx]:
+                child = node.eq = Node(compact.characters[compact.eq[idx]])
+                child.count = compact.counts[compact.eq[idx]]
+                stack.append((child, compact.eq[idx]))
+
+            if compact.hi[idx]:
+                child = node.hi = Node(compact.characters[compact.hi[idx]])
+                child.count = compact.counts[compact.hi[idx]]
+                stack.append((child, compact.hi[idx]))
+
+        return tree
+
+    def __reduce__(self):
+        cdef CompactTernarySearchTree compact
+
+        compact = CompactTernarySearchTree.from_tree(self)
+        file = io.BytesIO()
+        compact._write(file, b"")
+        return _unpickle_tree, (file.getvalue(),)
 
-        return False
+    def __contains__(self, str string):
+        """Adds 'string in TST' syntactic sugar.
+        """
+        return self.frequency(string) or False
 
     def __iter__(self):
         """Adds 'for string in TST' syntactic sugar.
@@ -219,3 +932,1204 @@ cdef class TernarySearchTree():
     @property
     def splitchar(self):
         return self._splitchar
+
+
+cdef class CompactTernarySearchTree():
+    """Ternary search tree that stores counts for n-grams
+    and their subsequences in contiguous arrays.
+
+    Nodes are indices into arrays of code points, counts and
+    lo/eq/hi child indices, which take 20 bytes per node and
+    grow geometrically. Index 0 is reserved for missing children.
+    """
+    cdef:
+        Py_UCS4* characters
+        unsigned int* counts
+        unsigned int* lo
+        unsigned int* eq
+        unsigned int* hi
+        unsigned int size
+        unsigned int capacity
+        unsigned int* path
+        Py_ssize_t path_capacity
+        bint mapped
+        Py_buffer mapped_buffer
+        object mapped_file
+        str _splitchar
+        Py_UCS4 _split
+        bint _has_split
+        public unsigned int total
+
+    def __cinit__(self):
+        self.characters = NULL
+        self.counts = self.lo = self.eq = self.hi = NULL
+        self.path = NULL
+        self.size = 1
+        self.capacity = 0
+        self.path_capacity = 0
+        self.mapped = False
+
+    def __init__(self, splitchar=None, unsigned int capacity=1024):
+        """Initializes TST.
+        Parameters
+        ----------
+        splitchar : str
+            Character that separates tokens in n-gram.
+            Counts are stored for complete n-grams and
+            each subsequence ending in this character
+        capacity : unsigned int
+            Number of nodes to allocate memory for initially.
+            Arrays double in size whenever they are full.
+        """
+        self._set_splitchar(splitchar)
+        self._resize(max(capacity, 2))
+        # slot 0 is the null node that missing children point to
+        self.characters[0] = 0
+        self.counts[0] = self.lo[0] = self.eq[0] = self.hi[0] = 0
+
+    def __dealloc__(self):
+        if self.mapped:
+            PyBuffer_Release(&self.mapped_buffer)
+        else:
+            free(self.characters)
+            free(self.counts)
+            free(self.lo)
+            free(self.eq)
+            free(self.hi)
+        free(self.path)
+
+    @classmethod
+    def from_counts(cls, counts, splitchar=None, bint balanced=True,
+                    bint subsequences=False):
+        """Build compact tree from strings and their frequencies in
+        one pass, see TernarySearchTree.from_counts.
+        """
+        return _from_counts(cls, counts, splitchar, balanced, subsequences)
+
+    @classmethod
+    def from_tree(cls, TernarySearchTree tree):
+        """Return a compact copy of a TernarySearchTree.
+        Parameters
+        ----------
+        tree : TernarySearchTree
+        Returns
+        -------
+        CompactTernarySearchTree
+        """
+        cdef:
+            CompactTernarySearchTree compact
+            Node node
+            unsigned int idx
+            unsigned int child
+            list stack
+
+        compact = cls(tree.splitchar)
+        compact.total = tree.total
+
+        if tree.root is None:
+            return compact
+
+        idx = compact._new_node(tree.root.character)
+        compact.counts[idx] = tree.root.count
+        stack = [(tree.root, idx)]
+
+        while stack:
+            node, idx = stack.pop()
+
+            if node.lo is not None:
+                child = compact._new_node(node.lo.character)
+                compact.counts[child] = node.lo.count
+                compact.lo[idx] = child
+                stack.append((node.lo, child))
+
+            if node.eq is not None:
+                child = compact._new_node(node.eq.character)
+                compact.counts[child] = node.eq.count
+                compact.eq[idx] = child
+                stack.append((node.eq, child))
+
+            if node.hi is not None:
+                child = compact._new_node(node.hi.character)
+                compact.counts[child] = node.hi.count
+                compact.hi[idx] = child
+                stack.append((node.hi, child))
+
+        return compact
+
+    def save(self, path, bytes metadata=b""):
+        """Save tree to a binary file that can be memory-mapped.
+        Parameters
+        ----------
+        path : str or path
+            File to write to.
+        metadata : bytes
+            Arbitrary bytes stored along with the tree.
+        """
+        with open(path, "wb") as file:
+            self._write(file, metadata)
+
+    @classmethod
+    def load(cls, path, bint mmap=True):
+        """Load tree from a binary file written by save.
+        Parameters
+        ----------
+        path : str or path
+            File to read from.
+        mmap : bool
+            If True, the file is memory-mapped read-only instead of
+            read into memory. Processes mapping the same file share
+            its pages, and opening takes constant time.
+        Returns
+        -------
+        CompactTernarySearchTree
+
+        Notes
+        -----
+        A memory-mapped tree is copied into memory the first time it is
+        modified.
+        """
+        with open(path, "rb") as file:
+            return _read_compact(cls, file, mmap)
+
+    cdef int _write(self, file, bytes metadata) except -1:
+        """Write header, arrays, splitchar and metadata to binary file.
+        """
+        cdef:
+            Py_ssize_t nbytes = self.size * sizeof(unsigned int)
+            bytes splitchar = b""
+            unsigned int split_length = NO_SPLITCHAR
+
+        if self._splitchar is not None:
+            splitchar = self._splitchar.encode("utf-8")
+            split_length = len(splitchar)
+
+        file.write(HEADER.pack(MAGIC, VERSION, self.size, self.total,
+                               split_length, 0, len(metadata)))
+        file.write(PyMemoryView_FromMemory(
+            <char*> self.characters, nbytes, PyBUF_READ))
+        file.write(PyMemoryView_FromMemory(
+            <char*> self.counts, nbytes, PyBUF_READ))
+        file.write(PyMemoryView_FromMemory(
+            <char*> self.lo, nbytes, PyBUF_READ))
+        file.write(PyMemoryView_FromMemory(
+            <char*> self.eq, nbytes, PyBUF_READ))
+        file.write(PyMemoryView_FromMemory(
+            <char*> self.hi, nbytes, PyBUF_READ))
+        file.write(splitchar)
+        file.write(metadata)
+        return 0
+
+    def __reduce__(self):
+        file = io.BytesIO()
+        self._write(file, b"")
+        return _unpickle_compact, (file.getvalue(),)
+
+    cdef void _set_splitchar(self, splitchar):
+        self._splitchar = splitchar
+        self._has_split = splitchar is not None and len(splitchar) == 1
+        if self._has_split:
+            self._split = splitchar[0]
+
+    cdef int _own(self) except -1:
+        """Copy memory-mapped arrays into memory, so they can be modified.
+        """
+        cdef:
+            Py_UCS4* characters = self.characters
+            unsigned int* counts = self.counts
+            unsigned int* lo = self.lo
+            unsigned int* eq = self.eq
+            unsigned int* hi = self.hi
+            Py_ssize_t nbytes = self.size * sizeof(unsigned int)
+
+        if not self.mapped:
+            return 0
+
+        self.characters = NULL
+        self.counts = self.lo = self.eq = self.hi = NULL
+        self.mapped = False
+        try:
+            self._resize(max(self.size, 2))
+            memcpy(self.characters, characters, nbytes)
+            memcpy(self.counts, counts, nbytes)
+            memcpy(self.lo, lo, nbytes)
+            memcpy(self.eq, eq, nbytes)
+            memcpy(self.hi, hi, nbytes)
+        finally:
+            PyBuffer_Release(&self.mapped_buffer)
+            self.mapped_file.close()
+            self.mapped_file = None
+        return 0
+
+    cpdef void insert(self, str string,
+                      unsigned int frequency=1,
+                      bint subsequences=True):
+        """Insert string into Tree.
+        Parameters
+        ----------
+        string : str
+            String to be inserted.
+        frequency : unsigned int
+            Frequency of the string that is added (default 1)
+        subsequences : bool
+            If True, counts of subsequences (divided by splitchar)
+            are increased as well
+        """
+        self._own()
+        if string:
+            self._insert_from(string, 0, self._root(string[0]),
+                              frequency, subsequences, False)
+        self.total += frequency
+
+    def insert_many(self, items, counts=None, bint subsequences=True):
+        """Insert many strings into Tree in a single call.
+        Parameters
+        ----------
+        items : iterable of (str, unsigned int)-tuples or of str
+            Strings with their frequencies or, if counts are
+            given separately, only the strings.
+        counts : iterable of unsigned int
+            Frequencies of the strings in items (default None)
+        subsequences : bool
+            If True, counts of subsequences (divided by splitchar)
+            are increased as well
+
+        Notes
+        -----
+        The nodes matched by the prefix that a string shares with
+        the string inserted before it are not searched again, so
+        sorted input is inserted considerably faster.
+        """
+        cdef:
+            str string
+            str previous = ""
+            unsigned int frequency
+
+        self._own()
+        if counts is not None:
+            items = zip(items, counts)
+
+        for string_, frequency in items:
+            string = string_ if type(string_) is str else _as_str(string_)
+            self._insert_shared(string, frequency, subsequences, previous)
+            self.total += frequency
+            previous = string
+
+    def merge(self, other):
+        """Add all counts of another tree to this tree.
+        Parameters
+        ----------
+        other : TernarySearchTree or CompactTernarySearchTree
+            Tree whose counts are added.
+
+        Notes
+        -----
+        Both trees are merged in a single pass over the nodes of other.
+        A tree of the other type is converted first.
+        """
+        cdef:
+            CompactTernarySearchTree tree
+            unsigned int parent, node, target
+            array.array parents, nodes
+            Py_ssize_t top
+
+        if isinstance(other, TernarySearchTree):
+            other = CompactTernarySearchTree.from_tree(other)
+        tree = other
+
+        self._own()
+        if tree.size == 1:
+            self.total += tree.total
+            return
+
+        # parent 0 stands for the root level
+        parents = array.array("I", [0])
+        nodes = array.array("I", [1])
+
+        while len(nodes):
+            top = len(nodes) - 1
+            parent = parents.data.as_uints[top]
+            node = nodes.data.as_uints[top]
+            array.resize_smart(parents, top)
+            array.resize_smart(nodes, top)
+
+            target = self._child(parent, tree.characters[node])
+            self.counts[target] += tree.counts[node]
+
+            if tree.eq[node]:
+                parents.append(target)
+                nodes.append(tree.eq[node])
+            if tree.lo[node]:
+                parents.append(parent)
+                nodes.append(tree.lo[node])
+            if tree.hi[node]:
+                parents.append(parent)
+                nodes.append(tree.hi[node])
+
+        self.total += tree.total
+
+    def __iadd__(self, other):
+        """Adds 'tst += other' syntactic sugar for merge.
+        """
+        self.merge(other)
+        return self
+
+    def translate(self, table):
+        """Return copy of tree with characters replaced.
+        Parameters
+        ----------
+        table : dict or callable
+            Mapping of code points to code points, as for str.translate,
+            or function returning the translation of a key. Keys must
+            remain unique after translation.
+
+        Returns
+        -------
+        CompactTernarySearchTree
+            Tree with the same counts and total for translated keys.
+        """
+        cdef CompactTernarySearchTree tree = type(self)(self._splitchar)
+
+        for string, frequency in self.completions():
+            string = table(string) if callable(table) \
+                else string.translate(table)
+            tree.insert(string, frequency, False)
+
+        tree.total = self.total
+        return tree
+
+    def prune(self, unsigned int min_count=0, max_entries=None, keys=()):
+        """Remove strings with low counts and the nodes only they use.
+        Parameters
+        ----------
+        min_count : unsigned int
+            Strings counted fewer times are removed.
+        max_entries : int
+            If given, the strings with the lowest counts are removed
+            until at most max_entries strings are left. Strings with
+            the same count are either all kept or all removed.
+        keys : iterable of str
+            Strings to remove regardless of their counts.
+
+        Notes
+        -----
+        The total is left unchanged. Removed nodes are unlinked in a
+        single pass from the leaves up, a removed node with siblings on
+        both sides is replaced by its lo sibling, with the hi sibling
+        attached to its rightmost descendant.
+        Remaining nodes are compacted in place and memory of removed
+        ones is released.
+        """
+        cdef:
+            array.array order, parents, links, remap, stack
+            dict histogram = {}
+            unsigned int threshold = min_count
+            unsigned int node, parent, replacement, child, root = 1
+            unsigned int size = 2
+            unsigned char link
+            Py_ssize_t top
+            Py_UCS4 root_character
+            unsigned int root_count, root_lo, root_eq, root_hi
+
+        self._own()
+        for key in keys:
+            if key:
+                self.counts[self._search(key)] = 0
+        self.counts[0] = 0
+
+        if self.size == 1:
+            return
+
+        for node in range(1, self.size):
+            if self.counts[node]:
+                histogram[self.counts[node]] = \
+                    histogram.get(self.counts[node], 0) + 1
+        if max_entries is not None:
+            threshold = max(threshold,
+                            _count_threshold(histogram, max_entries))
+
+        # nodes in pre-order, with the parent of each node and the link
+        # (0: lo, 1: eq, 2: hi) by which the parent refers to it
+        order = array.array("I")
+        parents = array.array("I", bytes(4 * self.size))
+        links = array.array("B", bytes(self.size))
+        stack = array.array("I", [1])
+        while len(stack):
+            top = len(stack) - 1
+            node = stack.data.as_uints[top]
+            array.resize_smart(stack, top)
+            order.append(node)
+            for link, child in enumerate((self.lo[node], self.eq[node],
+                                          self.hi[node])):
+                if child:
+                    stack.append(child)
+                    parents.data.as_uints[child] = node
+                    links.data.as_uchars[child] = link
+
+        # children are visited before their parent in reverse pre-order,
+        # remap marks removed nodes with 0
+        remap = array.array("I", bytes(4 * self.size))
+        for top in range(len(order) - 1, -1, -1):
+            node = order.data.as_uints[top]
+            if self.counts[node] < threshold:
+                self.counts[node] = 0
+
+            replacement = node
+            if not self.counts[node] and not self.eq[node]:
+                if not self.lo[node]:
+                    replacement = self.hi[node]
+                else:
+                    replacement = child = self.lo[node]
+                    while self.hi[child]:
+                        child = self.hi[child]
+                    self.hi[child] = self.hi[node]
+            if replacement == node:
+                remap.data.as_uints[node] = 1
+
+            parent = parents.data.as_uints[node]
+            link = links.data.as_uchars[node]
+            if not parent:
+                root = replacement
+            elif link == 0:
+                self.lo[parent] = replacement
+            elif link == 1:
+                self.eq[parent] = replacement
+            else:
+                self.hi[parent] = replacement
+
+        if not root:
+            self.size = 1
+            self._resize(2)
+            return
+
+        # the root keeps index 1, all other nodes keep their order, so
+        # no node moves to a higher index and arrays are compacted in place
+        for node in range(1, self.size):
+            if remap.data.as_uints[node] and node != root:
+                remap.data.as_uints[node] = size
+                size += 1
+        remap.data.as_uints[root] = 1
+
+        root_character = self.characters[root]
+        root_count = self.counts[root]
+        root_lo, root_eq, root_hi = self.lo[root], self.eq[root], self.hi[root]
+
+        for node in range(1, self.size):
+            child = remap.data.as_uints[node]
+            if not child or node == root:
+                continue
+            self.characters[child] = self.characters[node]
+            self.counts[child] = self.counts[node]
+            self.lo[child] = remap.data.as_uints[self.lo[node]]
+            self.eq[child] = remap.data.as_uints[self.eq[node]]
+            self.hi[child] = remap.data.as_uints[self.hi[node]]
+
+        self.characters[1] = root_character
+        self.counts[1] = root_count
+        self.lo[1] = remap.data.as_uints[root_lo]
+        self.eq[1] = remap.data.as_uints[root_eq]
+        self.hi[1] = remap.data.as_uints[root_hi]
+
+        self.size = size
+        self._resize(size)
+
+    def rebalance(self):
+        """Rebuild each sibling subtree (nodes linked by lo/hi below the
+        same node) in weighted median split order (see
+        insertion_order.median_splits). Nodes are weighted by the counts
+        of all strings passing through them, plus one.
+
+        Notes
+        -----
+        Trees filled in corpus order can degrade into long lo/hi chains.
+        Rebalancing minimizes the expected lookup depth for queries
+        distributed like the counts. Counts are unchanged.
+        The root stays at index 1.
+        """
+        cdef:
+            array.array sums, order, stack, members
+            list groups, weights
+            unsigned int node, member, parent, child, root = 0
+            Py_ssize_t top, idx
+            unsigned long long total
+
+        self._own()
+        if self.size == 1:
+            return
+
+        # sums of counts in the subtree of each node, children first
+        sums = array.array("Q", bytes(8 * self.size))
+        order = array.array("I")
+        stack = array.array("I", [1])
+        while len(stack):
+            top = len(stack) - 1
+            node = stack.data.as_uints[top]
+            array.resize_smart(stack, top)
+            order.append(node)
+            for child in (self.lo[node], self.eq[node], self.hi[node]):
+                if child:
+                    stack.append(child)
+
+        for top in range(len(order) - 1, -1, -1):
+            node = order.data.as_uints[top]
+            sums.data.as_ulonglongs[node] = (
+                self.counts[node] + sums.data.as_ulonglongs[self.lo[node]]
+                + sums.data.as_ulonglongs[self.eq[node]]
+                + sums.data.as_ulonglongs[self.hi[node]])
+
+        # parent 0 stands for the root level
+        groups = [(0, 1)]
+        while groups:
+            parent, node = groups.pop()
+
+            # members of the sibling subtree in order
+            members = array.array("I")
+            stack = array.array("I")
+            while len(stack) or node:
+                if node:
+                    stack.append(node)
+                    node = self.lo[node]
+                    continue
+                top = len(stack) - 1
+                node = stack.data.as_uints[top]
+                array.resize_smart(stack, top)
+                members.append(node)
+                node = self.hi[node]
+
+            for member in members:
+                if self.eq[member]:
+                    groups.append((member, self.eq[member]))
+
+            # most sibling subtrees are single nodes
+            if len(members) == 1:
+                continue
+
+            weights = []
+            for member in members:
+                weights.append(self.counts[member] + 1
+                               + sums.data.as_ulonglongs[self.eq[member]])
+                self.lo[member] = self.hi[member] = 0
+
+            for idx, parent_idx, side in median_splits(
+                    list(accumulate(weights))):
+                member = members.data.as_uints[idx]
+                if parent_idx < 0:
+                    root = member
+                elif side:
+                    self.hi[members.data.as_uints[parent_idx]] = member
+                else:
+                    self.lo[members.data.as_uints[parent_idx]] = member
+
+            if parent:
+                self.eq[parent] = root
+                continue
+
+            # the root of the tree has to stay at index 1, so it trades
+            # places with the node there
+            if root != 1:
+                self._swap(1, root)
+                for member in members:
+                    member = 1 if member == root else \
+                        root if member == 1 else member
+                    if self.lo[member] == 1:
+                        self.lo[member] = root
+                    if self.hi[member] == 1:
+                        self.hi[member] = root
+                for idx in range(len(groups)):
+                    if groups[idx][0] == 1:
+                        groups[idx] = (root, groups[idx][1])
+                    elif groups[idx][0] == root:
+                        groups[idx] = (1, groups[idx][1])
+
+    cpdef unsigned int frequency(self, str string):
+        """Return frequency of string.
+        Parameters
+        ----------
+        string : str
+        Returns
+        -------
+        unsigned int
+            Frequency
+        """
+        if not string:
+            return self.total
+
+        return self.counts[self._search(string)]
+
+    def conditional_probabilities(self, sequences, unsigned int n):
+        """Return probability of each token given the up to n - 1
+        tokens preceding it.
+        Parameters
+        ----------
+        sequences : iterable of list of str
+            Token sequences, joined by splitchar to form keys.
+        n : unsigned int
+            Size of n-grams.
+        Returns
+        -------
+        array.array
+            Probabilities (as doubles) of all tokens of all sequences.
+
+        Notes
+        -----
+        Probabilities are relative frequencies of n-gram and preceding
+        context. Each n-gram is found in a single search that continues
+        from the node its context ends in.
+        """
+        cdef:
+            array.array probabilities = array.array("d")
+            str splitchar = self._splitchar or ""
+            list tokens
+            Py_ssize_t idx, jdx, start
+            bint found
+            unsigned int context, frequency
+            unsigned int node
+
+        for tokens in sequences:
+            for idx in range(len(tokens)):
+                start = idx - n + 1 if idx >= n else 0
+                node = 0
+                found = True
+
+                for jdx in range(start, idx):
+                    if jdx > start:
+                        node = self._step(node, splitchar, &found)
+                    if found:
+                        node = self._step(node, tokens[jdx], &found)
+                    if not found:
+                        break
+
+                if not found:
+                    probabilities.append(0.0)
+                    continue
+
+                context = self.counts[node] if node else self.total
+
+                if idx > start:
+                    node = self._step(node, splitchar, &found)
+                if found:
+                    node = self._step(node, tokens[idx], &found)
+
+                if not found:
+                    frequency = 0
+                else:
+                    frequency = self.counts[node] if node else self.total
+
+                if frequency and context:
+                    probabilities.append(<double> frequency / context)
+                else:
+                    probabilities.append(0.0)
+
+        return probabilities
+
+    def completions(self, str prefix="", bint full=True,
+                    bint return_frequency=True):
+        """Return all completions for a given prefix.
+        Parameters
+        ----------
+        prefix : str
+            String that all results returned begin with.
+        full : bool
+            Flag for whether to return results with the prefix appended.
+        return_frequency : bool
+            If true, results will include frequency of each completion.
+        Returns
+        -------
+        Generator
+            Yield str or (str, unsigned int)-tuples (return_frequency=True)
+        """
+        cdef:
+            list completions
+            array.array frequencies
+            Py_ssize_t idx
+
+        for completions, frequencies in self.completion_chunks(prefix, full):
+            if not return_frequency:
+                yield from completions
+                continue
+
+            for idx in range(len(completions)):
+                yield completions[idx], frequencies.data.as_uints[idx]
+
+    def completion_chunks(self, str prefix="", bint full=True,
+                          Py_ssize_t chunksize=65_536):
+        """Return all completions for a given prefix in chunks.
+        Parameters
+        ----------
+        prefix : str
+            String that all results returned begin with.
+        full : bool
+            Flag for whether to return results with the prefix appended.
+        chunksize : int
+            Maximum number of completions per chunk.
+        Returns
+        -------
+        Generator
+            Yield (list of str, array.array of unsigned int)-tuples of
+            completions and their frequencies, in order.
+        """
+        cdef unsigned int start
+
+        if chunksize < 1:
+            msg = f"chunksize must be at least 1, got {chunksize}."
+            raise ValueError(msg)
+
+        if prefix:
+            start = self._search(prefix)
+            start = self.eq[start] if start else 0
+        else:
+            start = 1 if self.size > 1 else 0
+
+        if not start:
+            return
+
+        yield from self._completions(start, prefix if full else "",
+                                     chunksize)
+
+    cdef void _swap(self, unsigned int first, unsigned int second):
+        """Exchange the contents of two nodes (but not the links to them).
+        """
+        self.characters[first], self.characters[second] = \
+            self.characters[second], self.characters[first]
+        self.counts[first], self.counts[second] = \
+            self.counts[second], self.counts[first]
+        self.lo[first], self.lo[second] = self.lo[second], self.lo[first]
+        self.eq[first], self.eq[second] = self.eq[second], self.eq[first]
+        self.hi[first], self.hi[second] = self.hi[second], self.hi[first]
+
+    cdef int _resize(self, unsigned int capacity) except -1:
+        """Reallocate node arrays to hold capacity nodes.
+        """
+        cdef:
+            void* characters = realloc(self.characters,
+                                       capacity * sizeof(Py_UCS4))
+            void* counts = realloc(self.counts,
+                                   capacity * sizeof(unsigned int))
+            void* lo = realloc(self.lo, capacity * sizeof(unsigned int))
+            void* eq = realloc(self.eq, capacity * sizeof(unsigned int))
+            void* hi = realloc(self.hi, capacity * sizeof(unsigned int))
+
+        # keep whatever was successfully reallocated, so it gets freed
+        if characters:
+            self.characters = <Py_UCS4*> characters
+        if counts:
+            self.counts = <unsigned int*> counts
+        if lo:
+            self.lo = <unsigned int*> lo
+        if eq:
+            self.eq = <unsigned int*> eq
+        if hi:
+            self.hi = <unsigned int*> hi
+
+        if not (characters and counts and lo and eq and hi):
+            raise MemoryError()
+
+        self.capacity = capacity
+        return 0
+
+    cdef unsigned int _new_node(self, Py_UCS4 character) except 0:
+        """Append node to arrays and return its index.
+        """
+        cdef unsigned int node = self.size
+
+        if node == self.capacity:
+            if self.capacity == UINT_MAX:
+                raise MemoryError("Tree cannot hold more nodes.")
+            self._resize(min(<unsigned long> self.capacity * 2, UINT_MAX))
+
+        self.characters[node] = character
+        self.counts[node] = self.lo[node] = self.eq[node] = self.hi[node] = 0
+        self.size += 1
+        return node
+
+    cdef unsigned int _root(self, Py_UCS4 character) except 0:
+        """Return index of root, creating it if tree is empty.
+        """
+        if self.size == 1:
+            return self._new_node(character)
+        return 1
+
+    cdef unsigned int _insert_from(self, str string, Py_ssize_t idx,
+                                   unsigned int node,
+                                   unsigned int frequency,
+                                   bint subsequences,
+                                   bint track) except 0:
+        """Insert the rest of string, starting with string[idx] at node.
+        If track is True, the node matching each character is
+        recorded in path.
+        """
+        cdef:
+            Py_ssize_t length = len(string)
+            Py_UCS4 character
+            unsigned int child
+
+        while True:
+            character = string[idx]
+
+            if character < self.characters[node]:
+                if not self.lo[node]:
+                    child = self._new_node(character)
+                    self.lo[node] = child
+                node = self.lo[node]
+
+            elif character > self.characters[node]:
+                if not self.hi[node]:
+                    child = self._new_node(character)
+                    self.hi[node] = child
+                node = self.hi[node]
+
+            else:
+                if track:
+                    self.path[idx] = node
+
+                idx += 1
+                if idx == length:
+                    self.counts[node] += frequency
+                    return node
+
+                if (subsequences and self._has_split
+                        and string[idx] == self._split):
+                    self.counts[node] += frequency
+
+                if not self.eq[node]:
+                    child = self._new_node(string[idx])
+                    self.eq[node] = child
+                node = self.eq[node]
+
+    cdef int _insert_shared(self, str string, unsigned int frequency,
+                            bint subsequences, str previous) except -1:
+        """Insert string, reusing the nodes in path that matched the prefix
+        it shares with the previously inserted string.
+        """
+        cdef:
+            Py_ssize_t idx
+            Py_ssize_t shared = 0
+            Py_ssize_t length = len(string)
+            Py_ssize_t limit = min(length, len(previous))
+            unsigned int node
+            unsigned int child
+            void* path
+
+        if not length:
+            return 0
+
+        if length > self.path_capacity:
+            path = realloc(self.path, length * sizeof(unsigned int))
+            if not path:
+                raise MemoryError()
+            self.path = <unsigned int*> path
+            self.path_capacity = length
+
+        while shared < limit and string[shared] == previous[shared]:
+            shared += 1
+
+        if subsequences and self._has_split:
+            for idx in range(min(shared, length - 1)):
+                if string[idx + 1] == self._split:
+                    self.counts[self.path[idx]] += frequency
+
+        if shared == length:
+            self.counts[self.path[length - 1]] += frequency
+            return 0
+
+        if not shared:
+            node = self._root(string[0])
+
+        else:
+            node = self.path[shared - 1]
+            if not self.eq[node]:
+                child = self._new_node(string[shared])
+                self.eq[node] = child
+            node = self.eq[node]
+
+        self._insert_from(string, shared, node,
+                          frequency, subsequences, True)
+        return 0
+
+    cdef unsigned int _child(self, unsigned int parent,
+                             Py_UCS4 character) except 0:
+        """Return node for character among the eq-children of parent
+        (or at the root level if parent is 0), creating it if missing.
+        """
+        cdef unsigned int node, child
+
+        if not parent:
+            node = self._root(character)
+        else:
+            if not self.eq[parent]:
+                child = self._new_node(character)
+                self.eq[parent] = child
+            node = self.eq[parent]
+
+        while True:
+            if character < self.characters[node]:
+                if not self.lo[node]:
+                    child = self._new_node(character)
+                    self.lo[node] = child
+                node = self.lo[node]
+
+            elif character > self.characters[node]:
+                if not self.hi[node]:
+                    child = self._new_node(character)
+                    self.hi[node] = child
+                node = self.hi[node]
+
+            else:
+                return node
+
+    cdef unsigned int _step(self, unsigned int node, str string,
+                            bint* found):
+        """Continue a search that ended in node (0 at the start)
+        with the characters of string. Sets found to False on failure.
+        """
+        cdef:
+            Py_ssize_t idx
+            Py_UCS4 character
+
+        for idx in range(len(string)):
+            character = string[idx]
+            if node:
+                node = self.eq[node]
+            else:
+                node = 1 if self.size > 1 else 0
+
+            while node and character != self.characters[node]:
+                if character < self.characters[node]:
+                    node = self.lo[node]
+                else:
+                    node = self.hi[node]
+
+            if not node:
+                found[0] = False
+                return 0
+
+        return node
+
+    cdef unsigned int _search(self, str string):
+        """Return index of node that string ends in (0 if not found).
+        """
+        cdef:
+            Py_ssize_t idx = 0
+            Py_ssize_t length = len(string)
+            Py_UCS4 character
+            unsigned int node = 1 if self.size > 1 else 0
+
+        while node:
+            character = string[idx]
+
+            if character < self.characters[node]:
+                node = self.lo[node]
+
+            elif character > self.characters[node]:
+                node = self.hi[node]
+
+            else:
+                idx += 1
+                if idx == length:
+                    return node
+                node = self.eq[node]
+
+        return 0
+
+    def _completions(self, unsigned int start, str prefix,
+                     Py_ssize_t chunksize):
+        """Generator yielding chunks of completions below node start,
+        using an explicit stack and a reusable character buffer that
+        begins with prefix.
+        """
+        cdef:
+            # stack holds pairs of node index, shifted left by one with
+            # the lowest bit flagging that the node is to be emitted,
+            # and depth
+            Py_ssize_t capacity = 64
+            unsigned long long* stack = <unsigned long long*> malloc(
+                2 * capacity * sizeof(unsigned long long))
+            void* grown
+            Py_ssize_t top = 1
+            array.array buffer = array.array("I", [ord(character)
+                                                   for character in prefix])
+            list completions = []
+            array.array frequencies = array.clone(array.array("I"),
+                                                  chunksize, False)
+            Py_ssize_t count = 0
+            unsigned long long entry
+            unsigned long long depth
+            unsigned int node
+
+        if stack is NULL:
+            raise MemoryError()
+
+        stack[0] = <unsigned long long> start << 1
+        stack[1] = len(prefix)
+
+        try:
+            while top:
+                top -= 1
+                entry = stack[2 * top]
+                depth = stack[2 * top + 1]
+                node = <unsigned int> (entry >> 1)
+
+                if entry & 1:
+                    if depth >= <unsigned long long> len(buffer):
+                        array.resize_smart(buffer, depth + 1)
+                    buffer.data.as_uints[depth] = self.characters[node]
+
+                    if self.counts[node]:
+                        completions.append(PyUnicode_FromKindAndData(
+                            PyUnicode_4BYTE_KIND, buffer.data.as_uints,
+                            depth + 1))
+                        frequencies.data.as_uints[count] = self.counts[node]
+                        count += 1
+                        if count == chunksize:
+                            yield completions, frequencies
+                            completions = []
+                            frequencies = array.clone(frequencies,
+                                                      chunksize, False)
+                            count = 0
+                    continue
+
+                if top + 4 > capacity:
+                    grown = realloc(stack, 4 * capacity
+                                    * sizeof(unsigned long long))
+                    if grown is NULL:
+                        raise MemoryError()
+                    stack = <unsigned long long*> grown
+                    capacity *= 2
+
+                # pushed in reverse order of traversal: lo, node, eq, hi
+                if self.hi[node]:
+                    stack[2 * top] = <unsigned long long> self.hi[node] << 1
+                    stack[2 * top + 1] = depth
+                    top += 1
+                if self.eq[node]:
+                    stack[2 * top] = <unsigned long long> self.eq[node] << 1
+                    stack[2 * top + 1] = depth + 1
+                    top += 1
+                stack[2 * top] = (<unsigned long long> node << 1) | 1
+                stack[2 * top + 1] = depth
+                top += 1
+                if self.lo[node]:
+                    stack[2 * top] = <unsigned long long> self.lo[node] << 1
+                    stack[2 * top + 1] = depth
+                    top += 1
+        finally:
+            free(stack)
+
+        if count:
+            array.resize(frequencies, count)
+            yield completions, frequencies
+
+    def __contains__(self, str string):
+        """Adds 'string in TST' syntactic sugar.
+        """
+        return self.frequency(string) or False
+
+    def __iter__(self):
+        """Adds 'for string in TST' syntactic sugar.
+        """
+        return self.completions()
+
+    @property
+    def nodes(self):
+        """Number of nodes in the tree.
+        """
+        return self.size - 1
+
+    @property
+    def nbytes(self):
+        """Number of bytes allocated (or mapped) for the node arrays.
+        """
+        return self.capacity * (sizeof(Py_UCS4) + 4 * sizeof(unsigned int))
+
+    @property
+    def splitchar(self):
+        return self._splitchar
+
+
+cdef CompactTernarySearchTree _read_compact(cls, file, bint mmap):
+    """Read tree from binary file, mapping its arrays if mmap is True.
+    """
+    cdef:
+        CompactTernarySearchTree tree = cls.__new__(cls)
+        Py_ssize_t nbytes
+        char* data
+
+    size, tree.total, split_length, _ = read_header(file)
+    nbytes = size * sizeof(unsigned int)
+
+    if mmap:
+        tree.mapped_file = mmap_.mmap(file.fileno(), 0,
+                                      access=mmap_.ACCESS_READ)
+        if len(tree.mapped_file) < HEADER_SIZE + 5 * nbytes:
+            msg = f"'{file.name}' is truncated."
+            raise ValueError(msg)
+
+        PyObject_GetBuffer(tree.mapped_file, &tree.mapped_buffer,
+                           PyBUF_SIMPLE)
+        tree.mapped = True
+        data = <char*> tree.mapped_buffer.buf + HEADER_SIZE
+        tree.characters = <Py_UCS4*> data
+        tree.counts = <unsigned int*> (data + nbytes)
+        tree.lo = <unsigned int*> (data + 2 * nbytes)
+        tree.eq = <unsigned int*> (data + 3 * nbytes)
+        tree.hi = <unsigned int*> (data + 4 * nbytes)
+        tree.capacity = size
+        file.seek(HEADER_SIZE + 5 * nbytes)
+
+    else:
+        tree._resize(max(size, 2))
+        _read_into(file, <char*> tree.characters, nbytes)
+        _read_into(file, <char*> tree.counts, nbytes)
+        _read_into(file, <char*> tree.lo, nbytes)
+        _read_into(file, <char*> tree.eq, nbytes)
+        _read_into(file, <char*> tree.hi, nbytes)
+
+    tree.size = size
+    if split_length == NO_SPLITCHAR:
+        tree._set_splitchar(None)
+    else:
+        tree._set_splitchar(file.read(split_length).decode("utf-8"))
+
+    return tree
+
+
+def _from_counts(cls, counts, splitchar, bint balanced,
+                 bint subsequences):
+    """Build tree of class cls from counts, see from_counts.
+    """
+    tree = cls(splitchar)
+    strings = median_split_vocabulary(counts) if balanced else counts
+    tree.insert_many(((string, counts[string]) for string in strings),
+                     subsequences=subsequences)
+    return tree
+
+
+cpdef str _as_str(object string):
+    """Return string as plain str, which it needs to be an instance of.
+    """
+    if not isinstance(string, str):
+        msg = f"Keys need to be str, not {type(string).__name__}."
+        raise TypeError(msg)
+    return str(string)
+
+
+def _count_threshold(dict histogram, max_entries):
+    """Return lowest count to keep so that at most max_entries strings
+    are left, given the number of strings (values) per count (keys).
+    """
+    cdef unsigned long long kept = 0
+    cdef unsigned int count
+
+    for count in sorted(histogram, reverse=True):
+        kept += histogram[count]
+        if kept > max_entries:
+            return count + 1
+
+    return 0
+
+
+def _unpickle_compact(bytes data):
+    return _read_compact(CompactTernarySearchTree, io.BytesIO(data), False)
+
+
+def _unpickle_tree(bytes data):
+    return TernarySearchTree.from_compact(_unpickle_compact(data))
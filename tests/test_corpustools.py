@@ -1,18 +1,32 @@
+import bz2
 import gzip
+import io
+import lzma
+import os
+import random
 import tempfile
+import warnings
 
 from os.path import dirname, join
+from cmath import isclose
 from collections import Counter
 from itertools import chain
 
+import numpy as np
+import pytest
+
 from corpustools import add_most_frequent
+from corpustools import bandsample
 from corpustools import ContainsEverything
 from corpustools import ENGLISH
-from corpustools import extract_units, extract_fields
+from corpustools import extract_units, extract_fields, extract_field_blocks
+from corpustools.fields import extract_fields_bytes, split_blocks
 from corpustools import filter_tagged_vocabulary, filter_tagged_event_file
+from corpustools import load_vocabulary_counts
 from corpustools import merge_tokens_tags_corpus
-from corpustools import ngrams
-from corpustools import replace_disallowed
+from corpustools import ngrams, ngram_windows, ngram_keys, unpack_ngram_keys
+from corpustools import open_corpus
+from corpustools import replace_disallowed, Replacer
 from corpustools import split_collection
 
 
@@ -82,6 +96,144 @@ def test_extract_tags_tokens():
         assert all([len(tt) == 2 for tt in tags_tokens])
 
 
+def test_extract_fields_binary():
+    settings = [{"keep_meta": {}},
+                {"drop_meta": False, "drop_tags": False},
+                {"return_fields": [0, 2], "drop_meta": False},
+                {"return_fields": [1, 2], "lower": False}]
+    for kwargs in settings:
+        with open(DUMMY_CORPUS) as corpus:
+            expected = list(extract_fields(corpus, **kwargs, **DUMMY_SPECS))
+        with open(DUMMY_CORPUS, "rb") as corpus:
+            fields = list(extract_fields(corpus, **kwargs, **DUMMY_SPECS))
+        assert fields == expected
+
+
+def test_extract_fields_binary_field_indices():
+    for kwargs in ({"return_fields": -1}, {"return_fields": [0, -1]},
+                   {"return_fields": []}, {"tag_field": -1}):
+        specs = {**DUMMY_SPECS, **kwargs}
+        with open(DUMMY_CORPUS) as corpus:
+            expected = list(extract_fields(corpus, **specs))
+        with open(DUMMY_CORPUS, "rb") as corpus:
+            fields = list(extract_fields(corpus, **specs))
+        assert fields == expected
+
+    for kwargs in ({"return_fields": 7}, {"return_fields": [0, 9]},
+                   {"return_fields": -4}, {"tag_field": 8}):
+        for mode in ("r", "rb"):
+            with open(DUMMY_CORPUS, mode) as corpus:
+                with pytest.raises(IndexError):
+                    list(extract_fields(corpus, **{**DUMMY_SPECS, **kwargs}))
+
+    # the tag field is only used when tags are dropped
+    with open(DUMMY_CORPUS, "rb") as corpus:
+        assert list(extract_fields(corpus, **{**DUMMY_SPECS, "tag_field": 8},
+                                   drop_tags=False))
+
+
+def test_extract_fields_binary_crlf():
+    with open(DUMMY_CORPUS) as corpus:
+        expected = list(extract_fields(corpus, return_fields=[0, 2],
+                                       **DUMMY_SPECS))
+    with open(DUMMY_CORPUS, "rb") as corpus:
+        data = corpus.read().replace(b"\n", b"\r\n")
+    assert b"</s>\r\n" in data
+    for blocksize in (1, 4, 1024):
+        fields = extract_fields_bytes(io.BytesIO(data), return_fields=[0, 2],
+                                      blocksize=blocksize, **DUMMY_SPECS)
+        assert list(fields) == expected
+
+
+def test_extract_fields_bytes_lines_across_blocks():
+    lines = ["<doc>", "Äpfel\tNN\täpfel", "", "Haus\tNN",
+             "</S>", "ΣΟΦΟΣ\tZz\tzz", "Wald\tNN\twald"]
+    text = "\n".join(lines)
+    with warnings.catch_warnings(record=True) as expected_warnings:
+        warnings.simplefilter("always")
+        expected = list(extract_fields(io.StringIO(text),
+                                       return_fields=[0, 2], **DUMMY_SPECS))
+    for blocksize in (1, 4, 1024):
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            fields = extract_fields_bytes(io.BytesIO(text.encode("utf-8")),
+                                          return_fields=[0, 2],
+                                          blocksize=blocksize, **DUMMY_SPECS)
+            fields = list(fields)
+        assert fields == expected
+        assert [str(warning.message) for warning in caught] == \
+            [str(warning.message) for warning in expected_warnings]
+
+
+def test_extract_field_blocks():
+    for return_fields in (0, [0, 2]):
+        specs = {**DUMMY_SPECS, "return_fields": return_fields}
+        with open(DUMMY_CORPUS) as corpus:
+            expected = list(extract_fields(corpus, **specs))
+        with open(DUMMY_CORPUS) as text, open(DUMMY_CORPUS, "rb") as binary:
+            for corpus in (text, binary, DUMMY_CORPUS):
+                blocks = list(extract_field_blocks(corpus, blocksize=64,
+                                                   **specs))
+                assert all(isinstance(block, list) for block in blocks)
+                assert list(chain.from_iterable(blocks)) == expected
+
+
+def test_split_blocks():
+    collection = [1, "a", "a", 2, 3, "a", 4, 5, 6, "a"]
+    for sizes in ([10], [1, 9], [2, 2, 2, 4], [1] * 10, [0, 3, 0, 7]):
+        blocks = []
+        for size in sizes:
+            start = sum(map(len, blocks))
+            blocks.append(collection[start:start + size])
+        assert list(split_blocks(blocks, "a")) == \
+            list(split_collection(collection, "a"))
+
+
+def test_extract_fields_compressed():
+    with open(DUMMY_CORPUS) as corpus:
+        expected = list(extract_fields(corpus, **DUMMY_SPECS))
+    with open(DUMMY_CORPUS, "rb") as corpus:
+        data = corpus.read()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for extension, module in ((".gz", gzip), (".bz2", bz2),
+                                  (".xz", lzma)):
+            path = os.path.join(directory, "corpus.txt" + extension)
+            with module.open(path, "wb") as compressed:
+                compressed.write(data)
+
+            assert list(extract_fields(path, **DUMMY_SPECS)) == expected
+            for background in (True, False):
+                with open_corpus(path, "rt", background=background,
+                                 blocksize=16) as corpus:
+                    fields = extract_fields(corpus, **DUMMY_SPECS)
+                    assert list(fields) == expected
+
+
+def test_extract_fields_path_crlf():
+    with open(DUMMY_CORPUS) as corpus:
+        expected = list(extract_fields(corpus, **DUMMY_SPECS))
+    with open(DUMMY_CORPUS, "rb") as corpus:
+        data = corpus.read().replace(b"\n", b"\r\n")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for extension, opener in (("", open), (".gz", gzip.open)):
+            path = os.path.join(directory, "corpus.txt" + extension)
+            with opener(path, "wb") as corpus:
+                corpus.write(data)
+            assert list(extract_fields(path, **DUMMY_SPECS)) == expected
+
+
+def test_open_corpus_background_error():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "corpus.txt.gz")
+        with open(path, "wb") as corrupt:
+            corrupt.write(gzip.compress(b"token\tNN\n" * 100)[:-20])
+        with open_corpus(path) as corpus:
+            with pytest.raises(EOFError):
+                corpus.read()
+
+
 def test_extract_sentences():
     with open(DUMMY_CORPUS) as corpus:
         sentences = extract_units(corpus,
@@ -133,6 +285,98 @@ def test_merge_tokens_tags_corpus():
                 assert line == standard.readline()
 
 
+def test_merge_tokens_tags_corpus_parallel():
+    with tempfile.TemporaryDirectory() as directory:
+        merged_path = os.path.join(directory, "merged.txt")
+        merge_tokens_tags_corpus(DUMMY_CORPUS, merged_path,
+                                 symbols=ENGLISH,
+                                 replacement="repl",
+                                 number_of_processes=2,
+                                 **DUMMY_SPECS)
+        with open(merged_path) as test, open(DUMMY_MERGED) as standard:
+            assert test.read() == standard.read()
+        assert os.listdir(directory) == ["merged.txt"]
+
+
+def test_merge_tokens_tags_corpus_parallel_many_sentences():
+    with open(DUMMY_CORPUS) as corpus:
+        data = corpus.read() * 50
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "corpus.txt")
+        with open(path, "w") as corpus:
+            corpus.write(data)
+        for number_of_processes in (1, 3):
+            merged_path = os.path.join(directory,
+                                       f"merged_{number_of_processes}.txt")
+            merge_tokens_tags_corpus(path, merged_path,
+                                     symbols=ENGLISH,
+                                     number_of_processes=number_of_processes,
+                                     **DUMMY_SPECS)
+        with open(os.path.join(directory, "merged_1.txt")) as sequential, \
+                open(os.path.join(directory, "merged_3.txt")) as parallel:
+            sequential = sequential.read()
+            assert sequential.count("\n") == 150
+            assert parallel.read() == sequential
+
+
+def test_merge_tokens_tags_corpus_vocabulary_counts():
+    with tempfile.TemporaryDirectory() as directory:
+        merged_path = os.path.join(directory, "merged.txt")
+        counts_path = os.path.join(directory, "merged.counts")
+        for number_of_processes in (1, 2):
+            counts = merge_tokens_tags_corpus(
+                DUMMY_CORPUS, merged_path,
+                symbols=ENGLISH,
+                replacement="repl",
+                overwrite=True,
+                number_of_processes=number_of_processes,
+                vocabulary_counts_path=counts_path,
+                **DUMMY_SPECS)
+            with open(merged_path) as merged:
+                tagged = Counter(merged.read().split())
+            assert counts["tagged"] == tagged
+            assert counts["tokens"]["a"] == tagged["a|dt"] == 5
+            assert counts["tags"]["dt"] == sum(
+                frequency for token, frequency in tagged.items()
+                if token.endswith("|dt"))
+            assert load_vocabulary_counts(counts_path) == counts
+
+
+def test_merge_tokens_tags_corpus_compressed():
+    with open(DUMMY_CORPUS, "rb") as corpus:
+        data = corpus.read()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "corpus.txt.xz")
+        merged_path = os.path.join(directory, "merged.txt")
+        with lzma.open(path, "wb") as compressed:
+            compressed.write(data)
+        merge_tokens_tags_corpus(path, merged_path,
+                                 symbols=ENGLISH,
+                                 replacement="repl",
+                                 **DUMMY_SPECS)
+        with open(merged_path) as test, open(DUMMY_MERGED) as standard:
+            assert test.read() == standard.read()
+
+
+def test_merge_tokens_tags_corpus_crlf():
+    with open(DUMMY_CORPUS, "rb") as corpus:
+        data = corpus.read().replace(b"\n", b"\r\n")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "corpus.txt")
+        with open(path, "wb") as corpus:
+            corpus.write(data)
+        for number_of_processes in (1, 2):
+            merged_path = os.path.join(directory, "merged.txt")
+            merge_tokens_tags_corpus(path, merged_path,
+                                     symbols=ENGLISH,
+                                     replacement="repl",
+                                     overwrite=True,
+                                     number_of_processes=number_of_processes,
+                                     **DUMMY_SPECS)
+            with open(merged_path) as test, open(DUMMY_MERGED) as standard:
+                assert test.read() == standard.read()
+
+
 def test_replace_disallowed_tokens():
     sequence = ["the", "last", "token", "contains",
                 "a", "disallowed", "character", "test-word"]
@@ -152,6 +396,21 @@ def test_replace_disallowed_fields():
     assert ["repl", "repl"] == replaced[11]
 
 
+def test_replacer():
+    sequence = [["the", "dt"], ["test-word", "nn"], ["ünïcode", "nn"],
+                ["", "$"], ["the", "dt"]]
+    expected = [["the", "dt"], ["repl", "nn"], ["repl", "nn"],
+                ["", "repl"], ["the", "dt"]]
+    # bitmap of literal symbols, pattern for a range
+    for symbols in (ENGLISH, "a-zA-Z"):
+        replace = Replacer(symbols, "repl", cache_size=4)
+        assert replace(sequence) == expected
+        assert replace(sequence) == expected
+        assert len(replace._cache) <= 4
+        assert replace([token for token, tag in sequence]) == \
+            [token for token, tag in expected]
+
+
 def test_filter_tagged_vocabulary():
     tagged_vocabulary = {"test|nn", "test|vb", "the|dt",
                          "is|vb", "this|dt"}
@@ -239,6 +498,32 @@ def test_filter_tagged_event_file_fill_cues():
                 assert test_outcome == outcome
 
 
+def test_filter_tagged_event_file_vocabulary_counts():
+    cues = {"code", "functions", "sentence", "symbol"}
+    outcomes = {"a", "the"}
+    with tempfile.TemporaryDirectory() as directory:
+        counts_path = os.path.join(directory, "merged.counts")
+        filtered_path = os.path.join(directory, "filtered.gz")
+        merge_tokens_tags_corpus(DUMMY_CORPUS,
+                                 os.path.join(directory, "merged.txt"),
+                                 symbols=ENGLISH,
+                                 replacement="repl",
+                                 vocabulary_counts_path=counts_path,
+                                 **DUMMY_SPECS)
+        filter_tagged_event_file(DUMMY_EVENTS,
+                                 filtered_path,
+                                 cues=cues,
+                                 outcomes=outcomes,
+                                 vocabulary_counts=counts_path)
+        with gzip.open(DUMMY_EVENTS_FILTERED, "rt") as target, \
+                gzip.open(filtered_path, "rt") as test:
+            for line in target:
+                cues, *outcome = line.strip().split("\t")
+                test_cues, *test_outcome = test.readline().strip().split("\t")
+                assert set(test_cues.split("_")) == set(cues.split("_"))
+                assert test_outcome == outcome
+
+
 def test_ngrams_string():
     word = "banana"
     trigrams = ["ban", "ana", "nan", "ana"]
@@ -263,3 +548,95 @@ def test_ngrams_multiple_n():
     grams = (" ".join(gram) for gram in chain(bigrams, trigrams))
     grams = chain(sentence, grams)
     assert set(grams) == set(ngrams(sentence, [1, 2, 3], as_string=True))
+
+
+def test_ngram_windows():
+    sentence = ["this", "is", "a", "test", "is", "a"]
+    vocabulary, ids = np.unique(sentence, return_inverse=True)
+    windows = ngram_windows(ids, [1, 2, 3, 7])
+    for size in (1, 2, 3):
+        grams = [list(vocabulary[window]) for window in windows[size]]
+        assert grams == list(ngrams(sentence, size, as_string=False))
+    assert windows[7].shape == (0, 7)
+
+
+def test_ngram_keys():
+    ids = np.array([3, 0, 5, 3, 0, 5, 1])
+    keys = ngram_keys(ids, [2, 3])
+    assert len(keys[2]) == 6 and len(keys[3]) == 5
+    for size, packed in keys.items():
+        assert np.array_equal(unpack_ngram_keys(packed, size, 3),
+                              ngram_windows(ids, size)[size])
+        types, counts = np.unique(packed, return_counts=True)
+        assert counts.max() == 2
+    assert len(np.unique(keys[2])) == 4
+
+    with pytest.raises(ValueError):
+        ngram_keys(ids, 3, bits=22)
+    with pytest.raises(ValueError):
+        ngram_keys(ids, 2, bits=2)
+    assert len(ngram_keys(ids, 2, bits=4)[2]) == 6
+
+
+def test_bandsample_identical_to_loop(capsys):
+    words = [f"word{idx}" for idx in range(2_000)]
+    for seed in range(5):
+        rng = np.random.default_rng(seed)
+        frequencies = rng.zipf(1.5, len(words)).tolist()
+        population = Counter(dict(zip(words, frequencies)))
+        for sample_size in (10, 300):
+            sample = bandsample(population, sample_size, cutoff=2, seed=seed)
+            # verbose sampling accumulates word by word
+            looped = bandsample(population, sample_size, cutoff=2, seed=seed,
+                                verbose=True)
+            assert sample == looped
+            assert all(population[word] >= 2 for word in sample)
+    capsys.readouterr()
+
+
+def test_bandsample_large_counts(capsys):
+    # the total of these counts overflows int64
+    frequencies = [2 ** 62 - idx for idx in range(8)] + [2 ** 40, 7]
+    population = Counter({f"word{idx}": frequency
+                          for idx, frequency in enumerate(frequencies)})
+    for sample_size in (1, 3, 5):
+        sample = bandsample(population, sample_size, cutoff=2)
+        looped = bandsample(population, sample_size, cutoff=2, verbose=True)
+        assert sample == looped
+        assert sample == _bandsample_words(population, sample_size, 2)
+        assert 0 < len(sample) <= sample_size
+
+    # counts above 2**53 that are equal as float64
+    population = Counter({"a": 2 ** 60 + 1, "b": 2 ** 60, "c": 5,
+                          "d": 2 ** 60 + 3})
+    for seed in range(10):
+        for sample_size in (1, 2, 3):
+            sample = bandsample(population, sample_size, cutoff=1, seed=seed)
+            assert sample == _bandsample_words(population, sample_size, 1,
+                                               seed)
+    capsys.readouterr()
+
+
+def _bandsample_words(population, sample_size, cutoff, seed=2311):
+    """Band sample accumulating word by word, sorted by exact counts."""
+    population = [(word, freq) for word, freq in population.items()
+                  if freq >= cutoff]
+    random.Random(seed).shuffle(population)
+    population.sort(key=lambda x: x[1])
+
+    step = sum(freq for word, freq in population) / sample_size
+    sample_indices = set()
+    accumulator = 0.0
+
+    for idx, (word, freq) in enumerate(population):
+        accumulator += freq
+        if accumulator >= step or isclose(accumulator, step):
+            sample_indices.add(idx)
+            accumulator -= step
+            while accumulator >= step or isclose(accumulator, step):
+                idx = idx - 1
+                if idx not in sample_indices:
+                    sample_indices.add(idx)
+                    accumulator -= step
+
+    return Counter(dict(population[i] for i in sample_indices))
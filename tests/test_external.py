@@ -0,0 +1,99 @@
+import tempfile
+
+from os import listdir
+from os.path import dirname, join
+from collections import Counter
+
+import pytest
+
+from corpustools import extract_fields, split_collection
+from corpustools import external
+from corpustools.external import count_external, count_ngrams_external
+from corpustools.external import read_counts
+from corpustools.language_model import LanguageModel
+
+top = join(dirname(__file__), "data")
+
+DUMMY_CORPUS = join(top, "dummy_corpus.txt")
+DUMMY_SPECS = {"tag_field": 2,
+               "delimiter": "\t",
+               "num_fields": 3}
+
+with open(DUMMY_CORPUS) as corpus:
+    tokens = list(extract_fields(corpus, **DUMMY_SPECS))
+
+
+def test_count_external():
+    items = [f"wörd{idx * 7 % 23}#{idx % 3}" for idx in range(500)]
+    expected = sorted(Counter(items).items())
+
+    for buffer_size in (1, 4, 1_000):
+        with tempfile.TemporaryDirectory() as directory:
+            counts_path = join(directory, "counts.tsv")
+            number = count_external(iter(items), counts_path,
+                                    buffer_size=buffer_size, max_runs=2,
+                                    directory=directory)
+            counts = list(read_counts(counts_path))
+            assert listdir(directory) == ["counts.tsv"]
+
+        assert number == len(expected)
+        assert counts == expected
+
+
+def test_count_external_merges_by_level(monkeypatch):
+    items = [f"item{idx:04}" for idx in range(256)]
+    merged = []
+
+    def merge_runs(runs, path):
+        merged.append(sum(1 for run in runs for _ in read_counts(run)))
+        return merge(runs, path)
+
+    merge = external._merge_runs
+    monkeypatch.setattr(external, "_merge_runs", merge_runs)
+    with tempfile.TemporaryDirectory() as directory:
+        counts_path = join(directory, "counts.tsv")
+        assert count_external(items, counts_path, buffer_size=1,
+                              max_runs=2, directory=directory) == 256
+        assert [item for item, _ in read_counts(counts_path)] == items
+
+    # each item is rewritten once per level, log2(256) times, and
+    # once more into counts_path
+    assert sum(merged) == 9 * len(items)
+
+
+def test_count_external_invalid():
+    with tempfile.TemporaryDirectory() as directory:
+        counts_path = join(directory, "counts.tsv")
+        with pytest.raises(ValueError):
+            count_external(["a", "b\nc"], counts_path, directory=directory)
+        with pytest.raises(ValueError):
+            count_external(["a"], counts_path, max_runs=1)
+
+
+def test_count_external_empty():
+    with tempfile.TemporaryDirectory() as directory:
+        counts_path = join(directory, "counts.tsv")
+        assert count_external([], counts_path) == 0
+        assert list(read_counts(counts_path)) == []
+
+
+def test_external_counting():
+    units = list(split_collection(tokens, "</s>"))
+    lm = LanguageModel(3)
+    lm.train(tokens)
+
+    with tempfile.TemporaryDirectory() as directory:
+        counts_path = join(directory, "counts.tsv")
+        number = count_ngrams_external(units, 3, counts_path,
+                                       buffer_size=5, max_runs=3,
+                                       directory=directory)
+        counts = list(read_counts(counts_path))
+        assert listdir(directory) == ["counts.tsv"]
+
+    assert number == len(counts)
+    assert counts == sorted(counts)
+    external = LanguageModel(3)
+    external.insert_sequence(counts, subsequences=True)
+    external.rebalance()
+    assert sorted(external.completions()) == sorted(lm.completions())
+    assert external.frequency([]) == lm.frequency([])
@@ -0,0 +1,137 @@
+import pickle
+
+import pytest
+
+from corpustools.hashcounter import CountMinSketch, HashCounter
+from corpustools.tst import CompactTernarySearchTree, TernarySearchTree
+
+
+def test_insert_and_frequency():
+    counter = HashCounter("#")
+    counter.insert("my#shiny#trigram")
+    counter.insert("my#dog", 2)
+    assert counter.frequency("my") == 3
+    assert counter.frequency("my#shiny") == 1
+    assert counter.frequency("my#shiny#trigram") == 1
+    assert counter.frequency("my#dog") == 2
+    assert counter.frequency("my#d") == 0
+    assert counter.frequency("") == 3
+
+
+def test_matches_tree():
+    keys = [f"{idx % 7}#{idx % 13}#wörd{idx % 101}" for idx in range(5_000)]
+    tree = TernarySearchTree("#")
+    counter = HashCounter("#", capacity=1)
+    for key in keys:
+        tree.insert(key)
+        counter.insert(key)
+
+    assert list(counter.completions()) == list(tree.completions())
+    assert list(counter.completions("3#")) == list(tree.completions("3#"))
+    assert list(counter.completions("3#", full=False)) \
+        == list(tree.completions("3#", full=False))
+    assert all(counter.frequency(key) == tree.frequency(key) for key in keys)
+
+    sequences = [["1", "1", "wörd1"], ["2", "unknown", "5"], []]
+    assert counter.conditional_probabilities(sequences, 3) \
+        == tree.conditional_probabilities(sequences, 3)
+
+
+def test_contains_like_tree():
+    for cls in (TernarySearchTree, HashCounter, CountMinSketch):
+        counter = cls("#")
+        assert "" not in counter
+        counter.insert("my#dog", 2)
+        for key in ("", "my", "my#dog"):
+            assert key in counter
+        assert "my#d" not in counter
+
+
+class Token(str):
+    pass
+
+
+def test_insert_many_only_strings():
+    for cls in (HashCounter, CountMinSketch):
+        counter = cls("#")
+        counter.insert_many([(Token("a#b"), 2)])
+        assert counter.frequency("a#b") == 2
+        for key in (("a", "b"), 5, b"a"):
+            with pytest.raises(TypeError):
+                counter.insert_many([(key, 2)])
+        assert counter.frequency("") == 2
+
+
+def test_merge_pickle_and_trees(tmp_path):
+    counter = HashCounter("#")
+    counter.insert_many(["a#b", "a#c", "b"], [1, 2, 3])
+    other = pickle.loads(pickle.dumps(counter))
+    assert list(other.completions()) == list(counter.completions())
+
+    other += counter
+    other.merge(other)
+    assert other.frequency("a") == 12
+    assert other.frequency("") == 24
+
+    tree = counter.to_tree(CompactTernarySearchTree)
+    assert list(tree.completions()) == list(counter.completions())
+    assert tree.frequency("") == counter.frequency("")
+    counter.merge(tree)
+    assert counter.frequency("a#c") == 4
+    assert counter.frequency("") == 12
+
+    path = tmp_path / "counts.tst"
+    counter.save(path, b"metadata")
+    loaded = HashCounter.load(path)
+    assert list(loaded.completions()) == list(counter.completions())
+    assert loaded.frequency("") == counter.frequency("")
+
+
+def test_prune():
+    counter = HashCounter("#")
+    counter.insert_many(["a#b", "a#c", "b", "c#d"], [1, 2, 3, 4])
+    counter.prune(min_count=2, keys=["a#c"])
+    assert list(counter.completions()) == [("a", 3), ("b", 3), ("c", 4),
+                                           ("c#d", 4)]
+    counter.prune(max_entries=2)
+    assert list(counter.completions()) == [("c", 4), ("c#d", 4)]
+    assert counter.frequency("") == 10
+
+
+def test_count_min_sketch():
+    keys = [f"{idx % 7}#{idx % 13}#{idx % 101}" for idx in range(5_000)]
+    tree = TernarySearchTree("#")
+    sketch = CountMinSketch("#", epsilon=0.001, delta=0.01)
+    half = CountMinSketch("#", epsilon=0.001, delta=0.01)
+    for idx, key in enumerate(keys):
+        tree.insert(key)
+        sketch.insert(key)
+        if idx % 2:
+            half.insert(key)
+
+    assert sketch.table.shape == (5, 2719)
+    bound = sketch.epsilon * sketch.frequency("")
+    for key, frequency in tree.completions():
+        assert frequency <= sketch.frequency(key) <= frequency + bound
+    assert sketch.frequency("unknown") <= bound
+
+    other = pickle.loads(pickle.dumps(half))
+    other.merge(half)
+    assert other.frequency("") == sketch.frequency("")
+    assert other.frequency("1") >= tree.frequency("1")
+
+
+def test_count_min_sketch_merge_near_limit():
+    limit = 2 ** 32 - 1
+    sketch = CountMinSketch("#", epsilon=0.1, delta=0.1)
+    other = CountMinSketch("#", epsilon=0.1, delta=0.1)
+    sketch.insert("a#b", limit - 5)
+    other.insert("a#b", 10)
+    other.insert("c", 3)
+    sketch.merge(other)
+    assert sketch.frequency("a#b") == sketch.frequency("a") == limit
+    assert sketch.frequency("c") >= 3
+    assert sketch.total == limit
+
+    sketch.insert("a#b", 7)
+    assert sketch.frequency("a#b") == limit
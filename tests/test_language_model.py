@@ -1,9 +1,17 @@
+import tempfile
+
 from os.path import dirname, join
 from itertools import chain
 from collections import Counter
+from functools import partial
+
+import numpy as np
+import pytest
 
-from corpustools import extract_fields, ngrams
+from corpustools import encoding, extract_fields, ngrams
 from corpustools.language_model import LanguageModel
+from corpustools.hashcounter import CountMinSketch
+from corpustools.smoothing import Estimator, StupidBackoff
 
 top = join(dirname(__file__), "data")
 
@@ -97,3 +105,360 @@ def test_vocabulary_provided():
 
 def test_targets_provided():
     pass
+
+
+def test_insert_sequence():
+    lm = LanguageModel(3)
+    lm.insert_sequence(dummy_counts.items(), subsequences=False)
+    for n_gram_string, frequency in dummy_counts.items():
+        if n_gram_string:
+            assert lm.frequency(n_gram_string) == frequency
+
+    lm = LanguageModel(2)
+    lm.insert_sequence([(("a", "b"), 2), (("a", "c"), 1)],
+                       is_string=False, subsequences=True)
+    assert lm.frequency(["a"]) == 3
+    assert lm.frequency(["a", "c"]) == 1
+
+
+def test_compact_backend():
+    lm = LanguageModel(3)
+    lm.train(tokens)
+    compact = LanguageModel(3, backend="compact")
+    compact.train(tokens)
+    assert list(compact.all_target_probabilities(sizes=range(1, 4))) == \
+        list(lm.all_target_probabilities(sizes=range(1, 4)))
+
+
+def test_save_and_load():
+    lm = LanguageModel(3, must_contain={"this", "test"})
+    lm.train(tokens)
+    expected = list(lm.all_target_probabilities(sizes=range(1, 4)))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = join(directory, "model.bin")
+        lm.save(path)
+        for mmap in (True, False):
+            loaded = LanguageModel.load(path, mmap=mmap)
+            assert loaded.n == 3
+            assert loaded.must_contain == {"this", "test"}
+            assert list(loaded.all_target_probabilities(
+                sizes=range(1, 4))) == expected
+
+        loaded = LanguageModel.load(path, mmap=True)
+        loaded.train(tokens)
+        assert loaded.frequency(["this"]) == 2 * lm.frequency(["this"])
+
+
+def test_parallel_training():
+    lm = LanguageModel(3)
+    lm.train(tokens)
+    for backend in ("tst", "compact"):
+        parallel = LanguageModel(3, backend=backend)
+        parallel.train(tokens, number_of_processes=2, chunksize=1)
+        assert list(parallel.completions()) == list(lm.completions())
+        assert parallel.frequency([]) == lm.frequency([])
+
+
+def test_merge():
+    lm = LanguageModel(3)
+    lm.train(tokens)
+
+    half = tokens.index("</s>") + 1
+    first = LanguageModel(3)
+    first.train(tokens[:half])
+    second = LanguageModel(3, backend="compact")
+    second.train(tokens[half:])
+    first += second
+    assert list(first.completions()) == list(lm.completions())
+    assert first.frequency([]) == lm.frequency([])
+
+
+def test_probabilities_batch():
+    sentences = [["this", "is", "a", "test"],
+                 ["it", "consists", "of", "unknown", "words"],
+                 []]
+    expected = [probability for sentence in sentences
+                for probability in lm_probabilities(sentence)]
+
+    for backend in ("tst", "compact"):
+        lm = LanguageModel(3, backend=backend)
+        lm.train(tokens)
+        probabilities = lm.probabilities_batch(sentences)
+        assert list(probabilities) == expected
+
+        per_sequence = lm.probabilities_batch(sentences, per_sequence=True)
+        assert per_sequence[0] == pytest.approx(np.prod(expected[:4]))
+        assert per_sequence[1] == 0
+        assert per_sequence[2] == 1
+
+        log_probabilities = lm.probabilities_batch(sentences, log=True)
+        assert np.exp(log_probabilities) == pytest.approx(expected)
+
+
+def lm_probabilities(sentence):
+    lm = LanguageModel(3)
+    lm.train(tokens)
+    return lm.probability(sentence, predict_all=True)
+
+
+def test_frequency_cache():
+    lm = LanguageModel(3, cache_size=100)
+    lm.train(tokens)
+    uncached = LanguageModel(3)
+    uncached.train(tokens)
+    assert uncached.cache_info() is None
+
+    sentence = ["this", "is", "a", "test"]
+    for _ in range(3):
+        assert lm.probability(sentence, predict_all=True) == \
+            uncached.probability(sentence, predict_all=True)
+
+    info = lm.cache_info()
+    assert info.hits > info.misses > 0
+    assert info.currsize <= 100
+
+    frequency = lm.frequency(sentence[:2])
+    lm.insert("#".join(sentence[:2]), 5, subsequences=False)
+    assert lm.cache_info().currsize == 0
+    assert lm.frequency(sentence[:2]) == frequency + 5
+
+
+def test_smoothed_probabilities_sum_to_one():
+    vocabulary = {token for token in tokens if not token.startswith("<")}
+    for estimator in ("kneser-ney", "katz"):
+        lm = LanguageModel(3, estimator=estimator)
+        lm.train(tokens)
+        for context in ([], ["the"], ["of", "the"], ["unknown", "the"]):
+            probabilities = [lm.probability(context + [token])
+                             for token in vocabulary | {"unseen"}]
+            assert sum(probabilities) == pytest.approx(1)
+            if estimator == "kneser-ney":
+                assert all(probability > 0 for probability in probabilities)
+
+
+def test_katz_with_must_contain():
+    lm = LanguageModel(3, must_contain={"the"}, estimator="katz")
+    lm.train(tokens)
+    vocabulary = {token for token in tokens if not token.startswith("<")}
+    # contexts without any counted continuation back off
+    for token in vocabulary:
+        for other in vocabulary:
+            assert lm.probability([token, other]) >= 0
+            assert lm.probability(["of", token, other]) >= 0
+
+
+def test_stupid_backoff():
+    lm = LanguageModel(3, estimator=StupidBackoff(alpha=0.5))
+    lm.train(tokens)
+    assert lm.probability(["of", "the"]) == \
+        dummy_counts["of#the"] / dummy_counts["of"]
+    assert lm.probability(["code", "the"]) == \
+        0.5 * dummy_counts["the"] / dummy_counts[""]
+    assert lm.probability(["unseen"]) == 0
+
+
+def test_estimator_needs_probability():
+    with pytest.raises(TypeError):
+        Estimator()
+
+
+def test_estimator_refitted_after_training():
+    lm = LanguageModel(2, estimator="kneser-ney")
+    lm.train(tokens)
+    probability = lm.probability(["the", "code"])
+    lm.train(["the", "code", "</s>"])
+    assert lm.probability(["the", "code"]) > probability
+
+
+def test_evaluate():
+    lm = LanguageModel(3)
+    lm.train(tokens)
+    units = [["this", "is", "a", "test"], ["unknown", "this"]]
+    corpus = [f"{token}\tx\tx" for unit in units
+              for token in unit + ["</s>"]]
+
+    expected = [probability for unit in units
+                for probability in lm.probability(unit, predict_all=True)]
+    known = [p for unit in units for token, p
+             in zip(unit, lm.probability(unit, predict_all=True))
+             if lm.frequency([token])]
+    for number_of_processes in (1, 2):
+        results = lm.evaluate(corpus, chunksize=1,
+                              number_of_processes=number_of_processes,
+                              **DUMMY_SPECS)
+        assert results["units"] == 2
+        assert results["tokens"] == len(expected)
+        assert results["oov"] == 1
+        assert results["oov_rate"] == pytest.approx(1 / 6)
+        assert results["zero_probability"] == known.count(0)
+        assert results["log_probability"] == pytest.approx(
+            sum(np.log([p for p in known if p])))
+        assert results["perplexity"] == pytest.approx(
+            np.exp(-results["log_probability"]
+                   / (len(known) - known.count(0))))
+
+
+def test_interned_tokens():
+    lm = LanguageModel(3)
+    lm.train(tokens)
+    for backend in ("tst", "compact"):
+        interned = LanguageModel(3, backend=backend, intern_tokens=True)
+        interned.train(tokens)
+        assert sorted(interned.completions()) == sorted(lm.completions())
+        assert interned.frequency([]) == lm.frequency([])
+        assert interned.frequency("this#is") == lm.frequency("this#is")
+        assert interned.frequency(["unknown"]) == 0
+        assert sorted(interned.completions("this#")) \
+            == sorted(lm.completions("this#"))
+
+        sentences = [["this", "is", "a", "test"], ["unknown", "words"]]
+        assert list(interned.probabilities_batch(sentences)) \
+            == list(lm.probabilities_batch(sentences))
+
+
+def test_interned_tokens_may_contain_splitchar():
+    lm = LanguageModel(2, intern_tokens=True)
+    lm.train(["#", "a#b", "</s>", "a#b"])
+    assert lm.frequency(["#", "a#b"]) == 1
+    assert lm.frequency(["a#b"]) == 2
+    assert lm.probability(["#", "a#b"]) == 1
+
+
+def test_interned_tokens_merge_and_save():
+    lm = LanguageModel(3)
+    lm.train(tokens)
+
+    half = tokens.index("</s>") + 1
+    first = LanguageModel(3, intern_tokens=True)
+    first.train(tokens[half:])
+    second = LanguageModel(3, intern_tokens=True)
+    second.train(tokens[:half])
+    first += second
+    assert sorted(first.completions()) == sorted(lm.completions())
+    assert first.frequency([]) == lm.frequency([])
+
+    parallel = LanguageModel(3, intern_tokens=True)
+    parallel.train(tokens, number_of_processes=2, chunksize=1)
+    assert sorted(parallel.completions()) == sorted(lm.completions())
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = join(directory, "model.tst")
+        first.save(path)
+        for mmap in (True, False):
+            loaded = LanguageModel.load(path, mmap=mmap)
+            assert loaded.encoder.tokens == first.encoder.tokens
+            assert sorted(loaded.completions()) == sorted(lm.completions())
+
+
+def test_interned_tokens_beyond_code_points(monkeypatch):
+    # few code points, so that most of the tokens get longer codes
+    monkeypatch.setattr(encoding, "SIZE", 4)
+    monkeypatch.setattr(encoding, "INVERSE", pow(encoding.MULTIPLIER, -1, 4))
+    monkeypatch.setattr(encoding, "HIGH_SIZE", 2)
+
+    lm = LanguageModel(3)
+    lm.train(tokens)
+
+    half = tokens.index("</s>") + 1
+    interned = LanguageModel(3, intern_tokens=True)
+    interned.train(tokens[half:])
+    second = LanguageModel(3, intern_tokens=True)
+    second.train(tokens[:half])
+    interned += second
+    assert len(interned.encoder) > 4 * (2 + 4)
+    assert sorted(interned.completions()) == sorted(lm.completions())
+
+    for token in set(tokens):
+        assert sorted(interned.completions(token)) \
+            == sorted(lm.completions(token + "#"))
+
+    sentences = [tokens[:half], ["unknown", "words"]]
+    assert list(interned.probabilities_batch(sentences)) \
+        == list(lm.probabilities_batch(sentences))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = join(directory, "model.tst")
+        interned.save(path)
+        loaded = LanguageModel.load(path)
+        assert sorted(loaded.completions()) == sorted(lm.completions())
+
+
+def test_hash_backend():
+    lm = LanguageModel(3)
+    lm.train(tokens)
+    counted = LanguageModel(3, backend="hash")
+    counted.train(tokens, number_of_processes=2, chunksize=1)
+    assert list(counted.completions()) == list(lm.completions())
+    assert counted.frequency([]) == lm.frequency([])
+
+    sentences = [["this", "is", "a", "test"], ["unknown", "words"]]
+    assert list(counted.probabilities_batch(sentences)) \
+        == list(lm.probabilities_batch(sentences))
+
+    lm += counted
+    assert lm.frequency(["this"]) == 2 * counted.frequency(["this"])
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = join(directory, "model.tst")
+        counted.save(path)
+        loaded = LanguageModel.load(path, mmap=False)
+        assert loaded.backend == "hash"
+        assert list(loaded.completions()) == list(counted.completions())
+
+
+def test_prune():
+    lm = LanguageModel(3)
+    lm.train(tokens)
+    counts = dict(lm.completions())
+    for backend in ("tst", "compact", "hash"):
+        pruned = LanguageModel(3, backend=backend)
+        pruned.train(tokens)
+        pruned.prune(min_count=2)
+        assert dict(pruned.completions()) == {
+            key: count for key, count in counts.items() if count >= 2}
+
+        pruned.prune(threshold=float("inf"))
+        assert all(len(key.split("#")) < 3 for key in dict(pruned))
+
+
+def test_train_with_max_entries():
+    for number_of_processes in (1, 2):
+        lm = LanguageModel(3)
+        lm.train(tokens, number_of_processes=number_of_processes,
+                 chunksize=1, max_entries=10, prune_every=5)
+        assert 0 < len(list(lm.completions())) <= 10
+
+
+def test_sketch_backend():
+    lm = LanguageModel(3, must_contain={"is"})
+    lm.train(tokens)
+    backend = partial(CountMinSketch, epsilon=0.001, delta=0.01)
+    sketched = LanguageModel(3, must_contain={"is"}, backend=backend)
+    sketched.train(tokens, number_of_processes=2, chunksize=1)
+
+    for n_gram, frequency in lm.completions():
+        assert sketched.frequency(n_gram) >= frequency
+        assert sketched.frequency(n_gram) \
+            <= frequency + 0.001 * sketched.frequency([])
+
+    # estimators that need all n-grams cannot be fitted to a sketch
+    for estimator in ("kneser-ney", "katz"):
+        sketched = LanguageModel(3, backend=backend, estimator=estimator)
+        sketched.train(tokens)
+        with pytest.raises(TypeError):
+            sketched.probability(["the", "dog"])
+    sketched = LanguageModel(3, backend=backend, estimator="stupid-backoff")
+    sketched.train(tokens)
+    assert sketched.probability(["the", "dog"]) >= 0
+
+
+def test_train_with_rebalancing():
+    lm = LanguageModel(3)
+    lm.train(tokens)
+    for backend in ("tst", "compact", "hash"):
+        for number_of_processes in (1, 2):
+            rebalanced = LanguageModel(3, backend=backend)
+            rebalanced.train(tokens, number_of_processes=number_of_processes,
+                             chunksize=1, rebalance_every=3)
+            assert list(rebalanced.completions()) == list(lm.completions())
@@ -0,0 +1,245 @@
+import pickle
+
+from collections import Counter
+
+import pytest
+
+from corpustools.tst import CompactTernarySearchTree, TernarySearchTree
+from corpustools.tst import read_metadata
+
+
+def test_insert_and_frequency():
+    tst = TernarySearchTree("#")
+    tst.insert("my#shiny#trigram")
+    tst.insert("my#dog", 2)
+    assert tst.frequency("my") == 3
+    assert tst.frequency("my#shiny") == 1
+    assert tst.frequency("my#shiny#trigram") == 1
+    assert tst.frequency("my#dog") == 2
+    assert tst.frequency("my#d") == 0
+    assert tst.frequency("") == 3
+
+
+def test_contains():
+    for cls in (TernarySearchTree, CompactTernarySearchTree):
+        tst = cls("#")
+        assert "" not in tst
+        tst.insert("my#dog", 2)
+        for key in ("", "my", "my#dog"):
+            assert key in tst
+        assert "my#d" not in tst
+
+
+def test_insert_without_subsequences():
+    tst = TernarySearchTree("#")
+    tst.insert("my#shiny#trigram", subsequences=False)
+    assert tst.frequency("my") == 0
+    assert tst.frequency("my#shiny#trigram") == 1
+
+
+def test_long_keys_do_not_recurse():
+    tst = TernarySearchTree("#")
+    key = "#".join(["token"] * 20_000)
+    tst.insert(key)
+    assert tst.frequency(key) == 1
+    assert key in tst
+
+
+def test_completions_sorted():
+    tst = TernarySearchTree("#")
+    strings = ["b#c", "a", "b#a", "c", "ab"]
+    for string in strings:
+        tst.insert(string, subsequences=False)
+    assert [key for key, _ in tst] == sorted(strings)
+    assert list(tst.completions("b#", return_frequency=False)) == \
+        ["b#a", "b#c"]
+
+
+def test_insert_many_matches_insert():
+    strings = ["my#shiny#trigram", "my#shiny", "my#dog", "a#b", "my#shiny"]
+    single = TernarySearchTree("#")
+    for string in strings:
+        single.insert(string, 2)
+
+    for items in (sorted(strings), strings):
+        bulk = TernarySearchTree("#")
+        bulk.insert_many(items, [2] * len(items))
+        assert list(bulk) == list(single)
+        assert bulk.frequency("") == single.frequency("")
+
+
+def test_insert_many_pairs():
+    tst = TernarySearchTree("#")
+    tst.insert_many([("a#b", 3), ("a", 1), ("a#c", 2)], subsequences=False)
+    assert list(tst) == [("a", 1), ("a#b", 3), ("a#c", 2)]
+
+
+class Token(str):
+    pass
+
+
+def test_insert_many_only_strings():
+    for cls in (TernarySearchTree, CompactTernarySearchTree):
+        tst = cls("#")
+        tst.insert_many([(Token("a#b"), 2)])
+        assert list(tst) == [("a", 2), ("a#b", 2)]
+        for key in (("a", "b"), 5, b"a"):
+            with pytest.raises(TypeError):
+                tst.insert_many([(key, 2)])
+        assert tst.frequency("") == 2
+
+
+def test_compact_tree_matches_node_tree():
+    strings = ["my#shiny#trigram", "my#dog", "a#b", "my#shiny", "zebra"]
+    tst = TernarySearchTree("#")
+    compact = CompactTernarySearchTree("#", capacity=2)
+    for string in strings:
+        tst.insert(string, 2)
+        compact.insert(string, 2)
+
+    assert list(compact) == list(tst)
+    assert list(compact.completions("my#", full=False)) == \
+        list(tst.completions("my#", full=False))
+    for string in strings + ["my", "my#", "m", ""]:
+        assert compact.frequency(string) == tst.frequency(string)
+
+
+def test_compact_tree_insert_many():
+    compact = CompactTernarySearchTree("#")
+    compact.insert_many(["a#b", "a#b", "a#c", "b"], [1, 2, 3, 4])
+    assert list(compact) == [("a", 6), ("a#b", 3), ("a#c", 3), ("b", 4)]
+    assert compact.nodes == 5
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / "tree.bin")
+    tst = TernarySearchTree("#")
+    for string in ["my#shiny#trigram", "my#dog", "a#b", "my#shiny"]:
+        tst.insert(string)
+    tst.save(path, metadata=b"meta")
+
+    assert read_metadata(path) == b"meta"
+    for tree in (TernarySearchTree.load(path),
+                 CompactTernarySearchTree.load(path, mmap=False),
+                 CompactTernarySearchTree.load(path, mmap=True)):
+        assert tree.splitchar == "#"
+        assert tree.frequency("") == tst.frequency("")
+        assert list(tree) == list(tst)
+
+    mapped = CompactTernarySearchTree.load(path, mmap=True)
+    mapped.insert("my#cat")
+    assert mapped.frequency("my") == 4
+
+
+def test_merge_and_pickle():
+    first = TernarySearchTree("#")
+    second = CompactTernarySearchTree("#")
+    combined = TernarySearchTree("#")
+    for idx, string in enumerate(["my#dog", "a#b", "my#dog#barks", "c"]):
+        tree = first if idx % 2 else second
+        tree.insert(string)
+        combined.insert(string)
+
+    for tree, other in ((first, second), (second, first)):
+        merged = pickle.loads(pickle.dumps(tree))
+        merged.merge(other)
+        assert type(merged) is type(tree)
+        assert list(merged) == list(combined)
+        assert merged.frequency("") == combined.frequency("")
+
+
+def test_merge_with_itself():
+    for tree in (TernarySearchTree("#"), CompactTernarySearchTree("#")):
+        tree.insert("a#b")
+        tree.insert("c", 2)
+        tree += tree
+        assert list(tree) == [("a", 2), ("a#b", 2), ("c", 4)]
+        assert tree.frequency("") == 6
+
+
+def test_translate():
+    for cls in (TernarySearchTree, CompactTernarySearchTree):
+        tst = cls("#")
+        tst.insert("ab#c", 2)
+        translated = tst.translate(str.maketrans("abc", "xyz"))
+        assert sorted(translated.completions()) == [("xy", 2), ("xy#z", 2)]
+        assert translated.frequency("") == tst.frequency("")
+
+
+def test_prune():
+    keys = [f"{idx % 3}#{idx % 5}#{idx % 7}" for idx in range(200)]
+    for cls in (TernarySearchTree, CompactTernarySearchTree):
+        tst = cls("#")
+        tst.insert_many(keys, [1] * len(keys))
+        counts = dict(tst.completions())
+
+        tst.prune(min_count=3, keys=["1#1"])
+        assert dict(tst.completions()) == {
+            key: count for key, count in counts.items()
+            if count >= 3 and not key.startswith("1#1")}
+        assert tst.frequency("") == 200
+
+        tst.prune(max_entries=3)
+        assert dict(tst.completions()) == {"0": 67, "1": 67, "2": 66}
+        tst.insert("3#1")
+        assert tst.frequency("3") == 1
+        tst.prune(min_count=100)
+        assert list(tst.completions()) == []
+
+
+def test_completion_chunks():
+    keys = [f"{idx % 3}#{idx % 5}#{idx}" for idx in range(1_000)]
+    # keys and their subsequences, counted independently of the trees
+    expected = Counter(key.rsplit("#", drop)[0]
+                       for key in keys for drop in range(3))
+    for cls in (TernarySearchTree, CompactTernarySearchTree):
+        tst = cls("#")
+        tst.insert_many(keys, [1] * len(keys))
+        for prefix, full in (("", True), ("1#", True), ("1#", False)):
+            reference = sorted(
+                (key if full else key[len(prefix):], frequency)
+                for key, frequency in expected.items()
+                if key.startswith(prefix) and key != prefix)
+            for chunksize in (1, 7, 65_536):
+                chunks = list(tst.completion_chunks(prefix, full,
+                                                    chunksize=chunksize))
+                assert all(len(chunk) <= chunksize for chunk, _ in chunks)
+                flat = [(completion, frequency)
+                        for completions, frequencies in chunks
+                        for completion, frequency
+                        in zip(completions, frequencies)]
+                assert flat == reference
+            assert list(tst.completions(prefix, full)) == reference
+        assert list(tst.completion_chunks("9")) == []
+        for chunksize in (0, -1):
+            with pytest.raises(ValueError):
+                list(tst.completion_chunks(chunksize=chunksize))
+
+
+def test_from_counts():
+    counts = Counter({"my#shiny#trigram": 3, "my#dog": 2, "a": 7, "b": 1})
+    for cls in (TernarySearchTree, CompactTernarySearchTree):
+        for balanced in (True, False):
+            tst = cls.from_counts(counts, "#", balanced=balanced,
+                                  subsequences=True)
+            assert tst.frequency("my") == 5
+            assert tst.frequency("a") == 7
+            assert tst.frequency("") == 13
+            assert sorted(tst.completions()) == sorted(
+                list(cls.from_counts(counts, "#").completions())
+                + [("my", 5), ("my#shiny", 3)])
+
+
+def test_rebalance():
+    keys = sorted(f"{idx % 31}#{idx % 17}#{idx}" for idx in range(2_000))
+    for cls in (TernarySearchTree, CompactTernarySearchTree):
+        tst = cls("#")
+        tst.insert_many(keys, range(1, len(keys) + 1))
+        completions = list(tst.completions())
+        tst.rebalance()
+        assert list(tst.completions()) == completions
+        assert all(tst.frequency(key) == frequency
+                   for key, frequency in completions)
+        assert tst.frequency("") == sum(range(1, len(keys) + 1))
+        tst.insert("0#0#0")
+        assert tst.frequency("0") == completions[0][1] + 1